@@ -11,6 +11,13 @@ import json
 import argparse
 from pathlib import Path
 
+SCRIPT_DIR = Path(__file__).resolve().parent
+# embedding_cache ships with the MCP server; install-skills.sh copies it next to these scripts
+if not (SCRIPT_DIR / "embedding_cache.py").exists():
+    sys.path.insert(0, str(SCRIPT_DIR.parents[2] / "context-graph-mcp"))
+
+from embedding_cache import EmbeddingCache, cache_key, cache_path
+
 # ─────────────────────────────────────────────────────────────────
 # Config
 # ─────────────────────────────────────────────────────────────────
@@ -41,12 +48,18 @@ def get_voyage_key():
 
     return None
 
-def get_query_embedding(text: str, api_key: str) -> list:
-    """Get embedding for query text."""
+def get_query_embedding(text: str, api_key: str, cache: EmbeddingCache) -> list:
+    """Get embedding for query text from the shared cache, or Voyage AI on a miss."""
+    key = cache_key(EMBEDDING_MODEL, "query", text)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
         import voyageai
         vo = voyageai.Client(api_key=api_key)
         result = vo.embed([text], model=EMBEDDING_MODEL, input_type="query")
+        cache.put(key, result.embeddings[0], model=EMBEDDING_MODEL, input_type="query")
         return result.embeddings[0]
     except ImportError:
         print("Error: voyageai package not installed")
@@ -87,7 +100,11 @@ def query_traces(
 
     # Get query embedding
     print(f"Searching for: {query}")
-    query_embedding = get_query_embedding(query, api_key)
+    cache = EmbeddingCache(cache_path(project_dir))
+    try:
+        query_embedding = get_query_embedding(query, api_key, cache)
+    finally:
+        cache.close()
 
     # Get ChromaDB collection
     collection = get_chroma_client(project_dir)
@@ -13,6 +13,13 @@ from datetime import datetime
 from pathlib import Path
 import hashlib
 
+SCRIPT_DIR = Path(__file__).resolve().parent
+# embedding_cache ships with the MCP server; install-skills.sh copies it next to these scripts
+if not (SCRIPT_DIR / "embedding_cache.py").exists():
+    sys.path.insert(0, str(SCRIPT_DIR.parents[2] / "context-graph-mcp"))
+
+from embedding_cache import EmbeddingCache, cache_key, cache_path
+
 # ─────────────────────────────────────────────────────────────────
 # Config
 # ─────────────────────────────────────────────────────────────────
@@ -46,12 +53,19 @@ def get_voyage_key():
 
     return None
 
-def get_embedding(text: str, api_key: str) -> list:
-    """Get embedding from Voyage AI."""
+def get_embedding(text: str, api_key: str, cache: EmbeddingCache) -> list:
+    """Get embedding from the shared cache, or from Voyage AI on a miss."""
+    key = cache_key(EMBEDDING_MODEL, "document", text)
+    cached = cache.get(key)
+    if cached is not None:
+        print("  (embedding served from cache)")
+        return cached
+
     try:
         import voyageai
         vo = voyageai.Client(api_key=api_key)
         result = vo.embed([text], model=EMBEDDING_MODEL, input_type="document")
+        cache.put(key, result.embeddings[0], model=EMBEDDING_MODEL, input_type="document")
         return result.embeddings[0]
     except ImportError:
         print("Error: voyageai package not installed")
@@ -118,7 +132,11 @@ def store_trace(
 
     # Get embedding
     print(f"Getting embedding for: {decision[:50]}...")
-    embedding = get_embedding(decision, api_key)
+    cache = EmbeddingCache(cache_path(project_dir))
+    try:
+        embedding = get_embedding(decision, api_key, cache)
+    finally:
+        cache.close()
 
     # Get ChromaDB collection
     collection = get_chroma_client(project_dir)
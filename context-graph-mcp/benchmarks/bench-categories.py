@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Compare full-scan category counting with the materialized aggregate.
+
+Builds a synthetic store (local embedding provider, no network), then
+times the old approach - collection.get() of every metadata row counted
+in Python - against context_list_categories, which reads the aggregate
+table kept in the sidecar index.
+
+Usage:
+    python bench-categories.py [--traces 100000] [--runs 5] [--project-dir DIR]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+DIM = 16
+os.environ["CONTEXT_GRAPH_EMBEDDING_PROVIDER"] = "local"
+os.environ["CONTEXT_GRAPH_LOCAL_EMBEDDING_DIM"] = str(DIM)
+
+import server
+
+CATEGORIES = ["framework", "architecture", "api", "error", "testing", "deployment"]
+OUTCOMES = ["pending", "success", "failure"]
+
+
+def populate(project_dir: str, count: int) -> None:
+    collection = server.get_chroma_client(project_dir)
+    existing = collection.count()
+    rng = random.Random(11)
+    batch = 5000
+    for start in range(existing, count, batch):
+        ids = [f"trace_{i:012d}" for i in range(start, min(start + batch, count))]
+        collection.add(
+            ids=ids,
+            embeddings=[[rng.uniform(-1, 1) for _ in range(DIM)] for _ in ids],
+            documents=[f"Synthetic decision {trace_id}" for trace_id in ids],
+            metadatas=[{
+                "trace_id": trace_id,
+                "timestamp": f"2025-01-01T00:00:00.{i:06d}",
+                "category": rng.choice(CATEGORIES),
+                "outcome": rng.choice(OUTCOMES),
+                "feature_id": "",
+                "state": "",
+                "project_dir": project_dir,
+                "session_id": ""
+            } for i, trace_id in enumerate(ids, start)]
+        )
+        print(f"  {min(start + batch, count)}/{count}", end="\r", flush=True)
+    print()
+
+
+def full_scan(project_dir: str, page_size: int = 5000) -> dict:
+    """The pre-aggregate implementation of context_list_categories.
+
+    The original read every metadata row in one collection.get(); at 100k
+    traces Chroma rejects that ("too many SQL variables"), so the scan is
+    paged here to give the baseline a number at all.
+    """
+    collection = server.get_chroma_client(project_dir)
+    categories: dict = {}
+    for offset in range(0, collection.count(), page_size):
+        results = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        for metadata in results["metadatas"]:
+            cat = metadata.get("category", "general")
+            outcome = metadata.get("outcome", "pending")
+            categories.setdefault(cat, {})
+            categories[cat][outcome] = categories[cat].get(outcome, 0) + 1
+    return categories
+
+
+def timed(fn, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main(args) -> None:
+    owned = args.project_dir is None
+    project_dir = args.project_dir or tempfile.mkdtemp(prefix="bench-categories-")
+
+    print(f"Populating {args.traces} traces in {project_dir}...")
+    start = time.perf_counter()
+    populate(project_dir, args.traces)
+    print(f"  populated in {time.perf_counter() - start:.1f}s")
+
+    # First call builds the sidecar index from Chroma
+    start = time.perf_counter()
+    asyncio.run(server.context_list_categories(project_dir=project_dir))
+    print(f"  index build {time.perf_counter() - start:.1f}s (one-off)")
+
+    scan = timed(lambda: full_scan(project_dir), args.runs)
+    aggregate = timed(lambda: asyncio.run(server.context_list_categories(project_dir=project_dir)), args.runs)
+
+    print("=" * 60)
+    print(f"context_list_categories at {args.traces} traces ({args.runs} runs)")
+    print("=" * 60)
+    print(f"full scan  median={statistics.median(scan):10.2f}ms")
+    print(f"aggregate  median={statistics.median(aggregate):10.2f}ms")
+    print(f"\nSpeedup: {statistics.median(scan) / statistics.median(aggregate):.0f}x")
+
+    if owned:
+        print(f"(store left at {project_dir}; pass --project-dir to reuse it)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark category counting")
+    parser.add_argument("--traces", "-n", type=int, default=100000, help="Traces in the store")
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per approach")
+    parser.add_argument("--project-dir", "-p", default=None, help="Reuse or create a store here")
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Measure embedding throughput with and without request coalescing.
+
+Fires many concurrent get_embedding() calls at a local mock Voyage
+endpoint and reports wall time, throughput and the number of HTTP
+requests made, plus the latency of a single isolated call. The
+embedding cache is disabled so every call needs a vector.
+
+Usage:
+    python bench-embedding-batcher.py [--concurrency 200] [--latency-ms 20]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mock_voyage import MockVoyageServer
+import server
+
+MOCK_PROVIDER = server.VoyageProvider(api_key="mock")
+
+
+async def burst(n: int, round_id: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        server.get_embedding(f"concurrent decision {round_id}-{i}", MOCK_PROVIDER)
+        for i in range(n)
+    ))
+    return time.perf_counter() - start
+
+
+async def isolated(samples: int) -> list:
+    timings = []
+    for i in range(samples):
+        start = time.perf_counter()
+        await server.get_embedding(f"isolated decision {i}", MOCK_PROVIDER)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def run_mode(mock: MockVoyageServer, batching: bool, args, round_id: int) -> dict:
+    server.EMBEDDING_BATCHING_ENABLED = batching
+    before = mock.requests
+    elapsed = await burst(args.concurrency, round_id)
+    requests = mock.requests - before
+    single = await isolated(args.samples) if not args.skip_isolated else []
+    return {
+        "elapsed": elapsed,
+        "throughput": args.concurrency / elapsed,
+        "requests": requests,
+        "isolated_p50": statistics.median(single) if single else None,
+    }
+
+
+async def main(args) -> None:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    server.EMBEDDING_CACHE_ENABLED = False
+
+    with MockVoyageServer(latency_ms=args.latency_ms) as mock:
+        server.VOYAGE_API_URL = mock.url
+        await server.get_embedding("warmup", MOCK_PROVIDER)
+
+        direct = await run_mode(mock, False, args, 0)
+        batched = await run_mode(mock, True, args, 1)
+        await server.close_http_client()
+
+    print("=" * 64)
+    print(f"{args.concurrency} concurrent embedding calls "
+          f"(mock latency {args.latency_ms}ms, window {server.EMBEDDING_BATCH_WINDOW_MS}ms)")
+    print("=" * 64)
+    for name, r in (("direct", direct), ("batched", batched)):
+        line = (f"{name:<8} wall={r['elapsed'] * 1000:8.1f}ms  "
+                f"throughput={r['throughput']:8.1f}/s  http_requests={r['requests']}")
+        if r["isolated_p50"] is not None:
+            line += f"  isolated_p50={r['isolated_p50']:.2f}ms"
+        print(line)
+    print(f"\nSpeedup: {batched['throughput'] / direct['throughput']:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedding micro-batching")
+    parser.add_argument("--concurrency", "-c", type=int, default=200, help="Concurrent calls per burst")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mock server latency")
+    parser.add_argument("--samples", type=int, default=20, help="Isolated-call samples")
+    parser.add_argument("--skip-isolated", action="store_true", help="Skip isolated-call latency")
+    asyncio.run(main(parser.parse_args()))
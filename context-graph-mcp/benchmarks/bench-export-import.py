@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Throughput of NDJSON export and import.
+
+Builds a store of synthetic traces, exports it with and without
+embeddings, and imports each file into an empty store, reporting wall
+time, traces per second and file size. The import with embeddings reuses
+the stored vectors; the text-only import re-embeds every trace with the
+local provider, which costs far less than a real API does, so the
+re-embedding row is a lower bound (with Voyage it is bounded by API
+throughput at 128 texts per request).
+
+Usage:
+    python bench-export-import.py [--traces 100000] [--dim 1024]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+
+async def build_store(server, project_dir: str, args) -> None:
+    rng = np.random.default_rng(3)
+    collection = await server.get_collection(project_dir)
+    for offset in range(0, args.traces, 1000):
+        n = min(1000, args.traces - offset)
+        vectors = rng.standard_normal((n, args.dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [f"trace_{i:012x}" for i in range(offset, offset + n)]
+        documents = [f"Decision {i}: chose option {i % 97} for component {i % 13}" for i in range(offset, offset + n)]
+        metadatas = [
+            {**server.new_trace(doc, f"cat{i % 8}", "pending", None, project_dir), "trace_id": trace_id}
+            for i, (trace_id, doc) in enumerate(zip(ids, documents))
+        ]
+        await server.add_traces(collection, ids, vectors.tolist(), documents, metadatas, project_dir)
+        print(f"  built {offset + n}/{args.traces}", end="\r", flush=True)
+    print()
+
+
+async def main(args) -> None:
+    os.environ["CONTEXT_GRAPH_EMBEDDING_PROVIDER"] = "local"
+    os.environ["CONTEXT_GRAPH_LOCAL_EMBEDDING_DIM"] = str(args.dim)
+    import server
+
+    work = Path(tempfile.mkdtemp(prefix="bench-export-"))
+    try:
+        source = str(work / "source")
+        await build_store(server, source, args)
+
+        rows = []
+        for label, include_embeddings in (("with embeddings", True), ("text only", False)):
+            path = work / f"export-{include_embeddings}.ndjson"
+            start = time.perf_counter()
+            with open(path, "w", encoding="utf-8") as out:
+                await server.export_traces(out, source, include_embeddings)
+            export_s = time.perf_counter() - start
+
+            target = str(work / f"target-{include_embeddings}")
+            start = time.perf_counter()
+            with open(path, encoding="utf-8") as lines:
+                result = await server.import_traces(lines, target)
+            import_s = time.perf_counter() - start
+            assert result["imported"] == args.traces, result
+            rows.append((label, path.stat().st_size, export_s, import_s))
+
+        print("=" * 72)
+        print(f"{args.traces} traces, {args.dim}-dim")
+        print("=" * 72)
+        print(f"{'export':<16} {'file MB':>8} {'export s':>9} {'traces/s':>9} {'import s':>9} {'traces/s':>9}")
+        for label, size, export_s, import_s in rows:
+            print(f"{label:<16} {size / 1e6:8.1f} {export_s:9.1f} {args.traces / export_s:9.0f} "
+                  f"{import_s:9.1f} {args.traces / import_s:9.0f}")
+    finally:
+        server.close_chroma_stores()
+        server.close_trace_indexes()
+        server.close_embedding_caches()
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark NDJSON export/import")
+    parser.add_argument("--traces", "-n", type=int, default=100000, help="Traces in the source store")
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension")
+    asyncio.run(main(parser.parse_args()))
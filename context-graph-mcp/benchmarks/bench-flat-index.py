@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Exact flat-index search against HNSW, through the server's search path.
+
+Stores the same clustered, unit-length synthetic vectors once per index
+backend (context_graph.index.backend "hnsw" and "flat") and runs the same
+queries through vector_search, unfiltered and filtered to one category,
+reporting recall@k against exact numpy search and p50/p99 latency. Query
+embedding is not included; both backends receive the same vector.
+
+Usage:
+    python bench-flat-index.py [--sizes 10000,50000] [--dim 1024]
+                               [--categories 10] [--queries 200] [-k 10]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+
+def synthetic(n: int, centers: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    dim = centers.shape[1]
+    points = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def exact_top_k(data: np.ndarray, query: np.ndarray, k: int, rows: np.ndarray) -> set:
+    scores = data[rows] @ query
+    return set(rows[np.argsort(-scores)[:k]].tolist())
+
+
+async def run_backend(server, backend, data, labels, queries, args) -> dict:
+    project_dir = tempfile.mkdtemp(prefix="bench-flat-")
+    config_dir = Path(project_dir) / ".claude" / "config"
+    config_dir.mkdir(parents=True)
+    (config_dir / "project.json").write_text(json.dumps({"context_graph": {"index": {"backend": backend}}}))
+
+    try:
+        collection = await server.get_collection(project_dir)
+        for offset in range(0, len(data), 1000):
+            chunk = data[offset:offset + 1000]
+            ids = [str(i) for i in range(offset, offset + len(chunk))]
+            await server.add_traces(
+                collection, ids, chunk.tolist(), [""] * len(ids),
+                [{"category": f"c{labels[int(i)]}", "outcome": "pending"} for i in ids], project_dir
+            )
+        await server.vector_search(collection, queries[0].tolist(), args.k, None, project_dir)  # warm
+
+        result = {}
+        everything = np.arange(len(data))
+        for name, category in (("all", None), ("category", 0)):
+            rows = everything if category is None else np.flatnonzero(labels == category)
+            where = {"category": f"c{category}"} if category is not None else None
+            hits, timings = 0, []
+            for query in queries:
+                expected = exact_top_k(data, query, args.k, rows)
+                start = time.perf_counter()
+                found = await server.vector_search(collection, query.tolist(), args.k, where, project_dir)
+                timings.append((time.perf_counter() - start) * 1000)
+                hits += len(expected & {int(hit["id"]) for hit in found})
+            result[name] = {
+                "recall": hits / (args.k * len(queries)),
+                "p50": statistics.median(timings),
+                "p99": percentile(timings, 99),
+            }
+        return result
+    finally:
+        server.close_chroma_stores()
+        server.close_trace_indexes()
+        server.close_flat_indexes()
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+
+async def main(args) -> None:
+    os.environ["CONTEXT_GRAPH_EMBEDDING_PROVIDER"] = "local"
+    os.environ["CONTEXT_GRAPH_LOCAL_EMBEDDING_DIM"] = str(args.dim)
+    import server
+
+    rng = np.random.default_rng(11)
+    print("=" * 78)
+    print(f"Flat (exact) vs HNSW vector search, dim {args.dim}, k={args.k}, {args.queries} queries, "
+          f"filter = 1 of {args.categories} categories")
+    print("=" * 78)
+    print(f"{'traces':>8} {'backend':<6} {'filter':<9} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for n in args.sizes:
+        centers = rng.standard_normal((200, args.dim)).astype(np.float32)
+        data = synthetic(n, centers, rng)
+        labels = rng.integers(0, args.categories, n)
+        queries = synthetic(args.queries, centers, rng)
+        for backend in ("hnsw", "flat"):
+            result = await run_backend(server, backend, data, labels, queries, args)
+            for name, row in result.items():
+                print(f"{n:>8} {backend:<6} {name:<9} {row['recall']:7.3f} {row['p50']:8.2f} {row['p99']:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the flat index against HNSW")
+    parser.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[10000, 50000],
+                        help="Comma-separated store sizes")
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension")
+    parser.add_argument("--categories", type=int, default=10, help="Distinct categories (filter selectivity)")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per size")
+    parser.add_argument("-k", type=int, default=10, help="Neighbours per query")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Recall and latency of the HNSW vector index against exact search.
+
+Builds a ChromaDB collection of clustered, unit-length synthetic vectors
+at each size, runs the same queries through HNSW and through exact
+(brute-force numpy) search, and reports recall@k plus p50/p99 query
+latency for each ef_search value. The index settings mirror the
+context_graph.index project config (metric, M, ef_construction,
+ef_search).
+
+Usage:
+    python bench-hnsw.py [--sizes 10000,100000,1000000] [--dim 128]
+                         [--metric cosine] [--m 16] [--ef-construction 100]
+                         [--ef-search 10,50,100,200] [--queries 200] [-k 10]
+
+The default dim is smaller than voyage-3's 1024 so that 1M vectors fit
+in memory; pass --dim 1024 for full-size vectors on smaller sizes.
+"""
+
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+
+def synthetic(n: int, centers: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    dim = centers.shape[1]
+    points = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray, k: int) -> tuple:
+    """Brute-force nearest neighbours by cosine similarity, with per-query latency."""
+    neighbours, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        scores = data @ query
+        top = np.argpartition(-scores, k)[:k]
+        neighbours.append(set(top[np.argsort(-scores[top])].tolist()))
+        timings.append((time.perf_counter() - start) * 1000)
+    return neighbours, timings
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run_size(n: int, args, rng: np.random.Generator) -> None:
+    # Queries come from the same topic clusters as the stored traces
+    centers = rng.standard_normal((200, args.dim)).astype(np.float32)
+    data = synthetic(n, centers, rng)
+    queries = synthetic(args.queries, centers, rng)
+    truth, exact_ms = exact_top_k(data, queries, args.k)
+
+    path = tempfile.mkdtemp(prefix="bench-hnsw-")
+    client = chromadb.PersistentClient(path=path)
+    try:
+        collection = client.create_collection(
+            name="traces",
+            configuration={"hnsw": {
+                "space": args.metric,
+                "max_neighbors": args.m,
+                "ef_construction": args.ef_construction,
+                "ef_search": args.ef_search[0]
+            }}
+        )
+
+        start = time.perf_counter()
+        batch = min(5000, client.get_max_batch_size())
+        for offset in range(0, n, batch):
+            chunk = data[offset:offset + batch]
+            collection.add(ids=[str(i) for i in range(offset, offset + len(chunk))], embeddings=chunk)
+            print(f"  indexed {offset + len(chunk)}/{n}", end="\r", flush=True)
+        build_s = time.perf_counter() - start
+
+        print(f"\n{n} vectors, dim {args.dim}, {args.metric}, M={args.m}, "
+              f"ef_construction={args.ef_construction} (build {build_s:.1f}s)")
+        print(f"  {'exact (numpy)':<18} recall@{args.k}=1.000  "
+              f"p50={statistics.median(exact_ms):7.2f}ms  p99={percentile(exact_ms, 99):7.2f}ms")
+
+        for ef in args.ef_search:
+            # The loaded index keeps its ef_search; reopen the store to pick up the change
+            collection.modify(configuration={"hnsw": {"ef_search": ef}})
+            client.close()
+            client = chromadb.PersistentClient(path=path)
+            collection = client.get_collection("traces")
+            collection.query(query_embeddings=[queries[0]], n_results=args.k)  # warm the index
+
+            hits, timings = 0, []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                result = collection.query(query_embeddings=[query], n_results=args.k, include=[])
+                timings.append((time.perf_counter() - start) * 1000)
+                hits += len(expected & {int(i) for i in result["ids"][0]})
+
+            print(f"  {'hnsw ef_search=' + str(ef):<18} recall@{args.k}={hits / (args.k * len(queries)):.3f}  "
+                  f"p50={statistics.median(timings):7.2f}ms  p99={percentile(timings, 99):7.2f}ms")
+    finally:
+        client.close()
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main(args) -> None:
+    rng = np.random.default_rng(42)
+    print("=" * 72)
+    print(f"HNSW recall/latency vs exact search ({args.queries} queries, k={args.k})")
+    print("=" * 72)
+    for n in args.sizes:
+        run_size(n, args, rng)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark HNSW recall and latency")
+    parser.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[10000, 100000, 1000000],
+                        help="Comma-separated collection sizes")
+    parser.add_argument("--dim", type=int, default=128, help="Vector dimension")
+    parser.add_argument("--metric", choices=["cosine", "ip", "l2"], default="cosine", help="Distance metric")
+    parser.add_argument("--m", type=int, default=16, help="HNSW M (max_neighbors)")
+    parser.add_argument("--ef-construction", type=int, default=100, help="HNSW ef_construction")
+    parser.add_argument("--ef-search", type=lambda v: [int(x) for x in v.split(",")], default=[10, 50, 100, 200],
+                        help="Comma-separated ef_search values to sweep")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per size")
+    parser.add_argument("-k", type=int, default=10, help="Neighbours per query")
+    main(parser.parse_args())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Compare per-call HTTP clients with the pooled client for embedding calls.
+
+Runs against a local mock Voyage endpoint, so no network or API key is
+needed. The "per-call" column reproduces the old behaviour of opening a
+fresh httpx.AsyncClient for every embedding request.
+
+Usage:
+    python bench-http-pool.py [--requests 200] [--latency-ms 0]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+
+from mock_voyage import MockVoyageServer
+import server
+
+MOCK_PROVIDER = server.VoyageProvider(api_key="mock")
+
+
+async def per_call_embedding(text: str) -> list:
+    """Old behaviour: new client (and connection) per request."""
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        response = await client.post(
+            server.VOYAGE_API_URL,
+            headers={"Authorization": "Bearer mock", "Content-Type": "application/json"},
+            json={"input": [text], "model": server.EMBEDDING_MODEL}
+        )
+        response.raise_for_status()
+        return response.json()["data"][0]["embedding"]
+
+
+async def pooled_embedding(text: str) -> list:
+    return await server.get_embedding(text, MOCK_PROVIDER)
+
+
+async def measure(fn, n: int) -> list:
+    timings = []
+    for i in range(n):
+        start = time.perf_counter()
+        await fn(f"benchmark decision {i}")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(name: str, timings: list) -> str:
+    ordered = sorted(timings)
+    p50 = ordered[len(ordered) // 2]
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f"{name:<10} mean={statistics.mean(timings):7.2f}ms  p50={p50:7.2f}ms  p99={p99:7.2f}ms"
+
+
+async def main(args) -> None:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    with MockVoyageServer(latency_ms=args.latency_ms) as mock:
+        server.VOYAGE_API_URL = mock.url
+
+        # Warm both paths once so imports/first-connection cost is excluded
+        await per_call_embedding("warmup")
+        await pooled_embedding("warmup")
+
+        before = mock.connections
+        per_call = await measure(per_call_embedding, args.requests)
+        per_call_conns = mock.connections - before
+
+        before = mock.connections
+        pooled = await measure(pooled_embedding, args.requests)
+        pooled_conns = mock.connections - before
+
+        await server.close_http_client()
+
+    print("=" * 60)
+    print(f"Embedding call latency ({args.requests} sequential requests, "
+          f"mock latency {args.latency_ms}ms)")
+    print("=" * 60)
+    print(summarize("per-call", per_call) + f"  connections={per_call_conns}")
+    print(summarize("pooled", pooled) + f"  connections={pooled_conns}")
+    saved = statistics.mean(per_call) - statistics.mean(pooled)
+    print(f"\nSaved per call: {saved:.2f}ms "
+          f"({saved / statistics.mean(per_call) * 100:.0f}% of per-call latency)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs per-call HTTP clients")
+    parser.add_argument("--requests", "-n", type=int, default=200, help="Requests per mode")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mock server latency")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Cost of the latency instrumentation on the hot path.
+
+Reports the time to record one timed block (Timer enter/exit plus the
+histogram update) and compares context_query_traces p50/p99 with and
+without the per-tool wrapper, over a query-cache hit (the cheapest tool
+call there is, so the wrapper's share is at its largest) and a lexical
+search. Uses the local embedding provider; no network needed.
+
+Usage:
+    python bench-metrics-overhead.py [--traces 5000] [--calls 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def time_calls(tools: dict, calls: int, **kwargs) -> dict:
+    """Latencies in microseconds per tool, alternating calls so drift hits both alike."""
+    timings = {name: [] for name in tools}
+    for _ in range(calls):
+        for name, tool in tools.items():
+            start = time.perf_counter()
+            await tool(**kwargs)
+            timings[name].append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+async def main(args) -> None:
+    os.environ["CONTEXT_GRAPH_EMBEDDING_PROVIDER"] = "local"
+    import server
+    from metrics import HistogramFamily
+
+    family = HistogramFamily("bench", "stage", "")
+    start = time.perf_counter_ns()
+    for _ in range(args.calls * 100):
+        with family.time("stage"):
+            pass
+    timer_ns = (time.perf_counter_ns() - start) / (args.calls * 100)
+
+    project_dir = tempfile.mkdtemp(prefix="bench-metrics-")
+    try:
+        collection = await server.get_collection(project_dir)
+        provider = server.get_embedding_provider(project_dir)
+        for offset in range(0, args.traces, 1000):
+            ids = [f"trace_{i:012x}" for i in range(offset, min(offset + 1000, args.traces))]
+            documents = [f"Decision {i}: chose option {i % 97} for component {i % 13}" for i in range(len(ids))]
+            embeddings = await server.get_embeddings(documents, provider, project_dir=project_dir)
+            metadatas = [{**server.new_trace(d, "general", "pending", None, project_dir), "trace_id": t}
+                         for t, d in zip(ids, documents)]
+            await server.add_traces(collection, ids, embeddings, documents, metadatas, project_dir)
+
+        wrapped = server.context_query_traces
+        bare = wrapped.__wrapped__
+        print("=" * 72)
+        print(f"Instrumentation overhead, {args.traces} traces, {args.calls} calls per row")
+        print(f"timed block (enter + exit + histogram update): {timer_ns:.0f} ns")
+        print("=" * 72)
+        print(f"{'call':<22} {'wrapper':<8} {'p50 us':>9} {'p99 us':>9} {'mean us':>9}")
+        for label, kwargs in (
+            ("vector, cached", {"query": "component 7 option 3"}),
+            ("lexical", {"query": "component option", "mode": "lexical", "limit": 10}),
+        ):
+            if label == "lexical":
+                server.QUERY_CACHE_ENABLED = False
+            tools = {"off": bare, "on": wrapped}
+            await time_calls(tools, 50, project_dir=project_dir, **kwargs)  # warm
+            timings = await time_calls(tools, args.calls, project_dir=project_dir, **kwargs)
+            for name, values in timings.items():
+                print(f"{label:<22} {name:<8} {statistics.median(values):9.1f} "
+                      f"{percentile(values, 99):9.1f} {statistics.mean(values):9.1f}")
+    finally:
+        server.close_chroma_stores()
+        server.close_trace_indexes()
+        server.close_embedding_caches()
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark metrics overhead")
+    parser.add_argument("--traces", "-n", type=int, default=5000, help="Traces in the store")
+    parser.add_argument("--calls", type=int, default=2000, help="Tool calls per measurement")
+    asyncio.run(main(parser.parse_args()))
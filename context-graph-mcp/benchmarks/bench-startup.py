@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Server startup time: import cost per module and time to first tool list.
+
+Part 1 runs `python -X importtime -c "import server"` and reports the
+cumulative import time of each package the server imports directly,
+including submodules pulled in lazily while the module body runs
+(median over --runs), plus chromadb, which is now imported on first use.
+
+Part 2 launches the server over stdio the way an agent does, in a
+project that already has a store, and times the MCP handshake, the first
+tools/list and a first tool call issued --think-ms after the list (the
+gap while the agent decides what to call). Three launches are compared:
+
+    eager       chromadb imported before the server starts (the old behaviour)
+    lazy        chromadb imported by the first tool call (CONTEXT_GRAPH_PREWARM=0)
+    prewarm     lazy imports, store opened in the background after the handshake
+
+Uses the local embedding provider; no network needed.
+
+Usage:
+    python bench-startup.py [--runs 5] [--think-ms 1000]
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+EAGER = ("import chromadb, runpy, sys; sys.argv = [{path!r}]; sys.path.insert(0, {dir!r}); "
+         "runpy.run_path({path!r}, run_name='__main__')")
+
+
+def import_times(statement: str) -> dict:
+    """Cumulative import time (ms) of each top-level module imported by a statement."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=SERVER_DIR, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        depth = len(indent) // 2
+        times[(depth, name)] = int(cumulative) / 1000
+    return times
+
+
+def module_report(runs: int) -> None:
+    samples = [import_times("import server") for _ in range(runs)]
+    direct = {}
+    for run, sample in enumerate(samples):
+        for (depth, name), ms in sample.items():
+            if depth == 1 or (depth == 0 and name == "server"):
+                per_run = direct.setdefault(name.split(".")[0], [0.0] * runs)
+                per_run[run] += ms
+    chromadb = [import_times("import chromadb")[(0, "chromadb")] for _ in range(runs)]
+    needed_by_mcp = set(subprocess.run(
+        [sys.executable, "-c", "import sys, mcp.server.fastmcp; print(*{m.split('.')[0] for m in sys.modules})"],
+        capture_output=True, text=True, check=True
+    ).stdout.split()) - {"mcp"}
+
+    print("=" * 64)
+    print(f"Import time of `import server` (median of {runs} runs)")
+    print("=" * 64)
+    print(f"{'module':<28} {'cumulative ms':>14}")
+    rows = sorted(((statistics.median(v), k) for k, v in direct.items() if k != "server"), reverse=True)
+    for ms, name in rows:
+        if ms >= 1.0:
+            note = "  (imported by mcp anyway)" if name in needed_by_mcp else ""
+            print(f"{name:<28} {ms:14.1f}{note}")
+    print(f"{'server (total)':<28} {statistics.median(direct['server']):14.1f}")
+    print(f"{'chromadb (deferred)':<28} {statistics.median(chromadb):14.1f}")
+
+
+async def make_project() -> str:
+    """A project directory with a small store, built with the local provider."""
+    os.environ["CONTEXT_GRAPH_EMBEDDING_PROVIDER"] = "local"
+    import server
+
+    project_dir = tempfile.mkdtemp(prefix="bench-startup-")
+
+    provider = server.get_embedding_provider(project_dir)
+    collection = await server.get_collection(project_dir)
+    documents = [f"Decision {i}: chose option {i % 17} for component {i % 5}" for i in range(2000)]
+    ids = [f"trace_{i:012x}" for i in range(len(documents))]
+    embeddings = await server.get_embeddings(documents, provider, project_dir=project_dir)
+    metadatas = [{**server.new_trace(d, "general", "pending", None, project_dir), "trace_id": t}
+                 for t, d in zip(ids, documents)]
+    await server.add_traces(collection, ids, embeddings, documents, metadatas, project_dir)
+    server.close_chroma_stores()
+    server.close_trace_indexes()
+    return project_dir
+
+
+async def launch(mode: str, project_dir: str, think_ms: float) -> dict:
+    env = {**os.environ, "CONTEXT_GRAPH_EMBEDDING_PROVIDER": "local",
+           "CONTEXT_GRAPH_PREWARM": "0" if mode == "lazy" else "1"}
+    script = str(SERVER_DIR / "server.py")
+    args = ["-c", EAGER.format(path=script, dir=str(SERVER_DIR))] if mode == "eager" else [script]
+    # The agent's working directory is the project, so tools default to its store
+    params = StdioServerParameters(command=sys.executable, args=args, env=env, cwd=project_dir)
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as quiet:
+        async with stdio_client(params, errlog=quiet) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                handshake = time.perf_counter()
+                await session.list_tools()
+                listed = time.perf_counter()
+                await asyncio.sleep(think_ms / 1000)
+                call_start = time.perf_counter()
+                result = await session.call_tool("context_query_traces", {"query": "option for component"})
+                called = time.perf_counter()
+                assert not result.content[0].text.startswith("Error"), result.content[0].text
+    return {
+        "handshake": (handshake - start) * 1000,
+        "tools_list": (listed - start) * 1000,
+        "first_call": (called - call_start) * 1000,
+    }
+
+
+async def startup_report(runs: int, think_ms: float) -> None:
+    project_dir = await make_project()
+    try:
+        print()
+        print("=" * 64)
+        print(f"Stdio launch to first results (median of {runs}, first call {think_ms:.0f} ms after list)")
+        print("=" * 64)
+        print(f"{'mode':<10} {'handshake ms':>13} {'tools/list ms':>14} {'first call ms':>14}")
+        for mode in ("eager", "lazy", "prewarm"):
+            samples = [await launch(mode, project_dir, think_ms) for _ in range(runs)]
+            row = {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+            print(f"{mode:<10} {row['handshake']:13.0f} {row['tools_list']:14.0f} {row['first_call']:14.0f}")
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark server startup")
+    parser.add_argument("--runs", type=int, default=5, help="Repetitions per measurement")
+    parser.add_argument("--think-ms", type=float, default=1000, help="Pause between tools/list and the first call")
+    args = parser.parse_args()
+    module_report(args.runs)
+    asyncio.run(startup_report(args.runs, args.think_ms))
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark suite for the MCP tools.
+
+For each store size, fills a fresh project store with synthetic traces
+(synthetic_traces.py) through context_store_traces_batch, then runs
+these scenarios through the tool functions themselves, so validation,
+embedding, storage and formatting all count:
+
+    populate        context_store_traces_batch, 1000 traces per call
+    store           context_store_trace
+    query           context_query_traces, vector mode, distinct queries
+    query_category  the same, filtered to the most common category
+    list            context_list_traces, first page
+    list_category   context_list_traces, filtered, following next_cursor
+    categories      context_list_categories
+    update          context_update_outcome on random stored traces
+
+Embeddings come from the mock Voyage endpoint (mock_voyage.py) with
+configurable latency, over the real HTTP client, or from the local
+provider with --provider local. Each scenario reports p50/p99/mean
+latency, throughput, and the p50 of each internal stage from the
+server's metrics.
+
+Results are written as JSON (--output). --compare BASELINE reports the
+change against an earlier run and exits 1 if any scenario's p50 or p99
+rose, or its throughput fell, by more than --tolerance.
+
+Usage:
+    python bench-suite.py [--sizes 1000,10000,100000] [--ops 200] [--latency-ms 20]
+                          [--dim 1024] [--concurrency 1] [--scenarios query,list]
+                          [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mock_voyage import MockVoyageServer
+from synthetic_traces import DEFAULT_OUTCOMES, category_names, generate_queries, generate_traces, parse_outcomes
+
+SCENARIOS = ("store", "query", "query_category", "list", "list_category", "categories", "update")
+POPULATE_BATCH = 1000
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).parent, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run_ops(call, ops: int, concurrency: int) -> dict:
+    """Run call(i) for i in range(ops) on `concurrency` workers; time each call."""
+    timings, errors = [], []
+    next_op = iter(range(ops))
+
+    async def worker():
+        for i in next_op:
+            start = time.perf_counter()
+            result = await call(i)
+            timings.append((time.perf_counter() - start) * 1000)
+            if isinstance(result, str) and result.startswith("Error"):
+                errors.append(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    if errors:
+        print(f"  {len(errors)} errors, first: {errors[0][:200]}", file=sys.stderr)
+    return {
+        "ops": len(timings),
+        "errors": len(errors),
+        "p50_ms": round(statistics.median(timings), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "throughput_per_s": round(len(timings) / wall, 1),
+        "wall_s": round(wall, 3),
+    }
+
+
+async def run_size(server, size: int, args) -> list:
+    project_dir = tempfile.mkdtemp(prefix=f"bench-suite-{size}-")
+    config_dir = Path(project_dir) / ".claude" / "config"
+    config_dir.mkdir(parents=True)
+    (config_dir / "project.json").write_text(json.dumps({
+        "context_graph": {"embedding_provider": args.provider, "embedding_dim": args.dim}
+    }))
+    category = category_names(args.categories)[0]
+    queries = generate_queries(args.ops * 2, seed=size)
+    rng = random.Random(size)
+    trace_ids: list = []
+    results = []
+
+    async def measure(scenario: str, call, ops: int, concurrency: int = args.concurrency, traces: int = 0) -> None:
+        server.metrics.reset()
+        row = {"size": size, "scenario": scenario, **await run_ops(call, ops, concurrency)}
+        if traces:
+            row["throughput_traces_per_s"] = round(traces / row["wall_s"], 1)
+        stages = server.metrics.snapshot()["stage_duration_seconds"]
+        row["stages_p50_ms"] = {stage: summary["p50_ms"] for stage, summary in stages.items()}
+        results.append(row)
+        print(f"{size:>8} {scenario:<15} {row['ops']:>6} {row['p50_ms']:9.2f} {row['p99_ms']:9.2f} "
+              f"{row['throughput_per_s']:10.1f} {row['errors']:>6}"
+              + (f"  ({row['throughput_traces_per_s']:.0f} traces/s)" if traces else ""))
+
+    try:
+        traces = list(generate_traces(
+            size, args.categories, args.outcomes, args.min_words, args.max_words, seed=size
+        ))
+
+        async def populate(i):
+            result = await server.context_store_traces_batch(
+                traces[i * POPULATE_BATCH:(i + 1) * POPULATE_BATCH], project_dir=project_dir
+            )
+            if not result.startswith("Error"):
+                trace_ids.extend(item["trace_id"] for item in json.loads(result)["results"] if "trace_id" in item)
+            return result
+
+        await measure("populate", populate, -(-size // POPULATE_BATCH), concurrency=1, traces=size)
+        wanted = set(args.scenarios)
+
+        if "store" in wanted:
+            extra = list(generate_traces(args.ops, args.categories, args.outcomes,
+                                         args.min_words, args.max_words, seed=size + 1))
+            await measure("store", lambda i: server.context_store_trace(
+                extra[i]["decision"], extra[i]["category"], extra[i]["outcome"], project_dir=project_dir
+            ), args.ops)
+        if "query" in wanted:
+            await measure("query", lambda i: server.context_query_traces(
+                queries[i], limit=10, project_dir=project_dir
+            ), args.ops)
+        if "query_category" in wanted:
+            await measure("query_category", lambda i: server.context_query_traces(
+                queries[args.ops + i], limit=10, category=category, project_dir=project_dir
+            ), args.ops)
+        if "list" in wanted:
+            await measure("list", lambda i: server.context_list_traces(limit=20, project_dir=project_dir), args.ops)
+        if "list_category" in wanted:
+            cursor = {"next": None}
+
+            async def list_page(i):
+                result = await server.context_list_traces(
+                    category=category, limit=20, cursor=cursor["next"], response_format="json", project_dir=project_dir
+                )
+                if not result.startswith("Error"):
+                    cursor["next"] = json.loads(result).get("next_cursor")
+                return result
+
+            await measure("list_category", list_page, args.ops, concurrency=1)
+        if "categories" in wanted:
+            await measure("categories", lambda i: server.context_list_categories(project_dir=project_dir), args.ops)
+        if "update" in wanted:
+            outcomes = list(DEFAULT_OUTCOMES)
+            await measure("update", lambda i: server.context_update_outcome(
+                rng.choice(trace_ids), rng.choice(outcomes), project_dir=project_dir
+            ), args.ops)
+        return results
+    finally:
+        server.close_chroma_stores()
+        server.close_trace_indexes()
+        server.close_embedding_caches()
+        server._query_caches.clear()
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+
+def compare(results: list, meta: dict, baseline_path: str, tolerance: float) -> int:
+    """Print changes against a baseline run; return the number of regressions."""
+    report = json.loads(Path(baseline_path).read_text())
+    baseline = {(r["size"], r["scenario"]): r for r in report["results"]}
+    regressions = 0
+    print("=" * 78)
+    print(f"Change vs {baseline_path} at {report['meta']['commit']} (regression past {tolerance:.0%})")
+    print("=" * 78)
+    settings = ("provider", "dim", "latency_ms", "concurrency", "ops")
+    differing = [key for key in settings if report["meta"].get(key) != meta.get(key)]
+    if differing:
+        print(f"Warning: runs differ in {', '.join(differing)}; changes are not like for like")
+    print(f"{'traces':>8} {'scenario':<15} {'p50':>9} {'p99':>9} {'ops/s':>9}")
+    for row in results:
+        base = baseline.get((row["size"], row["scenario"]))
+        if base is None:
+            continue
+        changes = {
+            "p50": row["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0,
+            "p99": row["p99_ms"] / base["p99_ms"] - 1 if base["p99_ms"] else 0.0,
+            "ops/s": row["throughput_per_s"] / base["throughput_per_s"] - 1 if base["throughput_per_s"] else 0.0,
+        }
+        slower = changes["p50"] > tolerance or changes["p99"] > tolerance or changes["ops/s"] < -tolerance / (1 + tolerance)
+        regressions += slower
+        print(f"{row['size']:>8} {row['scenario']:<15} {changes['p50']:+9.1%} {changes['p99']:+9.1%} "
+              f"{changes['ops/s']:+9.1%}{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+async def main(args) -> int:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    os.environ.setdefault("VOYAGE_API_KEY", "mock")
+    import server
+
+    mock = MockVoyageServer(latency_ms=args.latency_ms, dim=args.dim).start() if args.provider == "voyage" else None
+    if mock is not None:
+        server.VOYAGE_API_URL = mock.url
+
+    print("=" * 78)
+    print(f"Benchmark suite: {args.provider} embeddings ({args.dim}-dim"
+          f"{f', mock latency {args.latency_ms}ms' if mock else ''}), concurrency {args.concurrency}")
+    print("=" * 78)
+    print(f"{'traces':>8} {'scenario':<15} {'ops':>6} {'p50 ms':>9} {'p99 ms':>9} {'ops/s':>10} {'errors':>6}")
+    results = []
+    try:
+        for size in args.sizes:
+            results.extend(await run_size(server, size, args))
+    finally:
+        await server.close_http_client()
+        if mock is not None:
+            mock.stop()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "provider": args.provider,
+            "dim": args.dim,
+            "latency_ms": args.latency_ms if mock else None,
+            "concurrency": args.concurrency,
+            "ops": args.ops,
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        return 1 if compare(results, report["meta"], args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end benchmark suite for the MCP tools")
+    parser.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[1000, 10000, 100000],
+                        help="Comma-separated store sizes")
+    parser.add_argument("--ops", type=int, default=200, help="Calls per scenario")
+    parser.add_argument("--scenarios", type=lambda v: v.split(","), default=list(SCENARIOS),
+                        help=f"Comma-separated subset of: {','.join(SCENARIOS)} (populate always runs)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent callers per scenario")
+    parser.add_argument("--provider", choices=("voyage", "local"), default="voyage",
+                        help="voyage = mock Voyage endpoint over HTTP; local = in-process hashing provider")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mock endpoint latency per request")
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension")
+    parser.add_argument("--categories", type=int, default=6, help="Distinct categories in the corpus")
+    parser.add_argument("--outcomes", type=parse_outcomes, default=DEFAULT_OUTCOMES,
+                        help="Outcome weights, e.g. pending=0.6,success=0.3,failure=0.1")
+    parser.add_argument("--min-words", type=int, default=8, help="Shortest decision, in words")
+    parser.add_argument("--max-words", type=int, default=40, help="Longest decision, in words")
+    parser.add_argument("--output", "-o", default=None, help="Write results JSON here")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a regression")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    sys.exit(asyncio.run(main(args)))
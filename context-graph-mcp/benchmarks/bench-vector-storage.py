@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Footprint and recall of reduced-dimension / quantized vector storage.
+
+Stores the same clustered, unit-length synthetic vectors once per storage
+format (full float32, and truncated ANN vectors with a float16 or int8
+full-dimension rerank copy) through the server's own write and search
+paths, then reports disk footprint, the estimated resident size of the
+ANN index, recall@k against exact full-precision search, and p50 query
+latency. For reduced formats it also reports ANN-only recall, i.e. what
+the truncated vectors find before reranking.
+
+Usage:
+    python bench-vector-storage.py [--traces 20000] [--dim 1024] [--queries 200] [-k 10]
+
+Synthetic vectors spread their variance evenly over all components;
+real embeddings differ, so treat the recall numbers as a rough guide and
+re-run against an exported store before changing production settings.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+FORMATS = [
+    ("full float32", None, None),
+    ("ann 512 + float16", 512, "float16"),
+    ("ann 256 + float16", 256, "float16"),
+    ("ann 256 + int8", 256, "int8"),
+    ("ann 128 + int8", 128, "int8"),
+]
+
+
+def synthetic(n: int, centers: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    dim = centers.shape[1]
+    points = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def dir_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) if path.exists() else 0
+
+
+async def run_format(server, name, ann_dim, precision, data, queries, truth, args) -> dict:
+    project_dir = tempfile.mkdtemp(prefix="bench-storage-")
+    config_dir = Path(project_dir) / ".claude" / "config"
+    config_dir.mkdir(parents=True)
+    index = {"ann_dim": ann_dim, "rerank_precision": precision} if ann_dim else {}
+    (config_dir / "project.json").write_text(json.dumps({"context_graph": {"index": index}}))
+
+    try:
+        collection = await server.get_collection(project_dir)
+        for offset in range(0, len(data), 1000):
+            chunk = data[offset:offset + 1000]
+            ids = [str(i) for i in range(offset, offset + len(chunk))]
+            await server.add_traces(
+                collection, ids, chunk.tolist(), [""] * len(ids),
+                [{"category": "bench", "outcome": "pending"} for _ in ids], project_dir
+            )
+
+        hits, ann_hits, timings = 0, 0, []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            results = await server.vector_search(collection, query.tolist(), args.k, None, project_dir)
+            timings.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & {int(hit["id"]) for hit in results})
+            if ann_dim:
+                ann = await server.run_chroma(
+                    collection.query,
+                    query_embeddings=[server.truncate_embedding(query.tolist(), ann_dim)],
+                    n_results=args.k, include=[]
+                )
+                ann_hits += len(expected & {int(i) for i in ann["ids"][0]})
+
+        # Closing checkpoints the SQLite WAL files, so sizes reflect settled data
+        server.close_chroma_stores()
+        server.close_rerank_stores()
+        index_dim = ann_dim or data.shape[1]
+        claude_dir = Path(project_dir) / ".claude"
+        return {
+            "name": name,
+            "disk_bytes": dir_bytes(claude_dir / "chroma")
+            + sum(f.stat().st_size for f in claude_dir.glob("rerank-vectors.sqlite3*")),
+            # float32 vectors plus HNSW level-0 links (2 x M=16 neighbours, 4 bytes each)
+            "ram_bytes": len(data) * (index_dim * 4 + 2 * 16 * 4),
+            "recall": hits / (args.k * len(queries)),
+            "ann_recall": ann_hits / (args.k * len(queries)) if ann_dim else None,
+            "p50": statistics.median(timings),
+        }
+    finally:
+        server.close_chroma_stores()
+        server.close_rerank_stores()
+        server.close_trace_indexes()
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+
+async def main(args) -> None:
+    os.environ["CONTEXT_GRAPH_EMBEDDING_PROVIDER"] = "local"
+    os.environ["CONTEXT_GRAPH_LOCAL_EMBEDDING_DIM"] = str(args.dim)
+    import server
+    server.RERANK_CANDIDATES = args.rerank_candidates
+
+    rng = np.random.default_rng(7)
+    centers = rng.standard_normal((200, args.dim)).astype(np.float32)
+    data = synthetic(args.traces, centers, rng)
+    queries = synthetic(args.queries, centers, rng)
+    truth = [set(np.argsort(-(data @ q))[:args.k].tolist()) for q in queries]
+
+    rows = []
+    for name, ann_dim, precision in FORMATS:
+        if ann_dim and ann_dim >= args.dim:
+            continue
+        print(f"  {name}...", flush=True)
+        rows.append(await run_format(server, name, ann_dim, precision, data, queries, truth, args))
+
+    base = rows[0]
+    print("=" * 88)
+    print(f"{args.traces} traces, {args.dim}-dim, recall@{args.k} vs exact float32 search "
+          f"({args.queries} queries, rerank {args.rerank_candidates}x{args.k} candidates)")
+    print("=" * 88)
+    print(f"{'format':<20} {'disk MB':>8} {'vs full':>8} {'ANN RAM MB':>11} {'recall':>7} {'ANN-only':>9} {'p50 ms':>7}")
+    for row in rows:
+        ann_only = f"{row['ann_recall']:.3f}" if row["ann_recall"] is not None else "-"
+        print(f"{row['name']:<20} {row['disk_bytes'] / 1e6:8.1f} {row['disk_bytes'] / base['disk_bytes']:8.2f} "
+              f"{row['ram_bytes'] / 1e6:11.1f} {row['recall']:7.3f} {ann_only:>9} {row['p50']:7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reduced/quantized vector storage")
+    parser.add_argument("--traces", "-n", type=int, default=20000, help="Traces per format")
+    parser.add_argument("--dim", type=int, default=1024, help="Full embedding dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per format")
+    parser.add_argument("-k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--rerank-candidates", type=int, default=10, help="Candidates reranked per result")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Local mock of the Voyage AI embeddings endpoint.
+
+Serves deterministic vectors over plain HTTP/1.1 with keep-alive so
+benchmarks can exercise the real client code without network access.
+
+Usage:
+    python mock_voyage.py [--port 8766] [--latency-ms 20] [--dim 1024]
+
+    # In another shell
+    export VOYAGE_API_URL=http://127.0.0.1:8766/v1/embeddings
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Deterministic pseudo-embedding for a text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+    rng = random.Random(seed)
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+class MockVoyageServer:
+    """Threaded mock embedding server that can run in the background."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency_ms: float = 0.0, dim: int = 1024):
+        self.latency_ms = latency_ms
+        self.dim = dim
+        self.requests = 0
+        self.inputs = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/embeddings"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately; without
+                # TCP_NODELAY, Nagle + delayed ACK adds ~40ms per response
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with server._lock:
+                    server.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                texts = payload.get("input") or []
+
+                with server._lock:
+                    server.requests += 1
+                    server.inputs += len(texts)
+
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000.0)
+
+                body = json.dumps({
+                    "object": "list",
+                    "model": payload.get("model"),
+                    "data": [
+                        {"object": "embedding", "index": i,
+                         "embedding": fake_embedding(text, server.dim)}
+                        for i, text in enumerate(texts)
+                    ],
+                    "usage": {"total_tokens": sum(len(t.split()) for t in texts)}
+                }).encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "MockVoyageServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock Voyage embeddings endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766, help="Default is one above server.py serve's port")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Artificial per-request latency")
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimensions")
+    args = parser.parse_args()
+
+    mock = MockVoyageServer(args.host, args.port, args.latency_ms, args.dim)
+    print(f"Mock Voyage endpoint: {mock.url}")
+    try:
+        mock._httpd.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
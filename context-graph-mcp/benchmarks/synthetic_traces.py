@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Synthetic decision traces for benchmarks.
+
+Generates trace items in the shape context_store_traces_batch takes
+({"decision", "category", "outcome", "feature_id"}) with a configurable
+number of categories, outcome mix and decision length. Categories follow
+a Zipf-like skew (the first is the most common), as they do in real
+stores, so category filters are exercised at several selectivities.
+Output is deterministic for a given seed.
+
+Usage:
+    python synthetic_traces.py [--count 1000] [--categories 6] [--min-words 8]
+                               [--max-words 40] [--outcomes pending=0.6,success=0.3,failure=0.1]
+
+    Writes one JSON trace per line to stdout.
+"""
+
+import argparse
+import json
+import random
+import sys
+from typing import Dict, Iterator, List, Optional
+
+BASE_CATEGORIES = ("framework", "architecture", "api", "error", "testing", "deployment")
+DEFAULT_OUTCOMES = {"pending": 0.6, "success": 0.3, "failure": 0.1}
+
+CHOICES = (
+    "FastAPI", "Flask", "Django", "Redis", "Postgres", "SQLite", "Kafka", "RabbitMQ", "gRPC",
+    "GraphQL", "REST", "WebSockets", "Celery", "asyncio", "threads", "Docker", "Kubernetes",
+    "Terraform", "pytest", "hypothesis", "Pydantic", "SQLAlchemy", "Alembic", "nginx", "Envoy",
+    "JWT", "OAuth", "S3", "DynamoDB", "Elasticsearch", "ChromaDB", "numpy", "Rust", "Go",
+)
+SUBJECTS = (
+    "the ingestion pipeline", "user sessions", "the billing service", "background jobs",
+    "search indexing", "rate limiting", "the admin API", "config loading", "retries",
+    "error reporting", "the CLI", "schema migrations", "feature flags", "the cache layer",
+    "auth tokens", "file uploads", "webhooks", "metrics export", "the test harness",
+)
+REASONS = (
+    "lower latency", "simpler deployment", "better type safety", "fewer moving parts",
+    "existing team experience", "async support", "stronger consistency", "cheaper hosting",
+    "easier local testing", "clearer error messages", "built-in retries", "smaller memory use",
+    "backpressure handling", "mature tooling", "horizontal scaling", "less vendor lock-in",
+)
+FILLER = (
+    "after", "benchmarking", "both", "options", "under", "realistic", "load", "and",
+    "reviewing", "failure", "modes", "with", "the", "team", "we", "kept", "a", "fallback",
+    "path", "documented", "trade-offs", "in", "design", "notes", "for", "later", "review",
+)
+
+
+def category_names(count: int) -> List[str]:
+    """The first `count` category names (suffixed once the base list runs out)."""
+    return [
+        BASE_CATEGORIES[i] if i < len(BASE_CATEGORIES) else f"{BASE_CATEGORIES[i % len(BASE_CATEGORIES)]}-{i}"
+        for i in range(count)
+    ]
+
+
+def parse_outcomes(spec: str) -> Dict[str, float]:
+    """Parse "pending=0.6,success=0.3,failure=0.1" into weights."""
+    weights = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def decision_text(rng: random.Random, min_words: int, max_words: int) -> str:
+    """One decision sentence of roughly min_words..max_words words."""
+    chosen, rejected = rng.sample(CHOICES, 2)
+    words = f"Chose {chosen} over {rejected} for {rng.choice(SUBJECTS)} because of {rng.choice(REASONS)}".split()
+    target = rng.randint(min_words, max(min_words, max_words))
+    while len(words) < target:
+        words.append(rng.choice(FILLER + REASONS if rng.random() < 0.2 else FILLER))
+    return " ".join(words[:max(target, 8)])
+
+
+def generate_traces(
+    count: int,
+    categories: int = len(BASE_CATEGORIES),
+    outcomes: Optional[Dict[str, float]] = None,
+    min_words: int = 8,
+    max_words: int = 40,
+    seed: int = 0
+) -> Iterator[Dict[str, str]]:
+    """Yield `count` synthetic trace items."""
+    rng = random.Random(seed)
+    names = category_names(categories)
+    category_weights = [1 / (rank + 1) for rank in range(len(names))]
+    outcomes = outcomes or DEFAULT_OUTCOMES
+    outcome_names, outcome_weights = list(outcomes), list(outcomes.values())
+    for i in range(count):
+        yield {
+            "decision": f"{decision_text(rng, min_words, max_words)} (#{seed}-{i})",
+            "category": rng.choices(names, category_weights)[0],
+            "outcome": rng.choices(outcome_names, outcome_weights)[0],
+            "feature_id": f"feat-{rng.randint(1, 200):03d}",
+        }
+
+
+def generate_queries(count: int, seed: int = 0) -> List[str]:
+    """Distinct short search queries over the same vocabulary."""
+    rng = random.Random(seed + 1_000_003)
+    return [
+        f"{rng.choice(CHOICES)} for {rng.choice(SUBJECTS)} {rng.choice(REASONS)} q{i}"
+        for i in range(count)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic decision traces as JSON lines")
+    parser.add_argument("--count", "-n", type=int, default=1000)
+    parser.add_argument("--categories", type=int, default=len(BASE_CATEGORIES))
+    parser.add_argument("--outcomes", type=parse_outcomes, default=DEFAULT_OUTCOMES,
+                        help="Outcome weights, e.g. pending=0.6,success=0.3,failure=0.1")
+    parser.add_argument("--min-words", type=int, default=8)
+    parser.add_argument("--max-words", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for trace in generate_traces(args.count, args.categories, args.outcomes, args.min_words, args.max_words, args.seed):
+        sys.stdout.write(json.dumps(trace) + "\n")
@@ -0,0 +1,206 @@
+"""
+Persistent, content-addressed embedding cache.
+
+Embeddings are keyed by (model, input_type, normalized text hash) and kept
+in a SQLite file next to the project's ChromaDB directory
+(.claude/embedding-cache.sqlite3), with a small in-memory LRU in front.
+The on-disk cache is size-capped; the least recently used entries are
+evicted once the cap is exceeded.
+
+The context-graph skill scripts (.skills/context-graph/scripts) import
+this module too, so the MCP server and the CLI share cached vectors.
+install-skills.sh copies it next to the installed scripts.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CACHE_FILENAME = "embedding-cache.sqlite3"
+DEFAULT_MEMORY_ENTRIES = 2048
+DEFAULT_MAX_ENTRIES = 100000
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different inputs share an entry."""
+    return " ".join(text.split())
+
+
+def cache_key(model: str, input_type: str, text: str) -> str:
+    """Content address for an embedding."""
+    payload = f"{model}\x00{input_type}\x00{normalize_text(text)}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_path(project_dir: Optional[str] = None) -> Path:
+    """Cache file location, alongside .claude/chroma."""
+    base = Path(project_dir) / ".claude" if project_dir else Path(".claude")
+    return base / CACHE_FILENAME
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache with an in-memory LRU front."""
+
+    def __init__(
+        self,
+        path: Path,
+        memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+        max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.path = Path(path)
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                input_type TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    # ── lookups ────────────────────────────────────────────────
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN ... COMMIT, rolled back if the body raises."""
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """Return a cached vector or None."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for whichever keys are present."""
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            pending = []
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vector
+                    self.hits += 1
+                    self.memory_hits += 1
+                else:
+                    pending.append(key)
+
+            if pending:
+                now = time.time()
+                for start in range(0, len(pending), 500):
+                    chunk = pending[start:start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f", blob).tolist()
+                        found[key] = vector
+                        self._remember(key, vector)
+                    if rows:
+                        self._conn.executemany(
+                            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                            [(now, key) for key, _ in rows]
+                        )
+                hit_count = sum(1 for key in pending if key in found)
+                self.hits += hit_count
+                self.misses += len(pending) - hit_count
+
+        return found
+
+    # ── writes ─────────────────────────────────────────────────
+
+    def put(self, key: str, vector: List[float], model: str = "", input_type: str = "") -> None:
+        """Store one vector."""
+        self.put_many([(key, vector)], model=model, input_type=input_type)
+
+    def put_many(
+        self,
+        items: Iterable[Tuple[str, List[float]]],
+        model: str = "",
+        input_type: str = ""
+    ) -> None:
+        """Store vectors and evict least recently used entries past the cap."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, list(vector))
+                rows.append((key, model, input_type, len(vector), array("f", vector).tobytes(), now))
+            if not rows:
+                return
+
+            with self._transaction():
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, model, input_type, dim, vector, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._count += self._conn.total_changes - before
+                if self._count > self.max_entries:
+                    # Other processes (CLI scripts) share the file; recount first
+                    self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if self._count > self.max_entries:
+                    # Evict down to 90% of the cap so eviction is amortized
+                    excess = self._count - int(self.max_entries * 0.9)
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (excess,)
+                    )
+                    self._count -= excess
+                    self.evictions += excess
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.memory_entries:
+            self._lru.popitem(last=False)
+
+    # ── housekeeping ───────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and sizes."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_entries": len(self._lru),
+            "disk_entries": self._count,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,367 @@
+"""
+Exact (brute-force) vector search over a memory-mapped embedding matrix.
+
+An alternative to ChromaDB's HNSW index for stores up to a few hundred
+thousand traces, where one matrix-vector product is faster than a graph
+walk and always exact. Files live in .claude/flat-index/:
+
+    vectors.npy    float32 [capacity, dim] embedding matrix (memory-mapped)
+    ids.npy        trace ID per row (UTF-8; widened to fit the longest ID)
+    category.npy   category code per row
+    outcome.npy    outcome code per row
+    alive.npy      False for replaced or deleted rows
+    meta.json      row count, dim and the category/outcome code tables
+
+Files are preallocated and grow by doubling; rows past meta.json's count
+are ignored, so a crash mid-append leaves the index consistent (the
+server then notices the count differs from ChromaDB and rebuilds).
+meta.json is rewritten after every write, last.
+Replaced and deleted rows stay in the files until they make up a quarter
+of the rows; the files are then rewritten with only the live ones.
+
+Several server processes may share a project's index. Each write takes an
+exclusive flock on .claude/flat-index/.lock and first reloads the files if
+meta.json changed since this process last saw it (its files may have been
+replaced by a peer's growth or compaction), so peers never write into
+stale mappings. Reads reload the same way, so a peer's rows show up
+without a rebuild from ChromaDB. Without fcntl (Windows) there is no lock:
+run one writer process per project.
+
+Per-category and per-outcome boolean masks are kept in memory and
+combined before ranking, so filtered queries only score matching rows.
+Rows are normalized on append, so scores are cosine similarities
+whatever metric the ChromaDB collection uses.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so run one writer process per project
+    fcntl = None
+
+INDEX_DIRNAME = "flat-index"
+MIN_CAPACITY = 1024
+ID_BYTES = 64
+# Compact once dead rows exceed this share of the stored rows (and COMPACT_MIN_DEAD)
+COMPACT_DEAD_FRACTION = 0.25
+COMPACT_MIN_DEAD = 256
+
+
+def flat_index_path(project_dir: Optional[str] = None) -> Path:
+    """Flat index directory, alongside .claude/chroma."""
+    base = Path(project_dir) / ".claude" if project_dir else Path(".claude")
+    return base / INDEX_DIRNAME
+
+
+class FlatIndex:
+    """Append-only memory-mapped embedding matrix with exact top-k search."""
+
+    def __init__(self, directory: Path, dim: int):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.compactions = 0
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(self.directory / ".lock", "ab")
+        self._signature: Optional[Tuple[int, int, int]] = None
+        for name in ("vectors", "ids", "category", "outcome", "alive"):
+            setattr(self, f"_{name}", None)
+        # Loads the files, or creates them, under the writer lock
+        with self._writing():
+            pass
+
+    def _meta_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.directory / "meta.json")
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, writable: bool) -> None:
+        """Map the files meta.json describes; a writer recreates them if it describes none."""
+        meta_path = self.directory / "meta.json"
+        meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        if meta.get("dim") != self.dim:
+            meta = {}
+        self._count = meta.get("count", 0)
+        self._categories: List[str] = meta.get("categories", [])
+        self._outcomes: List[str] = meta.get("outcomes", [])
+        self._id_width = ID_BYTES
+
+        if self._count or (not writable and (self.directory / "vectors.npy").exists()):
+            for name in ("vectors", "ids", "category", "outcome", "alive"):
+                setattr(self, f"_{name}", np.load(self.directory / f"{name}.npy", mmap_mode="r+"))
+            self._id_width = max(ID_BYTES, self._ids.dtype.itemsize)
+        elif writable:
+            self._allocate(MIN_CAPACITY)
+            self._write_meta()
+        self._signature = self._meta_signature()
+        self._rebuild_lookups()
+
+    def _reload_if_changed(self, writable: bool = False) -> None:
+        """Pick up another process's writes (caller holds _lock)."""
+        if self._signature is None or self._meta_signature() != self._signature:
+            if self._signature is not None:
+                self.reloads += 1
+            self._load(writable)
+
+    @contextmanager
+    def _writing(self):
+        """Hold the thread lock and the writer flock, with the latest files mapped."""
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                self._reload_if_changed(writable=True)
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    # ── storage ────────────────────────────────────────────────
+
+    def _open(self, name: str, dtype, shape: tuple) -> np.memmap:
+        return np.lib.format.open_memmap(str(self.directory / name), mode="w+", dtype=dtype, shape=shape)
+
+    def _allocate(self, capacity: int, keep: Optional[np.ndarray] = None) -> None:
+        """(Re)create the files at a capacity, keeping the current rows (or only rows `keep`)."""
+        arrays = {
+            "vectors": (np.float32, (capacity, self.dim)),
+            "ids": (f"S{self._id_width}", (capacity,)),
+            "category": (np.int32, (capacity,)),
+            "outcome": (np.int32, (capacity,)),
+            "alive": (np.bool_, (capacity,)),
+        }
+        for name, (dtype, shape) in arrays.items():
+            tmp = f"{name}.tmp.npy"
+            grown = self._open(tmp, dtype, shape)
+            old = getattr(self, f"_{name}", None)
+            if old is not None and keep is not None:
+                grown[:len(keep)] = old[keep]
+            elif old is not None and self._count:
+                grown[:self._count] = old[:self._count]
+            grown.flush()
+            del grown
+            os.replace(self.directory / tmp, self.directory / f"{name}.npy")
+            setattr(self, f"_{name}", np.load(self.directory / f"{name}.npy", mmap_mode="r+"))
+
+    def _compact(self) -> None:
+        """Rewrite the files with only the live rows."""
+        keep = np.flatnonzero(np.asarray(self._alive[:self._count]))
+        capacity = max(MIN_CAPACITY, min(len(self._vectors), 2 * len(keep)))
+        # Until the rewrite finishes meta.json says empty, so a crash leaves
+        # an index the server rebuilds rather than one with mismatched files
+        self._count = 0
+        self._write_meta()
+        self._allocate(capacity, keep)
+        self._count = len(keep)
+        self._write_meta()
+        self._rebuild_lookups()
+        self.compactions += 1
+
+    def _maybe_compact(self) -> None:
+        dead = self._count - len(self._rows)
+        if dead >= COMPACT_MIN_DEAD and dead > COMPACT_DEAD_FRACTION * self._count:
+            self._compact()
+
+    def _write_meta(self) -> None:
+        tmp = self.directory / "meta.json.tmp"
+        tmp.write_text(json.dumps({
+            "count": self._count,
+            "dim": self.dim,
+            "categories": self._categories,
+            "outcomes": self._outcomes,
+        }))
+        os.replace(tmp, self.directory / "meta.json")
+        self._signature = self._meta_signature()
+
+    def _rebuild_lookups(self) -> None:
+        n = self._count
+        alive = np.asarray(self._alive[:n])
+        self._rows: Dict[str, int] = {
+            trace_id.decode(): row for row, trace_id in enumerate(self._ids[:n]) if alive[row]
+        }
+        self._category_masks = {code: np.asarray(self._category[:n]) == code for code in range(len(self._categories))}
+        self._outcome_masks = {code: np.asarray(self._outcome[:n]) == code for code in range(len(self._outcomes))}
+        self._alive_mask = alive.copy()
+
+    @staticmethod
+    def _code(labels: List[str], label: str) -> int:
+        if label not in labels:
+            labels.append(label)
+        return labels.index(label)
+
+    @staticmethod
+    def _grow_mask(mask: np.ndarray, size: int) -> np.ndarray:
+        return mask if len(mask) >= size else np.concatenate([mask, np.zeros(size - len(mask), dtype=bool)])
+
+    # ── writes ─────────────────────────────────────────────────
+
+    def add(
+        self,
+        ids: List[str],
+        vectors: Iterable[List[float]],
+        categories: List[str],
+        outcomes: List[str]
+    ) -> None:
+        """Append traces; re-adding an ID replaces its previous row."""
+        matrix = np.asarray(list(vectors), dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms > 0, norms, 1.0)
+        encoded = [trace_id.encode() for trace_id in ids]
+        with self._writing():
+            width = max(map(len, encoded), default=0)
+            needed = self._count + len(ids)
+            if width > self._id_width:
+                self._id_width = width
+                self._allocate(max(needed, len(self._vectors)))
+            elif needed > len(self._vectors):
+                self._allocate(max(needed, 2 * len(self._vectors)))
+
+            start, end = self._count, needed
+            category_codes = [self._code(self._categories, c) for c in categories]
+            outcome_codes = [self._code(self._outcomes, o) for o in outcomes]
+            for trace_id in ids:
+                previous = self._rows.pop(trace_id, None)
+                if previous is not None:
+                    self._alive[previous] = False
+                    self._alive_mask[previous] = False
+
+            self._vectors[start:end] = matrix
+            self._ids[start:end] = encoded
+            self._category[start:end] = category_codes
+            self._outcome[start:end] = outcome_codes
+            self._alive[start:end] = True
+            for array in (self._vectors, self._ids, self._category, self._outcome, self._alive):
+                array.flush()
+            self._count = end
+            self._write_meta()
+
+            self._alive_mask = self._grow_mask(self._alive_mask, end)
+            self._alive_mask[start:end] = True
+            for masks, labels, codes in (
+                (self._category_masks, self._categories, category_codes),
+                (self._outcome_masks, self._outcomes, outcome_codes),
+            ):
+                for code in range(len(labels)):
+                    masks[code] = self._grow_mask(masks.get(code, np.zeros(0, dtype=bool)), end)
+                for row, code in enumerate(codes, start):
+                    masks[code][row] = True
+            for row, trace_id in enumerate(ids, start):
+                self._rows[trace_id] = row
+            self._maybe_compact()
+
+    def update_outcomes(self, outcomes: Dict[str, str]) -> None:
+        """Change the outcome of indexed traces (flips their mask bits)."""
+        with self._writing():
+            for trace_id, outcome in outcomes.items():
+                row = self._rows.get(trace_id)
+                if row is None:
+                    continue
+                old_code = int(self._outcome[row])
+                new_code = self._code(self._outcomes, outcome)
+                if new_code not in self._outcome_masks:
+                    self._outcome_masks[new_code] = np.zeros(self._count, dtype=bool)
+                self._outcome_masks[old_code][row] = False
+                self._outcome_masks[new_code][row] = True
+                self._outcome[row] = new_code
+            self._outcome.flush()
+            self._write_meta()
+
+    def delete(self, ids: List[str]) -> None:
+        """Drop traces from search results."""
+        with self._writing():
+            for trace_id in ids:
+                row = self._rows.pop(trace_id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    self._alive_mask[row] = False
+            self._alive.flush()
+            # Rewritten so peers notice the dropped rows
+            self._write_meta()
+            self._maybe_compact()
+
+    def rebuild(self, batches: Iterable[Tuple[List[str], List[List[float]], List[str], List[str]]]) -> int:
+        """Replace the contents with (ids, vectors, categories, outcomes) batches."""
+        with self._writing():
+            self._count = 0
+            self._categories, self._outcomes = [], []
+            self._allocate(MIN_CAPACITY)
+            self._write_meta()
+            self._rebuild_lookups()
+        for ids, vectors, categories, outcomes in batches:
+            self.add(ids, vectors, categories, outcomes)
+        return self.count()
+
+    # ── reads ──────────────────────────────────────────────────
+
+    def count(self) -> int:
+        """Number of live traces."""
+        with self._lock:
+            self._reload_if_changed()
+            return len(self._rows)
+
+    def search(
+        self,
+        query: List[float],
+        k: int,
+        category: Optional[str] = None,
+        outcome: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """Top-k (trace_id, cosine similarity) by exact dot product."""
+        vector = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            self._reload_if_changed()
+            n = self._count
+            mask = self._alive_mask[:n]
+            for label, labels, masks in ((category, self._categories, self._category_masks),
+                                         (outcome, self._outcomes, self._outcome_masks)):
+                if label:
+                    if label not in labels:
+                        return []
+                    mask = mask & masks[labels.index(label)][:n]
+
+            rows = np.flatnonzero(mask)
+            if len(rows) == 0:
+                return []
+            # Unfiltered queries scan the contiguous matrix; filtered ones only score matching rows
+            if len(rows) == n:
+                scores = self._vectors[:n] @ vector
+            else:
+                scores = self._vectors[rows] @ vector
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._ids[rows[i]].decode(), float(scores[i])) for i in top]
+
+    def stats(self) -> Dict[str, Any]:
+        """Live, dead and stored row counts and file sizes."""
+        with self._lock:
+            self._reload_if_changed()
+            return {
+                "entries": len(self._rows),
+                "rows": self._count,
+                "dead_rows": self._count - len(self._rows),
+                "compactions": self.compactions,
+                "reloads": self.reloads,
+                "capacity": len(self._vectors),
+                "disk_bytes": sum(f.stat().st_size for f in self.directory.glob("*") if f.is_file()),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            for name in ("vectors", "ids", "category", "outcome", "alive"):
+                array = getattr(self, f"_{name}", None)
+                if array is not None:
+                    array.flush()
+                    setattr(self, f"_{name}", None)
+            self._lock_file.close()
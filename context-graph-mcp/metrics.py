@@ -0,0 +1,203 @@
+"""
+Latency histograms and counters for the server's tools and internal stages.
+
+Each metric is a family with one label (tool name, stage, provider, ...)
+and a child per label value. Histograms use fixed log-spaced buckets,
+each 20% wider than the last, from 10 microseconds to about 5 minutes.
+Recording a value is one log and a list increment, with no allocation,
+so timing every tool call and stage costs well under a microsecond.
+Percentiles are read from the buckets and are within about 10% of the
+exact value, which is enough to tell where time goes.
+
+Snapshots back the context_stats tool; render_prometheus writes the same
+data in Prometheus text format, with histograms as summaries
+(p50/p95/p99, _sum and _count).
+
+Not thread-safe: the server only records from the event loop.
+"""
+
+import math
+import time
+from typing import Any, Dict, List
+
+MIN_SECONDS = 1e-5
+BUCKET_GROWTH = 1.2
+BUCKETS = 96  # MIN_SECONDS * 1.2**95 ~= 340 s
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "context_graph_"
+
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+
+class Histogram:
+    """Counts of observed durations in log-spaced buckets."""
+
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        if seconds > MIN_SECONDS:
+            bucket = min(int(math.log(seconds / MIN_SECONDS) / _LOG_GROWTH) + 1, BUCKETS - 1)
+        else:
+            bucket = 0
+        self.counts[bucket] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimated q-quantile in seconds (geometric middle of its bucket)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                break
+        estimate = MIN_SECONDS * BUCKET_GROWTH ** (bucket - 0.5) if bucket else MIN_SECONDS
+        return min(max(estimate, self.min), self.max)
+
+    def summary(self) -> Dict[str, Any]:
+        """Count, mean, percentiles and max, in milliseconds."""
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 3),
+            **{f"p{round(q * 100)}_ms": round(self.quantile(q) * 1000, 3) for q in QUANTILES},
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class Timer:
+    """Context manager adding its wall time to one histogram."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Family:
+    """A named metric with one child per label value."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, label: str, help: str):
+        self.name = name
+        self.label = label
+        self.help = help
+        self.children: Dict[str, Any] = {}
+
+    def set_all(self, values: Dict[str, float]) -> None:
+        """Replace every child with sampled values (gauges, or counts kept elsewhere)."""
+        self.children = dict(values)
+
+
+class HistogramFamily(Family):
+    kind = "summary"
+
+    def child(self, label: str) -> Histogram:
+        histogram = self.children.get(label)
+        if histogram is None:
+            histogram = self.children[label] = Histogram()
+        return histogram
+
+    def observe(self, label: str, seconds: float) -> None:
+        self.child(label).observe(seconds)
+
+    def time(self, label: str) -> Timer:
+        """Time a block: `with STAGE_LATENCY.time("embed"): ...`."""
+        return Timer(self.child(label))
+
+
+class CounterFamily(Family):
+    kind = "counter"
+
+    def inc(self, label: str, amount: float = 1) -> None:
+        self.children[label] = self.children.get(label, 0) + amount
+
+
+class GaugeFamily(Family):
+    kind = "gauge"
+
+
+class Metrics:
+    """Registry of metric families, in registration order."""
+
+    def __init__(self, prefix: str = METRIC_PREFIX):
+        self.prefix = prefix
+        self.families: List[Family] = []
+        self.started = time.time()
+
+    def _register(self, family: Family) -> Family:
+        self.families.append(family)
+        return family
+
+    def histogram(self, name: str, label: str, help: str) -> HistogramFamily:
+        return self._register(HistogramFamily(name, label, help))
+
+    def counter(self, name: str, label: str, help: str) -> CounterFamily:
+        return self._register(CounterFamily(name, label, help))
+
+    def gauge(self, name: str, label: str, help: str) -> GaugeFamily:
+        return self._register(GaugeFamily(name, label, help))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Every family as {name: {label value: summary or number}}."""
+        result: Dict[str, Any] = {"uptime_s": round(time.time() - self.started, 1)}
+        for family in self.families:
+            if isinstance(family, HistogramFamily):
+                result[family.name] = {label: h.summary() for label, h in sorted(family.children.items())}
+            else:
+                result[family.name] = dict(sorted(family.children.items()))
+        return result
+
+    def reset(self) -> None:
+        """Drop all recorded values (families stay registered)."""
+        for family in self.families:
+            family.children = {}
+        self.started = time.time()
+
+    def render_prometheus(self) -> str:
+        """All families in Prometheus text exposition format."""
+        lines: List[str] = []
+        for family in self.families:
+            name = self.prefix + family.name
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for label, value in sorted(family.children.items()):
+                selector = f'{family.label}="{_escape(label)}"'
+                if isinstance(value, Histogram):
+                    for q in QUANTILES:
+                        lines.append(f'{name}{{{selector},quantile="{q}"}} {value.quantile(q):.6g}')
+                    lines.append(f"{name}_sum{{{selector}}} {value.sum:.6g}")
+                    lines.append(f"{name}_count{{{selector}}} {value.count}")
+                else:
+                    lines.append(f"{name}{{{selector}}} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.6g}"
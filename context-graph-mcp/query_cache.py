@@ -0,0 +1,110 @@
+"""
+In-memory cache of semantic query results.
+
+Entries are keyed by (embedding model, normalized query text, search
+mode, filters, limit, write sequence, trace count). The query text
+stands in for the query embedding: the providers are deterministic, so
+equal text under the same model means an equal vector, and keying on text
+lets a hit skip the embedding call as well as the ANN search.
+
+The write sequence is the trace index's write_seq, which every server and
+CLI process bumps in the same transaction as its index writes, so a store,
+outcome update or delete made by any of them makes older entries
+unreachable. The trace count in the key catches the skill scripts, which
+add to Chroma without the index. The server also clears the cache on its
+own writes. The cache is
+bounded both by entry count and by an estimate of its memory footprint,
+evicting least recently used entries first.
+
+Not thread-safe: the server only touches it from the event loop.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+QueryKey = Tuple[str, str, str, str, str, int, int, int]
+
+
+def query_cache_key(
+    model: str,
+    query: str,
+    mode: str,
+    category: Optional[str],
+    outcome: Optional[str],
+    limit: int,
+    write_seq: int,
+    count: int
+) -> QueryKey:
+    """Cache key for one query against one state of a collection."""
+    text_hash = hashlib.sha256(" ".join(query.split()).encode()).hexdigest()
+    return (model, text_hash, mode, category or "", outcome or "", limit, write_seq, count)
+
+
+def result_size(results: Any) -> int:
+    """Approximate memory footprint of a cached result, in bytes."""
+    return len(json.dumps(results, default=str))
+
+
+class QueryCache:
+    """LRU cache of query results bounded by entries and bytes."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._entries: "OrderedDict[QueryKey, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: QueryKey) -> Optional[Any]:
+        """Return cached results or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: QueryKey, results: Any) -> None:
+        """Store results, evicting least recently used entries past either bound."""
+        size = result_size(results)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[1]
+        self._entries[key] = (results, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry (called when the collection changes)."""
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and sizes."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
@@ -0,0 +1,130 @@
+"""
+Full-dimension vectors for reranking reduced-dimension ANN results.
+
+When a store keeps only a truncated prefix of each embedding in ChromaDB
+(context_graph.index.ann_dim), the complete vector is kept here, in
+.claude/rerank-vectors.sqlite3, so the top ANN candidates can be rescored
+against the full query embedding. Vectors are stored as float32, float16
+or int8 (symmetric, one scale per vector); each row records its own
+precision, so changing the setting only affects vectors stored afterwards.
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+STORE_FILENAME = "rerank-vectors.sqlite3"
+PRECISIONS = ("float32", "float16", "int8")
+
+
+def rerank_path(project_dir: Optional[str] = None) -> Path:
+    """Rerank store location, alongside .claude/chroma."""
+    base = Path(project_dir) / ".claude" if project_dir else Path(".claude")
+    return base / STORE_FILENAME
+
+
+def quantize(vector: np.ndarray, precision: str) -> Tuple[bytes, float]:
+    """Encode a vector as (blob, scale) at the given precision."""
+    if precision == "float32":
+        return vector.astype(np.float32).tobytes(), 1.0
+    if precision == "float16":
+        return vector.astype(np.float16).tobytes(), 1.0
+    if precision == "int8":
+        peak = float(np.abs(vector).max())
+        scale = peak / 127 if peak > 0 else 1.0
+        return np.round(vector / scale).astype(np.int8).tobytes(), scale
+    raise ValueError(f"Unknown rerank precision '{precision}'. Use one of: {', '.join(PRECISIONS)}")
+
+
+def dequantize(blob: bytes, precision: str, scale: float) -> np.ndarray:
+    """Decode a stored vector to float32."""
+    dtype = {"float32": np.float32, "float16": np.float16, "int8": np.int8}[precision]
+    return np.frombuffer(blob, dtype=dtype).astype(np.float32) * np.float32(scale)
+
+
+class RerankStore:
+    """SQLite table of quantized full-dimension vectors keyed by trace ID."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        # Takes effect on a new file only. At the default 4 KB, a 2 KB float16
+        # row would fill a whole page; 32 KB pages pack them densely.
+        self._conn.execute("PRAGMA page_size=32768")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS vectors (
+                id TEXT PRIMARY KEY,
+                precision TEXT NOT NULL,
+                scale REAL NOT NULL,
+                vector BLOB NOT NULL
+            )"""
+        )
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN ... COMMIT, rolled back if the body raises."""
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def put_many(self, ids: List[str], vectors: Iterable[List[float]], precision: str = "float16") -> None:
+        """Store (or replace) vectors."""
+        rows = []
+        for trace_id, vector in zip(ids, vectors):
+            blob, scale = quantize(np.asarray(vector, dtype=np.float32), precision)
+            rows.append((trace_id, precision, scale, blob))
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO vectors (id, precision, scale, vector) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+
+    def get_many(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Return float32 vectors for whichever IDs are present."""
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT id, precision, scale, vector FROM vectors WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for trace_id, precision, scale, blob in rows:
+                    found[trace_id] = dequantize(blob, precision, scale)
+        return found
+
+    def delete(self, ids: List[str]) -> None:
+        """Remove vectors."""
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany("DELETE FROM vectors WHERE id = ?", [(i,) for i in ids])
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry counts and stored bytes by precision."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT precision, COUNT(*), SUM(LENGTH(vector)) FROM vectors GROUP BY precision"
+            ).fetchall()
+        return {
+            "entries": sum(count for _, count, _ in rows),
+            "vector_bytes": sum(size or 0 for _, _, size in rows),
+            "by_precision": {precision: count for precision, count, _ in rows}
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,116 @@
+"""
+Size budgets, field projection and continuation cursors for tool responses.
+
+Tools that return traces (query, list, get) accept a budget as max_tokens
+or max_chars, capped by the server's CHARACTER_LIMIT, and an optional list
+of fields to return. Results are rendered one at a time and packed greedily
+in rank order. Each result is added while the response still fits, and
+packing stops at the first that does not, so the caller gets a prefix of
+the ranking plus a cursor for the rest. A single result too large for the
+budget on its own has its text cut to fit rather than being dropped.
+
+Tokens are estimated at CHARS_PER_TOKEN characters each. That is close for
+English prose and compact JSON under common tokenizers, and errs on the
+side of returning less.
+
+Continuation cursors are opaque to callers: base64 of a small JSON list
+naming the tool, a fingerprint of the request they continue and the
+position to resume from. A cursor presented with different arguments is
+rejected rather than applied to some other result list.
+"""
+
+import base64
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+CHARS_PER_TOKEN = 4
+MIN_BUDGET_CHARS = 200
+CURSOR_RESERVE = 160  # kept free for the continuation cursor and its note
+ELLIPSIS = "…"
+
+
+def char_budget(limit: int, max_tokens: Optional[int] = None, max_chars: Optional[int] = None) -> int:
+    """Characters a response may use: the tightest of limit, max_chars and max_tokens."""
+    budget = limit
+    if max_chars is not None:
+        budget = min(budget, max_chars)
+    if max_tokens is not None:
+        budget = min(budget, max_tokens * CHARS_PER_TOKEN)
+    if budget < MIN_BUDGET_CHARS:
+        raise ValueError(
+            f"Budget too small; allow at least {MIN_BUDGET_CHARS} characters "
+            f"({MIN_BUDGET_CHARS // CHARS_PER_TOKEN} tokens)"
+        )
+    return budget
+
+
+def select_fields(fields: Optional[Sequence[str]], available: Sequence[str]) -> List[str]:
+    """Requested fields in canonical order, always with "id"; every field when none are named."""
+    if not fields:
+        return list(available)
+    unknown = sorted(set(fields) - set(available))
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(available)}")
+    return [name for name in available if name == "id" or name in fields]
+
+
+def project(entry: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    """The selected fields of an entry (absent ones are skipped)."""
+    return {name: entry[name] for name in fields if name in entry}
+
+
+def compact_json(value: Any) -> str:
+    """JSON without indentation or padding."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def pack(blocks: Sequence[str], budget: int, separator: int = 1) -> int:
+    """Number of leading blocks that fit in budget characters, separator characters apart."""
+    used = 0
+    for count, block in enumerate(blocks):
+        used += len(block) + (separator if count else 0)
+        if used > budget:
+            return count
+    return len(blocks)
+
+
+def fit_text(render: Callable[[str], str], text: str, budget: int) -> int:
+    """Length of the longest prefix of text whose rendering fits in budget (0 if none does).
+
+    Rendering may escape or wrap the text, so lengths are measured, not
+    computed: a binary search over prefix lengths.
+    """
+    if len(render(text)) <= budget:
+        return len(text)
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if len(render(text[:middle])) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Short digest of the arguments that define a result list."""
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:12]
+
+
+def encode_continuation(tool: str, fingerprint: str, position: int) -> str:
+    """Opaque cursor resuming a tool's results at position."""
+    return base64.urlsafe_b64encode(compact_json([tool, fingerprint, position]).encode()).decode().rstrip("=")
+
+
+def decode_continuation(cursor: str, tool: str, fingerprint: str) -> int:
+    """Position a cursor resumes at; raises ValueError if it is malformed or for another request."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_tool, cursor_fingerprint, position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        position = int(position)
+    except Exception:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    if cursor_tool != tool or cursor_fingerprint != fingerprint or position < 0:
+        raise ValueError("Invalid cursor: it continues a different request (repeat the original arguments)")
+    return position
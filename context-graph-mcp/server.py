@@ -11,31 +11,213 @@ Usage:
     python server.py
 """
 
+import argparse
 import asyncio
+import functools
+import importlib.util
 import json
 import os
 import hashlib
-from datetime import datetime
+import re
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime, timedelta
 from enum import Enum
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Awaitable, Callable, Iterable, Sequence, TextIO
 
 import httpx
-import chromadb
-from chromadb.config import Settings
-from pydantic import BaseModel, Field, field_validator, ConfigDict
+import numpy as np
+from pydantic import BaseModel, Field, field_validator, ConfigDict, ValidationError
+from mcp import types as mcp_types
 from mcp.server.fastmcp import FastMCP, Context
+from mcp.server.lowlevel.server import request_ctx
+
+from embedding_cache import EmbeddingCache, cache_key, cache_path
+from flat_index import FlatIndex, flat_index_path
+from metrics import Metrics
+from query_cache import QueryCache, query_cache_key
+from response_budget import (
+    CURSOR_RESERVE, ELLIPSIS, char_budget, compact_json, decode_continuation, encode_continuation,
+    fit_text, pack, project, request_fingerprint, select_fields
+)
+from rerank_store import PRECISIONS, RerankStore, rerank_path
+from trace_archive import VECTOR_PRECISIONS, TraceArchive, archive_path
+from trace_export import decode_embedding, export_header, iter_record_batches, read_header, trace_line
+from trace_index import TraceIndex, encode_cursor, index_path
+from trace_wal import TraceWAL, WALLocked, match_queued, wal_path
 
 # ─────────────────────────────────────────────────────────────────
 # Server Configuration
 # ─────────────────────────────────────────────────────────────────
 
-mcp = FastMCP("context_graph_mcp")
-
 EMBEDDING_MODEL = "voyage-3"  # or voyage-3-lite for faster/cheaper
 EMBEDDING_DIM = 1024
 CHARACTER_LIMIT = 25000
-VOYAGE_API_URL = "https://api.voyageai.com/v1/embeddings"
+VOYAGE_API_URL = os.environ.get("VOYAGE_API_URL", "https://api.voyageai.com/v1/embeddings")
+EMBEDDING_BATCH_SIZE = 128  # inputs per Voyage request
+EMBEDDING_BATCH_CHARS = 320000  # ~80K tokens, safely under Voyage's per-request token cap
+
+# Embedding provider: "voyage" (remote API) or "local" (CPU-only hashed n-grams).
+# Per project: .claude/config/project.json -> {"context_graph": {"embedding_provider": "local"}}
+EMBEDDING_PROVIDER = os.environ.get("CONTEXT_GRAPH_EMBEDDING_PROVIDER", "voyage")
+LOCAL_EMBEDDING_DIM = int(os.environ.get("CONTEXT_GRAPH_LOCAL_EMBEDDING_DIM", "384"))
+
+# Micro-batching of concurrent embedding calls into one Voyage request
+EMBEDDING_BATCHING_ENABLED = os.environ.get("CONTEXT_GRAPH_EMBEDDING_BATCHING", "1") != "0"
+EMBEDDING_BATCH_WINDOW_MS = float(os.environ.get("CONTEXT_GRAPH_BATCH_WINDOW_MS", "2.0"))
+EMBEDDING_BATCH_MAX = int(os.environ.get("CONTEXT_GRAPH_BATCH_MAX", str(EMBEDDING_BATCH_SIZE)))
+
+# HTTP connection pool (shared by every embedding call for the server lifetime)
+HTTP_TIMEOUT = float(os.environ.get("CONTEXT_GRAPH_HTTP_TIMEOUT", "30.0"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("CONTEXT_GRAPH_HTTP_CONNECT_TIMEOUT", "5.0"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("CONTEXT_GRAPH_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("CONTEXT_GRAPH_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("CONTEXT_GRAPH_HTTP_KEEPALIVE_EXPIRY", "60.0"))
+HTTP2_ENABLED = os.environ.get("CONTEXT_GRAPH_HTTP2", "1") != "0"
+
+# Open the default project's store and the HTTP pool right after the MCP handshake
+PREWARM_ENABLED = os.environ.get("CONTEXT_GRAPH_PREWARM", "1") != "0"
+
+# Shared server (`server.py serve`): one process serving many MCP clients over HTTP or a Unix socket
+SERVE_HOST = os.environ.get("CONTEXT_GRAPH_SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.environ.get("CONTEXT_GRAPH_SERVE_PORT", "8765"))
+SERVE_SOCKET = os.environ.get("CONTEXT_GRAPH_SERVE_SOCKET")
+SERVE_MAX_SESSIONS = int(os.environ.get("CONTEXT_GRAPH_SERVE_MAX_SESSIONS", "64"))
+SERVE_SESSION_IDLE_TIMEOUT = float(os.environ.get("CONTEXT_GRAPH_SERVE_SESSION_IDLE_TIMEOUT", "1800"))
+SERVE_SHUTDOWN_GRACE = int(os.environ.get("CONTEXT_GRAPH_SERVE_SHUTDOWN_GRACE", "10"))  # seconds for calls under way
+# Tool calls one MCP session may run at once; further calls wait (0 = unlimited)
+SESSION_MAX_CONCURRENCY = int(os.environ.get("CONTEXT_GRAPH_SESSION_CONCURRENCY", "8"))
+
+# ChromaDB calls are blocking; they run on a bounded thread pool
+CHROMA_MAX_WORKERS = int(os.environ.get("CONTEXT_GRAPH_CHROMA_WORKERS", "8"))
+
+# Vector index defaults for new stores; per project: context_graph.index in project.json
+INDEX_METRIC = os.environ.get("CONTEXT_GRAPH_INDEX_METRIC", "cosine")  # cosine | ip | l2
+INDEX_M = 16  # HNSW graph degree (max_neighbors)
+INDEX_EF_CONSTRUCTION = 100
+INDEX_EF_SEARCH = 100
+# "flat" answers vector queries by exact search over .claude/flat-index instead of HNSW
+INDEX_BACKEND = os.environ.get("CONTEXT_GRAPH_INDEX_BACKEND", "hnsw")  # hnsw | flat
+# Reduced-dimension ANN (index.ann_dim) reranks this many candidates per result
+RERANK_PRECISION = "float16"
+RERANK_CANDIDATES = int(os.environ.get("CONTEXT_GRAPH_RERANK_CANDIDATES", "10"))
+# Compaction moves traces matching context_graph.retention into .claude/archive
+ARCHIVE_PRECISION = "int8"
+COMPACTION_BATCH_SIZE = 5000
+# Near-duplicate traces (context_graph.dedupe) merge at or above this similarity
+DEDUPE_THRESHOLD = float(os.environ.get("CONTEXT_GRAPH_DEDUPE_THRESHOLD", "0.95"))
+DEDUPE_NEIGHBOURS = 5  # neighbours checked per trace by the offline pass
+COLLECTION_NAME = "traces"
+MIGRATION_COLLECTION_NAME = "traces_migration"
+
+# Open project stores are capped; least recently used and idle ones are closed
+CHROMA_MAX_OPEN_STORES = int(os.environ.get("CONTEXT_GRAPH_MAX_OPEN_STORES", "16"))
+CHROMA_IDLE_TIMEOUT = float(os.environ.get("CONTEXT_GRAPH_STORE_IDLE_TIMEOUT", "900"))
+CHROMA_SWEEP_INTERVAL = 60.0  # seconds between idle sweeps
+CHROMA_CLOSE_GRACE = 5.0  # an evicted store stays usable this long for calls already under way
+
+# Persistent embedding cache (.claude/embedding-cache.sqlite3, shared with the CLI scripts)
+EMBEDDING_CACHE_ENABLED = os.environ.get("CONTEXT_GRAPH_EMBEDDING_CACHE", "1") != "0"
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.environ.get("CONTEXT_GRAPH_EMBEDDING_CACHE_MEMORY_ENTRIES", "2048"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("CONTEXT_GRAPH_EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+
+# Cross-project queries: per-store timeout (seconds)
+FEDERATED_TIMEOUT = float(os.environ.get("CONTEXT_GRAPH_FEDERATED_TIMEOUT", "5.0"))
+
+# In-memory cache of query results, invalidated by any write to the collection
+QUERY_CACHE_ENABLED = os.environ.get("CONTEXT_GRAPH_QUERY_CACHE", "1") != "0"
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("CONTEXT_GRAPH_QUERY_CACHE_ENTRIES", "256"))
+QUERY_CACHE_MAX_MB = float(os.environ.get("CONTEXT_GRAPH_QUERY_CACHE_MB", "16"))
+
+# Write-behind stores: logged to .claude/trace-wal.ndjson, embedded and added in groups in the background.
+# Per project: context_graph.write_behind in project.json
+WRITE_BEHIND = os.environ.get("CONTEXT_GRAPH_WRITE_BEHIND", "0") != "0"
+WRITE_BEHIND_GROUP_MAX = int(os.environ.get("CONTEXT_GRAPH_WRITE_BEHIND_GROUP_MAX", str(EMBEDDING_BATCH_SIZE)))
+WRITE_BEHIND_WINDOW_MS = float(os.environ.get("CONTEXT_GRAPH_WRITE_BEHIND_WINDOW_MS", "50"))
+WRITE_BEHIND_SETTLE_TIMEOUT = float(os.environ.get("CONTEXT_GRAPH_WRITE_BEHIND_SETTLE_TIMEOUT", "10"))
+WRITE_BEHIND_RETRY_MAX = 60.0  # longest wait (seconds) between retries of a failing group
+
+# Prometheus text-format metrics file (e.g. for node_exporter's textfile collector)
+METRICS_FILE = os.environ.get("CONTEXT_GRAPH_METRICS_FILE")
+METRICS_INTERVAL = float(os.environ.get("CONTEXT_GRAPH_METRICS_INTERVAL", "15"))
+
+metrics = Metrics()
+TOOL_LATENCY = metrics.histogram("tool_duration_seconds", "tool", "Wall time of MCP tool calls")
+STAGE_LATENCY = metrics.histogram("stage_duration_seconds", "stage", "Wall time of internal stages")
+TOOL_ERRORS = metrics.counter("tool_errors_total", "tool", "Tool calls that returned an error")
+TOOL_RESPONSE_CHARS = metrics.counter("tool_response_chars_total", "tool", "Characters returned by tools")
+EMBEDDING_REQUESTS = metrics.counter("embedding_requests_total", "provider", "Embedding provider calls")
+EMBEDDING_TEXTS = metrics.counter("embedding_texts_total", "provider", "Texts sent to the embedding provider")
+EMBEDDING_BYTES = metrics.counter("embedding_bytes_total", "provider", "UTF-8 bytes sent to the embedding provider")
+EMBEDDING_CACHE_HITS = metrics.counter("embedding_cache_hits_total", "project", "Embedding cache hits")
+EMBEDDING_CACHE_MISSES = metrics.counter("embedding_cache_misses_total", "project", "Embedding cache misses")
+QUERY_CACHE_HITS = metrics.counter("query_cache_hits_total", "project", "Query result cache hits")
+QUERY_CACHE_MISSES = metrics.counter("query_cache_misses_total", "project", "Query result cache misses")
+SESSION_WAITS = metrics.counter("session_waits_total", "tool", "Tool calls that waited for a free session slot")
+STORE_TRACES = metrics.gauge("store_traces", "project", "Traces in each open store")
+STORE_DISK_BYTES = metrics.gauge("store_disk_bytes", "project", "Disk used by each open store and its sidecars")
+STORE_VECTOR_BYTES = metrics.gauge("store_vector_bytes", "project", "Estimated resident vector memory per open store")
+ARCHIVE_DISK_BYTES = metrics.gauge("archive_disk_bytes", "project", "Disk used by each open store's archive")
+QUEUED_TRACES = metrics.gauge("queued_traces", "project", "Write-behind traces not yet in the store")
+
+
+_resource_users = 0
+_background_tasks: List[asyncio.Task] = []
+
+@asynccontextmanager
+async def server_resources():
+    """Hold the shared stores, caches and background tasks open.
+
+    Entries nest: the first starts the background tasks and the last to
+    exit closes everything. Under `serve` the HTTP app holds the resources
+    for the daemon's lifetime and each MCP session's lifespan nests inside
+    it, so sessions come and go without closing the stores.
+    """
+    global _resource_users
+    _resource_users += 1
+    if _resource_users == 1:
+        _background_tasks.append(asyncio.create_task(sweep_stores_periodically()))
+        if METRICS_FILE:
+            _background_tasks.append(asyncio.create_task(write_metrics_periodically()))
+        if not PREWARM_ON_INITIALIZED:
+            await start_prewarm()
+    try:
+        yield
+    finally:
+        _resource_users -= 1
+        if _resource_users == 0:
+            for task in _background_tasks:
+                task.cancel()
+            _background_tasks.clear()
+            cancel_prewarm()
+            await close_write_behind_queues()
+            if METRICS_FILE:
+                await write_metrics_file(METRICS_FILE)
+            await close_http_client()
+            close_embedding_caches()
+            shutdown_chroma_executor()
+            close_chroma_stores()
+            close_trace_indexes()
+            close_rerank_stores()
+            close_flat_indexes()
+            close_trace_archives()
+
+@asynccontextmanager
+async def server_lifespan(server: "FastMCP"):
+    """Own server-lifetime resources and release them on shutdown."""
+    async with server_resources():
+        yield {}
+
+
+mcp = FastMCP("context_graph_mcp", lifespan=server_lifespan)
 
 # ─────────────────────────────────────────────────────────────────
 # Enums
@@ -46,6 +228,12 @@ class ResponseFormat(str, Enum):
     MARKDOWN = "markdown"
     JSON = "json"
 
+class SearchMode(str, Enum):
+    """Retrieval strategy for trace queries."""
+    HYBRID = "hybrid"
+    VECTOR = "vector"
+    LEXICAL = "lexical"
+
 class TraceOutcome(str, Enum):
     """Possible outcomes for a trace."""
     PENDING = "pending"
@@ -117,6 +305,10 @@ class QueryTracesInput(BaseModel):
         default=None,
         description="Filter by outcome (optional)"
     )
+    mode: SearchMode = Field(
+        default=SearchMode.VECTOR,
+        description="Retrieval mode: hybrid (vector + BM25), vector, or lexical (no embedding call)"
+    )
     response_format: ResponseFormat = Field(
         default=ResponseFormat.MARKDOWN,
         description="Output format: markdown for human-readable, json for machine-readable"
@@ -183,43 +375,837 @@ class ListTracesInput(BaseModel):
         description="Number of results to skip for pagination",
         ge=0
     )
+    cursor: Optional[str] = Field(
+        default=None,
+        description="Continuation cursor from a previous page (keyset pagination)"
+    )
     response_format: ResponseFormat = Field(
         default=ResponseFormat.MARKDOWN,
         description="Output format"
     )
 
+# ─────────────────────────────────────────────────────────────────
+# Project Configuration
+# ─────────────────────────────────────────────────────────────────
+
+_project_configs: Dict[str, tuple] = {}
+
+def get_project_config(project_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Read the "context_graph" section of .claude/config/project.json.
+
+    Returns an empty dict when the file or section is missing. The parsed
+    file is cached until its modification time changes.
+    """
+    base = Path(project_dir) if project_dir else Path(".")
+    config_path = base / ".claude" / "config" / "project.json"
+
+    try:
+        mtime = config_path.stat().st_mtime
+    except OSError:
+        return {}
+
+    cached = _project_configs.get(str(config_path))
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(config_path) as f:
+        config = json.load(f).get("context_graph") or {}
+    _project_configs[str(config_path)] = (mtime, config)
+    return config
+
 # ─────────────────────────────────────────────────────────────────
 # ChromaDB Client
 # ─────────────────────────────────────────────────────────────────
 
-_collection_cache = {}
+class OpenStore:
+    """An open project store: its Chroma client, collection and usage."""
 
-def get_chroma_client(project_dir: Optional[str] = None):
-    """Get or create ChromaDB client for a project."""
-    cache_key = project_dir or "default"
+    def __init__(self, project_dir: Optional[str], client, collection):
+        self.project_dir = project_dir
+        self.client = client
+        self.collection = collection
+        self.opened_at = self.last_used = time.monotonic()
+        self.active = 0
 
-    if cache_key in _collection_cache:
-        return _collection_cache[cache_key]
+_stores: "OrderedDict[str, OpenStore]" = OrderedDict()
+_retired_stores: List[OpenStore] = []
+_store_owners: Dict[int, OpenStore] = {}
+_stores_lock = threading.Lock()
+_opening_locks: Dict[str, threading.Lock] = {}
+_store_evictions = 0
 
-    # Determine database path
-    if project_dir:
-        db_dir = Path(project_dir) / ".claude" / "chroma"
-    else:
-        db_dir = Path(".claude/chroma")
+def get_chroma_client(project_dir: Optional[str] = None):
+    """Get or create ChromaDB client for a project.
 
+    Open stores are kept in an LRU capped at CHROMA_MAX_OPEN_STORES; opening
+    one more retires the least recently used (see sweep_stores).
+    """
+    cache_key = project_dir or "default"
+    collection = _touch_store(cache_key)
+    if collection is not None:
+        return collection
+
+    # Open outside the shared lock so lookups of other stores never wait on
+    # it. Concurrent first calls for one store wait on its opening lock
+    # instead of opening it twice: clients for one path share a chromadb
+    # System, so closing a duplicate would break the one kept.
+    with _stores_lock:
+        opening = _opening_locks.setdefault(cache_key, threading.Lock())
+    with opening:
+        collection = _touch_store(cache_key)
+        if collection is not None:
+            return collection
+        client, collection = _open_collection(project_dir)
+        with _stores_lock:
+            store = _stores[cache_key] = OpenStore(project_dir, client, collection)
+            _store_owners[id(collection)] = store
+            store.last_used = time.monotonic()
+    sweep_stores()
+    return store.collection
+
+def _touch_store(cache_key: str):
+    """Mark a cached store as used and return its collection (None if not open)."""
+    with _stores_lock:
+        store = _stores.get(cache_key)
+        if store is None:
+            return None
+        _stores.move_to_end(cache_key)
+        store.last_used = time.monotonic()
+        return store.collection
+
+def get_index_config(project_dir: Optional[str] = None) -> Dict[str, Any]:
+    """HNSW settings for a project's collection, as a Chroma "hnsw" configuration.
+
+    Reads context_graph.index ({"metric", "M", "ef_construction",
+    "ef_search"}) from .claude/config/project.json. Metric and graph
+    parameters apply when a store is created (or migrated); ef_search can
+    change on an existing store.
+    """
+    config = get_project_config(project_dir).get("index") or {}
+    metric = config.get("metric", INDEX_METRIC)
+    if metric not in ("cosine", "ip", "l2"):
+        raise ValueError(f"Unknown index metric '{metric}'. Use 'cosine', 'ip' or 'l2'.")
+
+    hnsw = {
+        "space": metric,
+        "max_neighbors": int(config.get("M", INDEX_M)),
+        "ef_construction": int(config.get("ef_construction", INDEX_EF_CONSTRUCTION)),
+        "ef_search": int(config.get("ef_search", INDEX_EF_SEARCH)),
+    }
+    for key in ("max_neighbors", "ef_construction", "ef_search"):
+        if hnsw[key] < 2:
+            raise ValueError(f"Index setting {key} must be at least 2, got {hnsw[key]}")
+    return hnsw
+
+def get_index_backend(project_dir: Optional[str] = None) -> str:
+    """Which index answers vector queries: "hnsw" (ChromaDB) or "flat" (exact).
+
+    Reads context_graph.index.backend. Either way ChromaDB stays the store
+    of record; the flat index is a derived copy rebuilt from it on drift.
+    """
+    backend = (get_project_config(project_dir).get("index") or {}).get("backend", INDEX_BACKEND)
+    if backend not in ("hnsw", "flat"):
+        raise ValueError(f"Unknown index backend '{backend}'. Use 'hnsw' or 'flat'.")
+    return backend
+
+def get_vector_storage(project_dir: Optional[str] = None) -> Dict[str, Any]:
+    """How a project's vectors are stored: ANN dimension and rerank precision.
+
+    context_graph.index.ann_dim keeps only the first ann_dim components
+    (renormalized) in ChromaDB and the full vector, at rerank_precision
+    (float32 | float16 | int8), in .claude/rerank-vectors.sqlite3. ann_dim
+    applies when a store is created or migrated; None stores full vectors.
+    """
+    config = get_project_config(project_dir).get("index") or {}
+    precision = config.get("rerank_precision", RERANK_PRECISION)
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown rerank precision '{precision}'. Use one of: {', '.join(PRECISIONS)}")
+
+    ann_dim = config.get("ann_dim")
+    if ann_dim is not None and int(ann_dim) < 2:
+        raise ValueError(f"Index setting ann_dim must be at least 2, got {ann_dim}")
+    if ann_dim is not None and int(ann_dim) >= get_embedding_provider(project_dir).dim:
+        ann_dim = None
+    return {"ann_dim": int(ann_dim) if ann_dim else None, "rerank_precision": precision}
+
+def get_retention_policy(
+    project_dir: Optional[str] = None,
+    max_age_days: Optional[int] = None,
+    outcomes: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Which traces compaction archives, from context_graph.retention.
+
+    max_age_days is either a number of days (for every outcome, or only for
+    those listed in "outcomes") or a per-outcome mapping such as
+    {"success": 30, "failure": 90}; outcomes without an entry are kept.
+    vector_precision (int8 | float16 | none) sets how archived embeddings
+    are stored. Explicit arguments override the configured ages.
+    """
+    config = get_project_config(project_dir).get("retention") or {}
+    ages = max_age_days
+    if ages is None:
+        ages = config.get("max_age_days")
+        outcomes = outcomes or config.get("outcomes")
+    if ages is None:
+        raise ValueError(
+            "No retention policy: set context_graph.retention.max_age_days in "
+            ".claude/config/project.json or pass max_age_days."
+        )
+    if not isinstance(ages, dict):
+        ages = {outcome: ages for outcome in outcomes} if outcomes else {"*": ages}
+    for outcome, days in ages.items():
+        if not isinstance(days, (int, float)) or days < 0:
+            raise ValueError(f"Retention age for '{outcome}' must be a non-negative number of days, got {days!r}")
+
+    precision = config.get("vector_precision", ARCHIVE_PRECISION)
+    if precision not in VECTOR_PRECISIONS:
+        raise ValueError(f"Unknown archive vector precision '{precision}'. Use one of: {', '.join(VECTOR_PRECISIONS)}")
+    return {"max_age_days": ages, "vector_precision": precision}
+
+def get_dedupe_config(project_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Near-duplicate settings from context_graph.dedupe.
+
+    {"on_store": bool, "threshold": float}: with on_store, a new trace whose
+    nearest neighbour in the same category is at least threshold similar is
+    merged into it instead of being inserted.
+    """
+    config = get_project_config(project_dir).get("dedupe") or {}
+    threshold = float(config.get("threshold", DEDUPE_THRESHOLD))
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Dedupe threshold must be in (0, 1], got {threshold}")
+    return {"on_store": bool(config.get("on_store", False)), "threshold": threshold}
+
+def collection_ann_dim(collection) -> Optional[int]:
+    """Dimension of the vectors in a collection's ANN index, if reduced."""
+    return (collection.metadata or {}).get("ann_dim")
+
+def collection_vector_dim(collection) -> int:
+    """Dimension of the vectors a collection stores."""
+    metadata = collection.metadata or {}
+    return metadata.get("ann_dim") or metadata.get("embedding_dim") or EMBEDDING_DIM
+
+def truncate_embedding(vector: List[float], dim: int) -> List[float]:
+    """Leading dim components of a vector, rescaled to unit length."""
+    head = np.asarray(vector[:dim], dtype=np.float32)
+    norm = float(np.linalg.norm(head))
+    return (head / norm if norm > 0 else head).tolist()
+
+def collection_space(collection) -> str:
+    """Distance metric a collection's HNSW index was built with."""
+    return ((collection.configuration or {}).get("hnsw") or {}).get("space", "l2")
+
+def similarity_from_distance(distance: float, space: str) -> float:
+    """Cosine similarity for a Chroma distance.
+
+    Both providers return unit-length vectors, so every metric maps onto
+    cosine similarity: Chroma reports 1 - cos for cosine, 1 - dot for ip,
+    and the squared euclidean distance (2 - 2cos) for l2.
+    """
+    if space == "l2":
+        return 1 - distance / 2
+    return 1 - distance
+
+def chroma_path(project_dir: Optional[str] = None) -> Path:
+    """ChromaDB directory for a project."""
+    return Path(project_dir) / ".claude" / "chroma" if project_dir else Path(".claude/chroma")
+
+def _finish_interrupted_migration(client) -> None:
+    """Complete a migration that stopped after the old collection was dropped."""
+    names = {c if isinstance(c, str) else c.name for c in client.list_collections()}
+    if MIGRATION_COLLECTION_NAME in names and COLLECTION_NAME not in names:
+        client.get_collection(MIGRATION_COLLECTION_NAME).modify(name=COLLECTION_NAME)
+
+def _open_collection(project_dir: Optional[str] = None):
+    """Open a project's client and traces collection (blocking)."""
+    # Determine database path
+    db_dir = chroma_path(project_dir)
     db_dir.mkdir(parents=True, exist_ok=True)
 
-    # Create ChromaDB client with persistent storage
+    # Create ChromaDB client with persistent storage (imported here: chromadb
+    # takes longer to import than the rest of the server together)
+    import chromadb
     client = chromadb.PersistentClient(path=str(db_dir))
+    _finish_interrupted_migration(client)
 
-    # Get or create collection
+    # Get or create collection, recording which embeddings it is built with
+    provider = get_embedding_provider(project_dir)
+    hnsw = get_index_config(project_dir)
+    storage = get_vector_storage(project_dir)
+    reduced = {"ann_dim": storage["ann_dim"]} if storage["ann_dim"] else {}
     collection = client.get_or_create_collection(
-        name="traces",
-        metadata={"description": "Decision traces with semantic search"}
+        name=COLLECTION_NAME,
+        metadata={"description": "Decision traces with semantic search", **provider.describe(), **reduced},
+        configuration={"hnsw": hnsw}
     )
 
-    _collection_cache[cache_key] = collection
-    return collection
+    metadata = collection.metadata or {}
+    if "embedding_provider" not in metadata:
+        # Stores created before providers were recorded hold voyage-3 vectors
+        built_with = provider if collection.count() == 0 else VoyageProvider()
+        collection.modify(metadata={**metadata, **built_with.describe()})
+
+    current = (collection.configuration or {}).get("hnsw") or {}
+    if current.get("ef_search") != hnsw["ef_search"]:
+        collection.modify(configuration={"hnsw": {"ef_search": hnsw["ef_search"]}})
+
+    return client, collection
+
+def migrate_collection(project_dir: Optional[str] = None, batch_size: int = 1000) -> Dict[str, Any]:
+    """Rebuild a store's collection with its configured index settings (blocking).
+
+    Copies every trace (ids, embeddings, documents, metadata) into a new
+    collection, then drops the old one and renames the copy. If the process
+    stops part way, the old collection is still intact (or, past the drop,
+    the next open finishes the rename). Run it while no server is using the
+    store.
+
+    Moving a full-dimension store to a reduced ann_dim also writes the full
+    vectors to the rerank store. A store that already holds reduced vectors
+    cannot change ann_dim, since the dropped components are gone.
+    """
+    import chromadb
+    client = chromadb.PersistentClient(path=str(chroma_path(project_dir)))
+    rerank = None
+    try:
+        _finish_interrupted_migration(client)
+        hnsw = get_index_config(project_dir)
+        storage = get_vector_storage(project_dir)
+        old = client.get_collection(COLLECTION_NAME)
+        current = (old.configuration or {}).get("hnsw") or {}
+        before = {key: current.get(key) for key in ("space", "max_neighbors", "ef_construction")}
+        after = {key: hnsw[key] for key in before}
+        before["ann_dim"] = collection_ann_dim(old)
+        after["ann_dim"] = storage["ann_dim"]
+        if before["ann_dim"] is not None and after["ann_dim"] != before["ann_dim"]:
+            raise ValueError(
+                f"Store keeps {before['ann_dim']}-dim vectors; changing ann_dim needs the original "
+                f"embeddings. Re-embed the traces instead."
+            )
+        if before == after:
+            if current.get("ef_search") != hnsw["ef_search"]:
+                old.modify(configuration={"hnsw": {"ef_search": hnsw["ef_search"]}})
+            return {"migrated": False, "traces": old.count(), "index": {**after, "ef_search": hnsw["ef_search"]}}
+
+        try:
+            client.delete_collection(MIGRATION_COLLECTION_NAME)
+        except Exception:
+            pass
+        metadata = {key: value for key, value in (old.metadata or {}).items() if key != "ann_dim"}
+        if after["ann_dim"]:
+            metadata["ann_dim"] = after["ann_dim"]
+            rerank = RerankStore(rerank_path(project_dir))
+        new = client.create_collection(
+            name=MIGRATION_COLLECTION_NAME,
+            metadata=metadata,
+            configuration={"hnsw": hnsw}
+        )
+
+        total = old.count()
+        for offset in range(0, total, batch_size):
+            page = old.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+            embeddings = page["embeddings"]
+            if rerank is not None and before["ann_dim"] is None:
+                rerank.put_many(page["ids"], embeddings, precision=storage["rerank_precision"])
+                embeddings = [truncate_embedding(list(e), after["ann_dim"]) for e in embeddings]
+            new.add(
+                ids=page["ids"],
+                embeddings=embeddings,
+                documents=page["documents"],
+                metadatas=page["metadatas"]
+            )
+        if new.count() != total:
+            raise RuntimeError(f"Copied {new.count()} of {total} traces; old collection left in place")
+
+        client.delete_collection(COLLECTION_NAME)
+        new.modify(name=COLLECTION_NAME)
+        return {"migrated": True, "traces": total, "from": before, "index": {**after, "ef_search": hnsw["ef_search"]}}
+    finally:
+        client.close()
+        if rerank is not None:
+            rerank.close()
+
+def sweep_stores() -> None:
+    """Retire stores past the cap or idle timeout and close retired ones (blocking).
+
+    A retired store is dropped from the cache at once but only closed when
+    no ChromaDB call on it is running and it has been unused for
+    CHROMA_CLOSE_GRACE seconds, so tools that already hold its collection
+    can finish.
+    """
+    global _store_evictions
+
+    now = time.monotonic()
+    to_close = []
+    with _stores_lock:
+        for cache_key, store in list(_stores.items()):
+            over_cap = len(_stores) > CHROMA_MAX_OPEN_STORES
+            if over_cap or now - store.last_used > CHROMA_IDLE_TIMEOUT:
+                del _stores[cache_key]
+                _retired_stores.append(store)
+                _store_evictions += 1
+        for store in list(_retired_stores):
+            if store.active == 0 and now - store.last_used >= CHROMA_CLOSE_GRACE:
+                _retired_stores.remove(store)
+                _store_owners.pop(id(store.collection), None)
+                to_close.append(store)
+
+    for store in to_close:
+        store.client.close()
+
+async def sweep_stores_periodically() -> None:
+    """Background task retiring idle stores while the server runs."""
+    while True:
+        await asyncio.sleep(CHROMA_SWEEP_INTERVAL)
+        await run_chroma(sweep_stores)
+
+_prewarm_task: Optional[asyncio.Task] = None
+
+async def prewarm() -> None:
+    """Open the default project's store and the embedding connection pool.
+
+    Started once the client completes the MCP handshake, so the tool list
+    is served before chromadb is imported and the first tool call finds
+    the store open. Also replays write-behind traces left in the default
+    project's log. Does not create a store where there is none; failures
+    are ignored, since the first tool call that needs the resource will
+    report them.
+    """
+    try:
+        # Replay write-behind traces a previous run left in the log
+        await get_write_behind_queue(create=False)
+        if chroma_path().is_dir():
+            collection = await get_collection()
+            await run_chroma(collection.count)
+            await get_trace_index()
+        else:
+            await run_chroma(importlib.import_module, "chromadb")
+        provider = get_embedding_provider()
+        if provider.remote:
+            provider.check_available()
+            # Any response leaves a warm keep-alive connection in the pool
+            await get_http_client().head(VOYAGE_API_URL)
+    except Exception:
+        pass
+
+async def start_prewarm(notification: Optional[mcp_types.InitializedNotification] = None) -> None:
+    """MCP "initialized" handler: begin prewarm() in the background."""
+    global _prewarm_task
+    if PREWARM_ENABLED and _prewarm_task is None:
+        _prewarm_task = asyncio.create_task(prewarm())
+
+def cancel_prewarm() -> None:
+    """Stop a prewarm still in progress (at shutdown)."""
+    global _prewarm_task
+    task, _prewarm_task = _prewarm_task, None
+    if task is not None:
+        task.cancel()
+
+def install_prewarm_hook() -> bool:
+    """Run start_prewarm on MCP "initialized", after any handler already registered for it.
+
+    FastMCP has no public hook for that notification, so this goes through
+    the low-level server's handler table. Returns False if the table is not
+    there; server_resources then starts prewarm itself (test-server.py
+    checks the hook is in place).
+    """
+    handlers = getattr(getattr(mcp, "_mcp_server", None), "notification_handlers", None)
+    if not isinstance(handlers, dict):
+        return False
+    previous = handlers.get(mcp_types.InitializedNotification)
+
+    async def on_initialized(notification: mcp_types.InitializedNotification) -> None:
+        if previous is not None:
+            await previous(notification)
+        await start_prewarm(notification)
+
+    handlers[mcp_types.InitializedNotification] = on_initialized
+    return True
+
+PREWARM_ON_INITIALIZED = install_prewarm_hook()
+
+def close_chroma_stores() -> None:
+    """Close every open and retired store."""
+    with _stores_lock:
+        stores = list(_stores.values()) + _retired_stores
+        _stores.clear()
+        _retired_stores.clear()
+        _store_owners.clear()
+    for store in stores:
+        store.client.close()
+
+def store_stats() -> Dict[str, Any]:
+    """Open stores and the memory they hold (blocking).
+
+    vector_bytes estimates the resident float32 vectors (traces x dim);
+    disk_bytes is the size of the store's .claude/chroma directory.
+    """
+    with _stores_lock:
+        stores = list(_stores.values())
+        retired = len(_retired_stores)
+
+    now = time.monotonic()
+    entries = []
+    for store in stores:
+        traces = store.collection.count()
+        dim = collection_vector_dim(store.collection)
+        db_dir = chroma_path(store.project_dir)
+        rerank_file = rerank_path(store.project_dir)
+        flat_dir = flat_index_path(store.project_dir)
+        archive_dir = archive_path(store.project_dir)
+        entries.append({
+            "project_dir": store.project_dir or os.getcwd(),
+            "traces": traces,
+            "dim": dim,
+            "vector_bytes": traces * dim * 4,
+            "disk_bytes": sum(f.stat().st_size for f in db_dir.rglob("*") if f.is_file()),
+            "rerank_disk_bytes": rerank_file.stat().st_size if rerank_file.exists() else 0,
+            "flat_disk_bytes": sum(f.stat().st_size for f in flat_dir.glob("*") if f.is_file()),
+            "archive_disk_bytes": sum(f.stat().st_size for f in archive_dir.glob("*.npz")),
+            "idle_s": round(now - store.last_used, 1),
+            "active_calls": store.active
+        })
+
+    return {
+        "open_stores": len(entries),
+        "max_open_stores": CHROMA_MAX_OPEN_STORES,
+        "idle_timeout_s": CHROMA_IDLE_TIMEOUT,
+        "evictions": _store_evictions,
+        "pending_close": retired,
+        "vector_bytes": sum(e["vector_bytes"] for e in entries),
+        "disk_bytes": sum(e["disk_bytes"] for e in entries),
+        "stores": entries
+    }
+
+def check_collection_provider(collection, provider: "EmbeddingProvider") -> None:
+    """Refuse to mix embeddings from different providers in one collection."""
+    metadata = collection.metadata or {}
+    built_with = metadata.get("embedding_provider")
+    built_dim = metadata.get("embedding_dim")
+    if built_with is None:
+        return
+    if built_with != provider.name or built_dim != provider.dim:
+        raise ValueError(
+            f"Collection was built with {built_with} embeddings ({built_dim}-dim) but this project "
+            f"is configured for {provider.name} ({provider.dim}-dim). Set context_graph.embedding_provider "
+            f"in .claude/config/project.json to match, or re-embed the store."
+        )
+
+_chroma_executor: Optional[ThreadPoolExecutor] = None
+_write_locks: Dict[str, asyncio.Lock] = {}
+
+def get_chroma_executor() -> ThreadPoolExecutor:
+    """Get the bounded thread pool used for all ChromaDB access."""
+    global _chroma_executor
+    if _chroma_executor is None:
+        _chroma_executor = ThreadPoolExecutor(max_workers=CHROMA_MAX_WORKERS, thread_name_prefix="chroma")
+    return _chroma_executor
+
+def shutdown_chroma_executor() -> None:
+    """Wait for in-flight ChromaDB work and stop the thread pool."""
+    global _chroma_executor
+    executor, _chroma_executor = _chroma_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def _owning_store(fn, args) -> Optional[OpenStore]:
+    """The open store whose collection a call runs against, if any."""
+    for candidate in (getattr(fn, "__self__", None), *args):
+        store = _store_owners.get(id(candidate))
+        if store is not None and store.collection is candidate:
+            return store
+    return None
+
+async def run_chroma(fn, *args, **kwargs):
+    """Run a blocking ChromaDB call on the thread pool.
+
+    Keeps disk I/O and HNSW work off the event loop so one slow call does
+    not stall other in-flight requests. Calls on a collection count as
+    activity on its store, which keeps it from being closed mid-call.
+    """
+    loop = asyncio.get_running_loop()
+    store = _owning_store(fn, args)
+    if store is not None:
+        store.active += 1
+    try:
+        return await loop.run_in_executor(get_chroma_executor(), functools.partial(fn, *args, **kwargs))
+    finally:
+        if store is not None:
+            store.active -= 1
+            store.last_used = time.monotonic()
+
+def get_write_lock(project_dir: Optional[str] = None) -> asyncio.Lock:
+    """Per-collection lock that serializes writes; reads never take it."""
+    cache_key = project_dir or "default"
+    if cache_key not in _write_locks:
+        _write_locks[cache_key] = asyncio.Lock()
+    return _write_locks[cache_key]
+
+_collection_versions: Dict[str, int] = {}
+_query_caches: Dict[str, QueryCache] = {}
+
+def collection_version(project_dir: Optional[str] = None) -> int:
+    """Counter bumped on every write this server makes to a collection."""
+    return _collection_versions.get(project_dir or "default", 0)
+
+def bump_collection_version(project_dir: Optional[str] = None) -> None:
+    """Mark a collection as changed, invalidating its cached query results."""
+    cache_key = project_dir or "default"
+    _collection_versions[cache_key] = _collection_versions.get(cache_key, 0) + 1
+    cache = _query_caches.get(cache_key)
+    if cache is not None:
+        cache.clear()
+
+def get_query_cache(project_dir: Optional[str] = None) -> Optional[QueryCache]:
+    """Get the query result cache for a project (None when disabled)."""
+    if not QUERY_CACHE_ENABLED:
+        return None
+
+    cache_key = project_dir or "default"
+    if cache_key not in _query_caches:
+        _query_caches[cache_key] = QueryCache(
+            max_entries=QUERY_CACHE_MAX_ENTRIES,
+            max_bytes=int(QUERY_CACHE_MAX_MB * 1024 * 1024)
+        )
+    return _query_caches[cache_key]
+
+async def get_collection(project_dir: Optional[str] = None):
+    """Get a project's collection without blocking the event loop."""
+    collection = _touch_store(project_dir or "default")
+    if collection is not None:
+        return collection
+    return await run_chroma(get_chroma_client, project_dir)
+
+_trace_indexes: Dict[str, TraceIndex] = {}
+
+async def get_trace_index(project_dir: Optional[str] = None) -> TraceIndex:
+    """Get a project's sidecar listing index (.claude/trace-index.sqlite3)."""
+    cache_key = project_dir or "default"
+    if cache_key not in _trace_indexes:
+        index = await run_chroma(TraceIndex, index_path(project_dir))
+        if cache_key in _trace_indexes:
+            index.close()
+        else:
+            _trace_indexes[cache_key] = index
+    return _trace_indexes[cache_key]
+
+def close_trace_indexes() -> None:
+    """Close all open sidecar index files."""
+    while _trace_indexes:
+        _, index = _trace_indexes.popitem()
+        index.close()
+
+_rerank_stores: Dict[str, RerankStore] = {}
+
+async def get_rerank_store(project_dir: Optional[str] = None) -> RerankStore:
+    """Get a project's full-dimension vector store (.claude/rerank-vectors.sqlite3)."""
+    cache_key = project_dir or "default"
+    if cache_key not in _rerank_stores:
+        store = await run_chroma(RerankStore, rerank_path(project_dir))
+        if cache_key in _rerank_stores:
+            store.close()
+        else:
+            _rerank_stores[cache_key] = store
+    return _rerank_stores[cache_key]
+
+def close_rerank_stores() -> None:
+    """Close all open rerank stores."""
+    while _rerank_stores:
+        _, store = _rerank_stores.popitem()
+        store.close()
+
+_flat_indexes: Dict[str, FlatIndex] = {}
+
+async def get_flat_index(collection, project_dir: Optional[str] = None) -> Optional[FlatIndex]:
+    """Get a project's exact-search index (.claude/flat-index/), if it has one.
+
+    The index is opened when the flat backend is selected, or when a
+    previous run left one on disk, so that writes made while the backend is
+    switched off still reach it. Returns None otherwise.
+    """
+    cache_key = project_dir or "default"
+    dim = collection_vector_dim(collection)
+    index = _flat_indexes.get(cache_key)
+    if index is not None and index.dim == dim:
+        return index
+    if index is None and get_index_backend(project_dir) != "flat" and not flat_index_path(project_dir).is_dir():
+        return None
+
+    # A migration changed the vector dimension; reopening resets the files
+    opened = await run_chroma(FlatIndex, flat_index_path(project_dir), dim)
+    previous = _flat_indexes.get(cache_key)
+    if previous is not None and previous.dim == dim:
+        opened.close()
+        return previous
+    if previous is not None:
+        previous.close()
+    _flat_indexes[cache_key] = opened
+    return opened
+
+def close_flat_indexes() -> None:
+    """Close all open flat indexes."""
+    while _flat_indexes:
+        _, index = _flat_indexes.popitem()
+        index.close()
+
+def rebuild_flat_index(collection, index: FlatIndex, batch_size: int = 5000) -> int:
+    """Repopulate a flat index from its Chroma collection (blocking)."""
+    total = collection.count()
+
+    def batches():
+        for offset in range(0, total, batch_size):
+            page = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            yield (
+                page["ids"],
+                page["embeddings"],
+                [m.get("category") or "general" for m in page["metadatas"]],
+                [m.get("outcome") or "pending" for m in page["metadatas"]]
+            )
+
+    return index.rebuild(batches())
+
+async def get_synced_flat_index(
+    collection,
+    project_dir: Optional[str] = None,
+    chroma_count: Optional[int] = None
+) -> FlatIndex:
+    """Get the flat index for reading, rebuilding it if it drifted from Chroma.
+
+    Pass chroma_count when the caller has just counted the collection.
+    """
+    index = await get_flat_index(collection, project_dir)
+    if chroma_count is None:
+        chroma_count = await run_chroma(collection.count)
+    if chroma_count != await run_chroma(index.count):
+        async with get_write_lock(project_dir):
+            if await run_chroma(collection.count) != await run_chroma(index.count):
+                await run_chroma(rebuild_flat_index, collection, index)
+                bump_collection_version(project_dir)
+    return index
+
+_trace_archives: Dict[str, TraceArchive] = {}
+
+def get_trace_archive(project_dir: Optional[str] = None) -> TraceArchive:
+    """Get a project's archive of compacted traces (.claude/archive/).
+
+    Segments are only read when the archive is first searched.
+    """
+    cache_key = project_dir or "default"
+    if cache_key not in _trace_archives:
+        _trace_archives[cache_key] = TraceArchive(archive_path(project_dir))
+    return _trace_archives[cache_key]
+
+def close_trace_archives() -> None:
+    """Drop loaded archive segments."""
+    while _trace_archives:
+        _, archive = _trace_archives.popitem()
+        archive.close()
+
+def rebuild_trace_index(collection, index: TraceIndex, batch_size: int = 5000) -> int:
+    """Repopulate a sidecar index from its Chroma collection (blocking)."""
+    total = collection.count()
+
+    def batches():
+        for offset in range(0, total, batch_size):
+            page = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            yield page["ids"], page["documents"], page["metadatas"]
+
+    return index.rebuild(batches())
+
+def verify_trace_index(collection, index: TraceIndex, batch_size: int = 5000) -> Dict[str, Any]:
+    """Compare the sidecar index and its aggregate with ChromaDB (blocking)."""
+    chroma_counts: Dict[str, Dict[str, int]] = {}
+    chroma_total = collection.count()
+    for offset in range(0, chroma_total, batch_size):
+        page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        for metadata in page["metadatas"]:
+            category = metadata.get("category") or "general"
+            outcome = metadata.get("outcome") or "pending"
+            chroma_counts.setdefault(category, {})
+            chroma_counts[category][outcome] = chroma_counts[category].get(outcome, 0) + 1
+
+    aggregate = index.verify()
+    stored = index.category_counts()
+    drift = list(aggregate["drift"])
+    for category in sorted(set(stored) | set(chroma_counts)):
+        for outcome in sorted(set(stored.get(category, {})) | set(chroma_counts.get(category, {}))):
+            have = stored.get(category, {}).get(outcome, 0)
+            want = chroma_counts.get(category, {}).get(outcome, 0)
+            if have != want:
+                drift.append({"category": category, "outcome": outcome, "stored": have, "chroma": want})
+
+    index_total = index.count()
+    return {
+        "ok": not drift and index_total == chroma_total,
+        "chroma_traces": chroma_total,
+        "indexed_traces": index_total,
+        "drift": drift,
+        "repaired": False
+    }
+
+async def get_synced_trace_index(
+    collection,
+    project_dir: Optional[str] = None,
+    chroma_count: Optional[int] = None
+) -> TraceIndex:
+    """Get the sidecar index for reading, rebuilding it if it drifted.
+
+    Chroma is the source of truth. If the trace counts disagree (e.g. the
+    CLI scripts wrote to Chroma directly) the index is rebuilt under the
+    write lock before being used. Pass chroma_count when the caller has
+    just counted the collection.
+    """
+    index = await get_trace_index(project_dir)
+    if chroma_count is None:
+        chroma_count = await run_chroma(collection.count)
+    if chroma_count != await run_chroma(index.count):
+        async with get_write_lock(project_dir):
+            if await run_chroma(collection.count) != await run_chroma(index.count):
+                await run_chroma(rebuild_trace_index, collection, index)
+                bump_collection_version(project_dir)
+    return index
+
+async def add_traces(
+    collection,
+    ids: List[str],
+    embeddings: List[List[float]],
+    documents: List[str],
+    metadatas: List[Dict[str, Any]],
+    project_dir: Optional[str] = None
+) -> None:
+    """Write new traces to Chroma and the sidecar index under the write lock.
+
+    Stores with a reduced ann_dim get truncated vectors in Chroma and the
+    full vectors in the rerank store. The flat index, if any, receives the
+    same vectors as Chroma.
+    """
+    index = await get_trace_index(project_dir)
+    flat = await get_flat_index(collection, project_dir)
+    ann_dim = collection_ann_dim(collection)
+    rerank = await get_rerank_store(project_dir) if ann_dim else None
+    ann_embeddings = [truncate_embedding(e, ann_dim) for e in embeddings] if ann_dim else embeddings
+    async with get_write_lock(project_dir):
+        with STAGE_LATENCY.time("chroma_add"):
+            await run_chroma(
+                collection.add,
+                ids=ids,
+                embeddings=ann_embeddings,
+                documents=documents,
+                metadatas=metadatas
+            )
+        with STAGE_LATENCY.time("sidecar_add"):
+            await run_chroma(index.add, ids, documents, metadatas)
+            if flat is not None:
+                await run_chroma(
+                    flat.add,
+                    ids,
+                    ann_embeddings,
+                    [m.get("category") or "general" for m in metadatas],
+                    [m.get("outcome") or "pending" for m in metadatas]
+                )
+            if rerank is not None:
+                precision = get_vector_storage(project_dir)["rerank_precision"]
+                await run_chroma(rerank.put_many, ids, embeddings, precision)
+        bump_collection_version(project_dir)
 
 def get_voyage_key() -> str:
     """Get Voyage AI API key from environment."""
@@ -230,34 +1216,1459 @@ def get_voyage_key() -> str:
         )
     return key
 
-async def get_embedding(text: str, api_key: str) -> List[float]:
-    """Get embedding from Voyage AI."""
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.post(
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the pooled HTTP client, creating it on first use.
+
+    One client is kept for the lifetime of the server so embedding calls
+    reuse warm keep-alive connections instead of paying a TCP+TLS
+    handshake per request. HTTP/2 is used when the optional `h2` package
+    is installed.
+    """
+    global _http_client, _http_client_loop
+
+    loop = asyncio.get_running_loop()
+    if _http_client is not None and not _http_client.is_closed and _http_client_loop is loop:
+        return _http_client
+
+    _http_client = httpx.AsyncClient(
+        http2=HTTP2_ENABLED and importlib.util.find_spec("h2") is not None,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        headers={"Content-Type": "application/json"}
+    )
+    _http_client_loop = loop
+    return _http_client
+
+async def close_http_client() -> None:
+    """Close the pooled HTTP client and its open connections."""
+    global _http_client, _http_client_loop
+
+    client, _http_client, _http_client_loop = _http_client, None, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+_embedding_caches: Dict[str, EmbeddingCache] = {}
+
+async def get_embedding_cache(project_dir: Optional[str] = None) -> Optional[EmbeddingCache]:
+    """Get the embedding cache for a project (None when disabled).
+
+    The SQLite file is opened on the thread pool; callers run its reads
+    and writes there too.
+    """
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+
+    store_key = project_dir or "default"
+    if store_key not in _embedding_caches:
+        cache = await run_chroma(
+            EmbeddingCache,
+            cache_path(project_dir),
+            memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES,
+            max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+        )
+        if store_key in _embedding_caches:
+            cache.close()
+        else:
+            _embedding_caches[store_key] = cache
+    return _embedding_caches[store_key]
+
+def close_embedding_caches() -> None:
+    """Close all open embedding cache files."""
+    while _embedding_caches:
+        _, cache = _embedding_caches.popitem()
+        cache.close()
+
+def iter_embedding_batches(texts: List[str]) -> List[List[str]]:
+    """Split texts into chunks that fit one Voyage request."""
+    batches: List[List[str]] = []
+    current: List[str] = []
+    chars = 0
+    for text in texts:
+        if current and (len(current) >= EMBEDDING_BATCH_SIZE or chars + len(text) > EMBEDDING_BATCH_CHARS):
+            batches.append(current)
+            current, chars = [], 0
+        current.append(text)
+        chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+class EmbeddingProvider:
+    """Base class for embedding backends.
+
+    Subclasses set name/model/dim and implement embed(), which embeds one
+    request-sized batch of texts. Remote providers are fronted by the
+    on-disk cache and the micro-batcher; local ones are called directly.
+    """
+
+    name = "base"
+    remote = False
+
+    def __init__(self, model: str, dim: int):
+        self.model = model
+        self.dim = dim
+
+    async def embed(self, texts: List[str], input_type: str) -> List[List[float]]:
+        raise NotImplementedError
+
+    def check_available(self) -> None:
+        """Raise ValueError if the provider cannot be used (e.g. no API key)."""
+
+    def describe(self) -> Dict[str, Any]:
+        """Collection metadata identifying this provider."""
+        return {
+            "embedding_provider": self.name,
+            "embedding_model": self.model,
+            "embedding_dim": self.dim
+        }
+
+class VoyageProvider(EmbeddingProvider):
+    """Voyage AI embeddings over the pooled HTTP client."""
+
+    name = "voyage"
+    remote = True
+
+    def __init__(self, model: str = EMBEDDING_MODEL, dim: int = EMBEDDING_DIM, api_key: Optional[str] = None):
+        super().__init__(model, dim)
+        self.api_key = api_key
+
+    def check_available(self) -> None:
+        if not self.api_key:
+            get_voyage_key()
+
+    async def embed(self, texts: List[str], input_type: str) -> List[List[float]]:
+        """Embed one batch of texts with a single Voyage request."""
+        api_key = self.api_key or get_voyage_key()
+        response = await get_http_client().post(
             VOYAGE_API_URL,
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
+            headers={"Authorization": f"Bearer {api_key}"},
             json={
-                "input": [text],
-                "model": EMBEDDING_MODEL
+                "input": texts,
+                "model": self.model,
+                "input_type": input_type
             }
         )
         response.raise_for_status()
-        data = response.json()
-        return data["data"][0]["embedding"]
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+class LocalHashProvider(EmbeddingProvider):
+    """CPU-only embeddings from hashed word and character n-grams.
+
+    Each word, word bigram and character trigram is hashed to a signed
+    bucket (a sparse random projection of the n-gram counts) and the
+    vector is L2-normalized. Needs no network or model download and takes
+    well under a millisecond per text. Similarity is lexical rather than
+    semantic, which suits CI and air-gapped runs.
+    """
+
+    name = "local"
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM):
+        super().__init__(f"local-hash-{dim}", dim)
+
+    def embed_text(self, text: str) -> List[float]:
+        words = re.findall(r"\w+", text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        weights = [1.0] * len(features)
+        for word in words:
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                features.append(padded[i:i + 3])
+                weights.append(0.5)
+
+        if not features:
+            return [0.0] * self.dim
+
+        hashes = np.fromiter((zlib.crc32(f.encode()) for f in features), dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0) * np.asarray(weights)
+        vector = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    async def embed(self, texts: List[str], input_type: str) -> List[List[float]]:
+        return [self.embed_text(text) for text in texts]
+
+_providers: Dict[tuple, EmbeddingProvider] = {}
+
+def get_embedding_provider(project_dir: Optional[str] = None) -> EmbeddingProvider:
+    """Get the embedding provider configured for a project.
+
+    Reads context_graph.embedding_provider (and optional embedding_model /
+    embedding_dim) from .claude/config/project.json, falling back to
+    CONTEXT_GRAPH_EMBEDDING_PROVIDER. Projects with the same settings share
+    one provider instance, so their requests can be batched together.
+    """
+    config = get_project_config(project_dir)
+    name = config.get("embedding_provider", EMBEDDING_PROVIDER)
+
+    if name == "voyage":
+        spec = ("voyage", config.get("embedding_model", EMBEDDING_MODEL), int(config.get("embedding_dim", EMBEDDING_DIM)))
+    elif name == "local":
+        spec = ("local", None, int(config.get("embedding_dim", LOCAL_EMBEDDING_DIM)))
+    else:
+        raise ValueError(f"Unknown embedding provider '{name}'. Use 'voyage' or 'local'.")
+
+    if spec not in _providers:
+        if name == "voyage":
+            _providers[spec] = VoyageProvider(model=spec[1], dim=spec[2])
+        else:
+            _providers[spec] = LocalHashProvider(dim=spec[2])
+    return _providers[spec]
+
+async def embed_batch(provider: EmbeddingProvider, texts: List[str], input_type: str) -> List[List[float]]:
+    """One provider call (one API request for remote providers), counted and timed."""
+    EMBEDDING_REQUESTS.inc(provider.name)
+    EMBEDDING_TEXTS.inc(provider.name, len(texts))
+    EMBEDDING_BYTES.inc(provider.name, sum(len(text.encode()) for text in texts))
+    with STAGE_LATENCY.time("embed_request"):
+        return await provider.embed(texts, input_type)
+
+class EmbeddingBatcher:
+    """Coalesce concurrent embedding requests into batched Voyage calls.
+
+    Requests for the same (provider, input_type) pair that arrive within a
+    short collection window (or until the batch cap is reached) are sent as
+    one Voyage call and each caller gets back its own vectors. When no
+    batch is in flight the window is skipped and the batch is flushed on
+    the next loop iteration, so an isolated request adds almost no latency
+    while a burst issued in the same tick still coalesces.
+    """
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self._pending: Dict[tuple, List[tuple]] = {}
+        self._counts: Dict[tuple, int] = {}
+        self._timers: Dict[tuple, asyncio.TimerHandle] = {}
+        self._inflight: Dict[tuple, int] = {}
+        self._tasks: set = set()
+
+    async def embed(self, texts: List[str], provider: EmbeddingProvider, input_type: str) -> List[List[float]]:
+        """Queue texts for the next batch and wait for their vectors."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (provider, input_type)
+
+        pending = self._pending.setdefault(key, [])
+        pending.append((texts, future))
+        self._counts[key] = self._counts.get(key, 0) + len(texts)
+        self.requests += 1
+
+        if self._counts[key] >= self.max_batch:
+            self._flush(key)
+        elif len(pending) == 1:
+            delay = self.window if self._inflight.get(key) else 0
+            self._timers[key] = loop.call_later(delay, self._flush, key)
+
+        return await future
+
+    def _flush(self, key: tuple) -> None:
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        waiters = self._pending.pop(key, [])
+        self._counts.pop(key, None)
+        if waiters:
+            self._inflight[key] = self._inflight.get(key, 0) + 1
+            task = asyncio.ensure_future(self._dispatch(key, waiters))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, key: tuple, waiters: List[tuple]) -> None:
+        try:
+            await self._send(key, waiters)
+        finally:
+            self._inflight[key] -= 1
+
+    async def _send(self, key: tuple, waiters: List[tuple]) -> None:
+        provider, input_type = key
+
+        # Callers asking for the same text share one input slot
+        unique: Dict[str, int] = {}
+        for texts, _ in waiters:
+            for text in texts:
+                unique.setdefault(text, len(unique))
+
+        try:
+            vectors: List[List[float]] = []
+            for batch in iter_embedding_batches(list(unique)):
+                self.batches += 1
+                vectors.extend(await embed_batch(provider, batch, input_type))
+        except Exception as e:
+            for _, future in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for texts, future in waiters:
+            if not future.done():
+                future.set_result([vectors[unique[text]] for text in texts])
+
+_embedding_batcher: Optional[EmbeddingBatcher] = None
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """Get the process-wide embedding micro-batcher."""
+    global _embedding_batcher
+    if _embedding_batcher is None:
+        _embedding_batcher = EmbeddingBatcher(EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_BATCH_MAX)
+    return _embedding_batcher
+
+async def get_embeddings(
+    texts: List[str],
+    provider: EmbeddingProvider,
+    input_type: str = "document",
+    project_dir: Optional[str] = None
+) -> List[List[float]]:
+    """Get embeddings for many texts, using the cache and batched requests.
+
+    For remote providers, cached texts are served locally; the rest are
+    de-duplicated and sent in as few requests as the API's batch limits
+    allow. Small requests go through the micro-batcher so concurrent
+    callers share round trips. Local providers are called directly.
+
+    Args:
+        texts: Texts to embed
+        provider: Embedding provider (see get_embedding_provider)
+        input_type: "document" for stored traces, "query" for searches
+        project_dir: Project whose embedding cache to use
+
+    Returns:
+        List of vectors in the same order as texts
+    """
+    with STAGE_LATENCY.time("embed"):
+        cache = await get_embedding_cache(project_dir) if provider.remote else None
+        keys = [cache_key(provider.model, input_type, text) for text in texts]
+        found = await run_chroma(cache.get_many, keys) if cache else {}
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing and provider.remote and EMBEDDING_BATCHING_ENABLED and len(missing) < EMBEDDING_BATCH_MAX:
+            vectors = await get_embedding_batcher().embed(list(missing.values()), provider, input_type)
+            found.update(zip(missing, vectors))
+            if cache:
+                await run_chroma(
+                    cache.put_many, list(zip(missing, vectors)), model=provider.model, input_type=input_type
+                )
+        elif missing:
+            missing_keys = list(missing)
+            offset = 0
+            for batch in iter_embedding_batches(list(missing.values())):
+                vectors = await embed_batch(provider, batch, input_type)
+                batch_keys = missing_keys[offset:offset + len(batch)]
+                offset += len(batch)
+                found.update(zip(batch_keys, vectors))
+                if cache:
+                    await run_chroma(
+                        cache.put_many, list(zip(batch_keys, vectors)), model=provider.model, input_type=input_type
+                    )
+
+        return [found[key] for key in keys]
+
+async def get_embedding(
+    text: str,
+    provider: EmbeddingProvider,
+    input_type: str = "document",
+    project_dir: Optional[str] = None
+) -> List[float]:
+    """Get one embedding, served from the cache when possible.
+
+    Args:
+        text: Text to embed
+        provider: Embedding provider (see get_embedding_provider)
+        input_type: "document" for stored traces, "query" for searches
+        project_dir: Project whose embedding cache to use
+    """
+    embeddings = await get_embeddings([text], provider, input_type=input_type, project_dir=project_dir)
+    return embeddings[0]
+
+def new_trace(
+    decision: str,
+    category: str,
+    outcome: str,
+    feature_id: Optional[str],
+    project_dir: Optional[str],
+    salt: str = ""
+) -> Dict[str, Any]:
+    """Build trace ID and ChromaDB metadata for a new decision."""
+    timestamp = datetime.now().isoformat()
+    trace_id = f"trace_{hashlib.sha256(f'{timestamp}{salt}{decision}'.encode()).hexdigest()[:12]}"
+    return {
+        "trace_id": trace_id,
+        "timestamp": timestamp,
+        "category": category,
+        "outcome": outcome,
+        "feature_id": feature_id or "",
+        "state": "",
+        "project_dir": project_dir or os.getcwd(),
+        "session_id": ""
+    }
+
+async def remove_traces(collection, ids: List[str], project_dir: Optional[str] = None) -> None:
+    """Delete traces from Chroma and every derived index.
+
+    The caller must hold the project's write lock.
+    """
+    index = await get_trace_index(project_dir)
+    flat = await get_flat_index(collection, project_dir)
+    await run_chroma(collection.delete, ids=ids)
+    await run_chroma(index.delete, ids)
+    if collection_ann_dim(collection):
+        rerank = await get_rerank_store(project_dir)
+        await run_chroma(rerank.delete, ids)
+    if flat is not None:
+        await run_chroma(flat.delete, ids)
+    bump_collection_version(project_dir)
+
+async def apply_outcome_updates(collection, outcomes: Dict[str, str], project_dir: Optional[str] = None) -> set:
+    """Set the outcome of existing traces in place.
+
+    Only metadata is written; embeddings and the vector index are left
+    untouched. Returns the set of trace IDs that exist and were updated.
+    """
+    index = await get_trace_index(project_dir)
+    flat = await get_flat_index(collection, project_dir)
+    async with get_write_lock(project_dir):
+        existing = await run_chroma(collection.get, ids=list(outcomes), include=[])
+        found = list(existing["ids"]) if existing else []
+        if found:
+            await run_chroma(
+                collection.update,
+                ids=found,
+                metadatas=[{"outcome": outcomes[trace_id]} for trace_id in found]
+            )
+            await run_chroma(index.update_outcomes, {trace_id: outcomes[trace_id] for trace_id in found})
+            if flat is not None:
+                await run_chroma(flat.update_outcomes, {trace_id: outcomes[trace_id] for trace_id in found})
+            bump_collection_version(project_dir)
+    return set(found)
+
+def write_behind_enabled(project_dir: Optional[str] = None) -> bool:
+    """Default for context_store_trace(write_behind=...): context_graph.write_behind."""
+    return bool(get_project_config(project_dir).get("write_behind", WRITE_BEHIND))
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether a failed write-behind commit may succeed unchanged on retry.
+
+    Network errors, timeouts, rate limits, 5xx responses and a busy
+    database are; anything
+    else (a provider or dimension mismatch, a missing API key, a 4xx for the
+    document itself) fails the same way every time.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError, OSError, sqlite3.OperationalError))
+
+class WriteBehindQueue:
+    """A project's write-behind traces: their log, the ones still queued and the committer task.
+
+    append() returns once a trace is in the log. The committer embeds queued
+    traces and adds them to the store in groups of up to
+    WRITE_BEHIND_GROUP_MAX, gathering for WRITE_BEHIND_WINDOW_MS after the
+    queue goes from empty to busy. A group that fails with a transient error
+    (the embedding API is unreachable, 429 or 5xx) stays queued and is
+    retried with backoff. Any other error is permanent: the group's traces
+    are retried one at a time and the ones that still fail are
+    dead-lettered (TraceWAL.dead_letter), so one bad trace cannot stall
+    the queue.
+    """
+
+    def __init__(self, project_dir: Optional[str], wal: TraceWAL, recovered: List[Dict[str, Any]]):
+        self.project_dir = project_dir
+        self.wal = wal
+        self.queued: "OrderedDict[str, Dict[str, Any]]" = OrderedDict((r["id"], r) for r in recovered)
+        self.replayed = len(recovered)
+        self.committed = 0
+        self.groups = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.last_error: Optional[str] = None
+        self._appending: List[tuple] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._appender: Optional[asyncio.Task] = None
+        self._committer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Run the committer on the running loop (again, if the loop it ran on is gone)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._stored = asyncio.Condition()
+            self._appending = []
+            self._appender = self._committer = None
+        if self._committer is None or self._committer.done():
+            self._committer = loop.create_task(self._commit_loop())
+
+    async def append(self, record: Dict[str, Any]) -> None:
+        """Log a trace ({"id", "document", "metadata"}) durably and queue it.
+
+        Records appended while a write is in progress share the next write
+        and its fsync.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._appending.append((record, future))
+        if self._appender is None or self._appender.done():
+            self._appender = asyncio.create_task(self._write_appends())
+        await future
+
+    async def _write_appends(self) -> None:
+        while self._appending:
+            batch, self._appending = self._appending, []
+            records = [record for record, _ in batch]
+            try:
+                with STAGE_LATENCY.time("wal_append"):
+                    await run_chroma(self.wal.append, records)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for record in records:
+                self.queued[record["id"]] = record
+            self._wakeup.set()
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    async def _commit_loop(self) -> None:
+        delay = 0.0
+        while True:
+            if not self.queued:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                await asyncio.sleep(WRITE_BEHIND_WINDOW_MS / 1000)
+            group = list(self.queued.values())[:WRITE_BEHIND_GROUP_MAX]
+            try:
+                with STAGE_LATENCY.time("write_behind_commit"):
+                    try:
+                        await commit_queued_traces(self.project_dir, group)
+                    except Exception as e:
+                        if is_transient_error(e) or len(group) == 1:
+                            raise
+                        for record in group:
+                            await self._commit_one(record)
+                    else:
+                        await run_chroma(self.wal.commit, [record["id"] for record in group])
+                        self.last_error = None
+                        self._stored_records(group)
+            except Exception as e:
+                if not is_transient_error(e):
+                    await self._dead_letter(group[0], e)
+                    delay = 0.0
+                    continue
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {str(e)}"
+                delay = min(max(delay * 2, 1.0), WRITE_BEHIND_RETRY_MAX)
+                print(f"Error: Write-behind group of {len(group)} failed, retrying in {delay:.0f}s - "
+                      f"{self.last_error}", file=sys.stderr)
+                await asyncio.sleep(delay)
+                continue
+            delay = 0.0
+            self.groups += 1
+            async with self._stored:
+                self._stored.notify_all()
+
+    async def _commit_one(self, record: Dict[str, Any]) -> None:
+        """Store one trace of a group that failed permanently; dead-letter it if it fails too.
+
+        Transient errors propagate, so the rest of the group is retried with backoff.
+        """
+        try:
+            await commit_queued_traces(self.project_dir, [record])
+        except Exception as e:
+            if is_transient_error(e):
+                raise
+            await self._dead_letter(record, e)
+            return
+        await run_chroma(self.wal.commit, [record["id"]])
+        self._stored_records([record])
+
+    async def _dead_letter(self, record: Dict[str, Any], error: Exception) -> None:
+        message = f"{type(error).__name__}: {str(error)}"
+        await run_chroma(self.wal.dead_letter, record, message)
+        self.queued.pop(record["id"], None)
+        self.dead_lettered += 1
+        self.last_error = f"Trace {record['id']} dead-lettered to {self.wal.dead_letter_path} - {message}"
+        print(f"Error: {self.last_error}", file=sys.stderr)
+        async with self._stored:
+            self._stored.notify_all()
+
+    def _stored_records(self, records: List[Dict[str, Any]]) -> None:
+        for record in records:
+            self.queued.pop(record["id"], None)
+        self.committed += len(records)
+
+    async def settle(self, timeout: float) -> bool:
+        """Wait until the traces queued now are in the store; False if timeout passes first."""
+        waiting = set(self.queued)
+        if not waiting:
+            return True
+        try:
+            async with self._stored:
+                await asyncio.wait_for(self._stored.wait_for(lambda: waiting.isdisjoint(self.queued)), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self) -> None:
+        """Cancel the committer (queued traces stay in the log)."""
+        for task in (self._appender, self._committer):
+            if task is not None and task.get_loop() is asyncio.get_running_loop() and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self.queued),
+            "committed": self.committed,
+            "groups": self.groups,
+            "replayed": self.replayed,
+            "failures": self.failures,
+            "dead_lettered": self.dead_lettered,
+            "last_error": self.last_error,
+            "log": self.wal.stats()
+        }
+
+_write_behind_queues: Dict[str, WriteBehindQueue] = {}
+
+async def get_write_behind_queue(project_dir: Optional[str] = None, create: bool = True) -> Optional[WriteBehindQueue]:
+    """Get a project's write-behind queue, replaying its log when first opened.
+
+    With create=False a project whose log is missing or empty gets None, so
+    readers do not open a log for projects that never used write-behind.
+    None also means another server process owns the log: its traces are
+    that process's to commit, and stores here go straight to the store.
+    The log is tried again on the next call, so a crashed owner's traces
+    are replayed by whichever process opens it first.
+    """
+    cache_key = project_dir or "default"
+    queue = _write_behind_queues.get(cache_key)
+    if queue is None:
+        path = wal_path(project_dir)
+        if not create and (not path.exists() or path.stat().st_size == 0):
+            return None
+        try:
+            wal = await run_chroma(TraceWAL, path)
+        except WALLocked:
+            # Also raised while another task here is opening it; use that queue if it is ready
+            queue = _write_behind_queues.get(cache_key)
+            if queue is None:
+                return None
+        else:
+            recovered = await run_chroma(wal.recover)
+            queue = _write_behind_queues.get(cache_key)
+            if queue is None:
+                queue = _write_behind_queues[cache_key] = WriteBehindQueue(project_dir, wal, recovered)
+            else:
+                wal.close()
+    queue.start()
+    return queue
+
+async def commit_queued_traces(project_dir: Optional[str], records: List[Dict[str, Any]]) -> None:
+    """Embed a group of write-behind traces and add them to the store with one add.
+
+    Traces already in the store (replayed after a crash that came between
+    the add and its commit line) are skipped.
+    """
+    provider = get_embedding_provider(project_dir)
+    provider.check_available()
+    collection = await get_collection(project_dir)
+    check_collection_provider(collection, provider)
+    stored = await run_chroma(collection.get, ids=[record["id"] for record in records], include=[])
+    stored_ids = set(stored["ids"])
+    fresh = [record for record in records if record["id"] not in stored_ids]
+    if not fresh:
+        return
+    documents = [record["document"] for record in fresh]
+    embeddings = await get_embeddings(documents, provider, input_type="document", project_dir=project_dir)
+    await add_traces(
+        collection,
+        [record["id"] for record in fresh],
+        embeddings,
+        documents,
+        [record["metadata"] for record in fresh],
+        project_dir
+    )
+
+async def settle_write_behind(project_dir: Optional[str] = None) -> Optional[WriteBehindQueue]:
+    """Give a project's queued traces up to WRITE_BEHIND_SETTLE_TIMEOUT to reach the store.
+
+    Used before reads that go to the store alone (listing, counts, outcome
+    updates, export), so a caller sees the traces it stored. Returns the
+    queue, if the project has one, for checking what is still queued.
+    """
+    queue = await get_write_behind_queue(project_dir, create=False)
+    if queue is not None:
+        await queue.settle(WRITE_BEHIND_SETTLE_TIMEOUT)
+    return queue
+
+async def close_write_behind_queues() -> None:
+    """Let queued traces reach their stores (within the settle timeout), then stop and close the logs.
+
+    Traces still queued stay in their log and are replayed on the next start.
+    """
+    queues = list(_write_behind_queues.values())
+    await asyncio.gather(*(queue.settle(WRITE_BEHIND_SETTLE_TIMEOUT) for queue in queues), return_exceptions=True)
+    _write_behind_queues.clear()
+    for queue in queues:
+        await queue.stop()
+        queue.wal.close()
+
+RRF_K = 60  # reciprocal rank fusion constant (Cormack et al.)
+
+def fuse_hits(rankings: List[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """Merge ranked hit lists with reciprocal rank fusion.
+
+    Each hit scores sum(1 / (RRF_K + rank)) over the lists it appears in;
+    fields from every list (distance, bm25) are kept on the merged hit.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, 1):
+            merged = fused.setdefault(hit["id"], {"rrf": 0.0})
+            merged.update({key: value for key, value in hit.items() if key not in merged})
+            merged["rrf"] += 1.0 / (RRF_K + rank)
+    return sorted(fused.values(), key=lambda hit: hit["rrf"], reverse=True)[:limit]
+
+def index_row_metadata(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Trace metadata from a sidecar index row."""
+    return {key: row[key] for key in ("timestamp", "category", "outcome", "feature_id", "state")}
+
+def get_registered_projects(project_dir: Optional[str] = None) -> List[Optional[str]]:
+    """Project stores searched by context_query_all_projects.
+
+    The calling project comes first, then every directory listed in
+    CONTEXT_GRAPH_PROJECTS (os.pathsep-separated) and in the project's
+    .claude/config/project.json -> {"context_graph": {"projects": [...]}}.
+    Relative config entries resolve against the project directory.
+    """
+    base = Path(project_dir) if project_dir else Path(".")
+    candidates = [p for p in os.environ.get("CONTEXT_GRAPH_PROJECTS", "").split(os.pathsep) if p]
+    candidates += [str(base / p) for p in get_project_config(project_dir).get("projects", [])]
+
+    projects: List[Optional[str]] = [project_dir]
+    seen = {base.resolve()}
+    for candidate in candidates:
+        resolved = Path(candidate).expanduser().resolve()
+        if resolved not in seen:
+            seen.add(resolved)
+            projects.append(str(resolved))
+    return projects
+
+async def vector_search(
+    collection,
+    embedding: List[float],
+    limit: int,
+    where: Optional[Dict[str, Any]] = None,
+    project_dir: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Nearest traces for a query embedding, as hits with cosine similarity.
+
+    Stores with a reduced ann_dim are searched with the truncated query for
+    RERANK_CANDIDATES x limit candidates, which are then rescored against
+    their full-dimension vectors from the rerank store. With the flat
+    backend the candidates come from exact search instead of HNSW.
+    """
+    ann_dim = collection_ann_dim(collection)
+    query_embedding = truncate_embedding(embedding, ann_dim) if ann_dim else embedding
+    n_results = limit * RERANK_CANDIDATES if ann_dim else limit
+    if get_index_backend(project_dir) == "flat":
+        with STAGE_LATENCY.time("flat_search"):
+            hits = await flat_search(collection, query_embedding, n_results, where, project_dir)
+    else:
+        with STAGE_LATENCY.time("chroma_query"):
+            hits = await hnsw_search(collection, query_embedding, n_results, where)
+
+    if ann_dim and hits:
+        with STAGE_LATENCY.time("rerank"):
+            rerank = await get_rerank_store(project_dir)
+            full = await run_chroma(rerank.get_many, [hit["id"] for hit in hits])
+            query = np.asarray(embedding, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1.0
+            for hit in hits:
+                vector = full.get(hit["id"])
+                if vector is not None:
+                    hit["similarity"] = float(vector @ query / (np.linalg.norm(vector) or 1.0))
+            hits.sort(key=lambda hit: hit["similarity"], reverse=True)
+    return hits[:limit]
+
+def chroma_where(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """A {field: value} filter in Chroma's syntax, which needs $and for more than one field."""
+    if not where or len(where) == 1:
+        return where or None
+    return {"$and": [{field: value} for field, value in where.items()]}
+
+async def hnsw_search(
+    collection,
+    embedding: List[float],
+    limit: int,
+    where: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """Approximate nearest traces from the collection's HNSW index.
+
+    where is a plain {field: value} filter, as flat_search takes.
+    """
+    space = collection_space(collection)
+    results = await run_chroma(
+        collection.query,
+        query_embeddings=[embedding],
+        n_results=limit,
+        where=chroma_where(where)
+    )
+    return [
+        {
+            "id": trace_id,
+            "document": results['documents'][0][i],
+            "metadata": results['metadatas'][0][i],
+            "distance": results['distances'][0][i],
+            "similarity": similarity_from_distance(results['distances'][0][i], space)
+        }
+        for i, trace_id in enumerate(results['ids'][0])
+    ] if results else []
+
+async def flat_search(
+    collection,
+    embedding: List[float],
+    limit: int,
+    where: Optional[Dict[str, Any]] = None,
+    project_dir: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Exact nearest traces from the flat index.
+
+    Ranking is one matrix-vector product over the rows passing the
+    category/outcome masks; documents and metadata come from the sidecar
+    index, so no Chroma query is made.
+    """
+    chroma_count = await run_chroma(collection.count)
+    flat = await get_synced_flat_index(collection, project_dir, chroma_count)
+    index = await get_synced_trace_index(collection, project_dir, chroma_count)
+    where = where or {}
+    query = np.asarray(embedding, dtype=np.float32)
+    query /= np.linalg.norm(query) or 1.0
+
+    ranked = await run_chroma(flat.search, query, limit, where.get("category"), where.get("outcome"))
+    rows = await run_chroma(index.get_many, [trace_id for trace_id, _ in ranked])
+    return [
+        {
+            "id": trace_id,
+            "document": rows[trace_id]["decision"],
+            "metadata": index_row_metadata(rows[trace_id]),
+            "distance": 1.0 - similarity,
+            "similarity": similarity
+        }
+        for trace_id, similarity in ranked
+        if trace_id in rows
+    ]
+
+async def search_project_store(
+    store_dir: Optional[str],
+    embedding: List[float],
+    provider: "EmbeddingProvider",
+    limit: int,
+    where: Optional[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Nearest traces in one project's store for an already computed embedding."""
+    base = Path(store_dir) if store_dir else Path(".")
+    if not (base / ".claude" / "chroma").is_dir():
+        raise FileNotFoundError(f"No trace store in {base}")
+
+    collection = await get_collection(store_dir)
+    check_collection_provider(collection, provider)
+    if await run_chroma(collection.count) == 0:
+        return []
+    return await vector_search(collection, embedding, limit, where, store_dir)
+
+EXPORT_BATCH_SIZE = 1000
+
+async def export_traces(
+    out: TextIO,
+    project_dir: Optional[str] = None,
+    include_embeddings: bool = True,
+    category: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """Stream a store to NDJSON, one page of traces in memory at a time.
+
+    Stores with a reduced ann_dim export the full vectors from the rerank
+    store; a trace whose full vector is missing is exported without one.
+    """
+    provider = get_embedding_provider(project_dir)
+    collection = await get_collection(project_dir)
+    await settle_write_behind(project_dir)
+    ann_dim = collection_ann_dim(collection)
+    rerank = await get_rerank_store(project_dir) if include_embeddings and ann_dim else None
+    where = {"category": category} if category else None
+    include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings and not ann_dim else [])
+
+    await run_chroma(out.write, json.dumps(export_header(provider.describe(), include_embeddings)) + "\n")
+    exported = with_embeddings = offset = 0
+    while True:
+        page = await run_chroma(collection.get, where=where, include=include, limit=batch_size, offset=offset)
+        ids = page["ids"]
+        if not ids:
+            break
+        if rerank is not None:
+            full = await run_chroma(rerank.get_many, ids)
+            embeddings = [full.get(trace_id) for trace_id in ids]
+        elif include_embeddings:
+            embeddings = list(page["embeddings"])
+        else:
+            embeddings = [None] * len(ids)
+
+        lines = [
+            trace_line(trace_id, document, metadata, embedding)
+            for trace_id, document, metadata, embedding in zip(ids, page["documents"], page["metadatas"], embeddings)
+        ]
+        await run_chroma(out.write, "".join(lines))
+        exported += len(ids)
+        with_embeddings += sum(1 for embedding in embeddings if embedding is not None)
+        offset += len(ids)
+
+    return {"exported": exported, "with_embeddings": with_embeddings, **provider.describe()}
+
+async def import_traces(
+    lines: Iterable[str],
+    project_dir: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """Load an NDJSON export into a store in batches.
+
+    Embeddings in the file are reused when the header's provider, model
+    and dimension match the project's; otherwise (or for traces exported
+    without one) documents are re-embedded. Traces whose ID is already in
+    the store are skipped, so re-running an interrupted import is safe.
+    """
+    lines = iter(lines)
+    header = read_header(next(lines, ""))
+    provider = get_embedding_provider(project_dir)
+    collection = await get_collection(project_dir)
+    check_collection_provider(collection, provider)
+    reusable = header.get("embedding_encoding") is not None and all(
+        header.get(key) == value for key, value in provider.describe().items()
+    )
+
+    imported = skipped = reused = embedded = 0
+    for batch in iter_record_batches(lines, batch_size):
+        existing = await run_chroma(collection.get, ids=list({r["id"] for r in batch}), include=[])
+        seen = set(existing["ids"])
+        records = []
+        for record in batch:
+            if record["id"] in seen:
+                skipped += 1
+                continue
+            seen.add(record["id"])
+            records.append(record)
+        if not records:
+            continue
+
+        embeddings: List[Optional[List[float]]] = []
+        for record in records:
+            if reusable and record.get("embedding"):
+                try:
+                    embeddings.append(decode_embedding(record["embedding"], provider.dim))
+                except ValueError as e:
+                    raise ValueError(f"Line {record['line']}: {e}")
+            else:
+                embeddings.append(None)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            provider.check_available()
+            fresh = await get_embeddings(
+                [records[i]["document"] for i in missing], provider, input_type="document", project_dir=project_dir
+            )
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+
+        metadatas = [
+            {**record.get("metadata", {}), "trace_id": record["id"],
+             "category": record.get("metadata", {}).get("category") or "general",
+             "outcome": record.get("metadata", {}).get("outcome") or "pending"}
+            for record in records
+        ]
+        await add_traces(
+            collection, [r["id"] for r in records], embeddings, [r["document"] for r in records], metadatas, project_dir
+        )
+        imported += len(records)
+        embedded += len(missing)
+        reused += len(records) - len(missing)
+
+    return {"imported": imported, "skipped_existing": skipped, "reused_embeddings": reused, "embedded": embedded}
+
+async def compact_store(
+    project_dir: Optional[str] = None,
+    max_age_days: Optional[int] = None,
+    outcomes: Optional[List[str]] = None,
+    dry_run: bool = False,
+    batch_size: int = COMPACTION_BATCH_SIZE
+) -> Dict[str, Any]:
+    """Move traces past the retention policy from the hot store to the archive.
+
+    Works in batches: each batch is written as an archive segment and then
+    deleted from Chroma and the derived indexes, all under the write lock,
+    so an outcome update cannot slip in between. A crash between the two
+    steps leaves a trace in both places; searches de-duplicate by ID and the
+    next run archives it again.
+    """
+    policy = get_retention_policy(project_dir, max_age_days, outcomes)
+    provider = get_embedding_provider(project_dir)
+    collection = await get_collection(project_dir)
+    check_collection_provider(collection, provider)
+    index = await get_synced_trace_index(collection, project_dir)
+    archive = get_trace_archive(project_dir)
+    ann_dim = collection_ann_dim(collection)
+    precision = policy["vector_precision"]
+    with_vectors = precision != "none"
+    now = datetime.now()
+
+    report: Dict[str, Any] = {**policy, "dry_run": dry_run, "by_outcome": {}, "archived": 0, "segments": []}
+    for outcome, days in policy["max_age_days"].items():
+        cutoff = (now - timedelta(days=days)).isoformat()
+        rule_outcome = None if outcome == "*" else outcome
+        if dry_run:
+            report["by_outcome"][outcome] = len(await run_chroma(index.ids_before, cutoff, rule_outcome, -1))
+            continue
+
+        archived = 0
+        while True:
+            async with get_write_lock(project_dir):
+                ids = await run_chroma(index.ids_before, cutoff, rule_outcome, batch_size)
+                if not ids:
+                    break
+                include = ["documents", "metadatas"] + (["embeddings"] if with_vectors and not ann_dim else [])
+                page = await run_chroma(collection.get, ids=ids, include=include)
+                if page["ids"]:
+                    if not with_vectors:
+                        vectors = [None] * len(page["ids"])
+                    elif ann_dim:
+                        full = await run_chroma((await get_rerank_store(project_dir)).get_many, page["ids"])
+                        vectors = [full.get(trace_id) for trace_id in page["ids"]]
+                    else:
+                        vectors = list(page["embeddings"])
+                    path = await run_chroma(
+                        archive.write_segment, page["ids"], page["documents"], page["metadatas"],
+                        vectors, precision, provider.describe()
+                    )
+                    report["segments"].append(path.name)
+                await remove_traces(collection, ids, project_dir)
+                archived += len(page["ids"])
+        report["by_outcome"][outcome] = archived
+        report["archived"] += archived
+
+    report["remaining"] = await run_chroma(collection.count)
+    return report
+
+async def find_duplicate(
+    collection,
+    embedding: List[float],
+    category: str,
+    threshold: float,
+    project_dir: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """The nearest trace in the same category if it is at least threshold similar."""
+    if await run_chroma(collection.count) == 0:
+        return None
+    hits = await vector_search(collection, embedding, 1, {"category": category}, project_dir)
+    return hits[0] if hits and hits[0]["similarity"] >= threshold else None
+
+async def merge_duplicate(collection, trace_id: str, seen_at: str, project_dir: Optional[str] = None) -> int:
+    """Count another occurrence of an existing trace; returns the new count."""
+    async with get_write_lock(project_dir):
+        existing = await run_chroma(collection.get, ids=[trace_id], include=["metadatas"])
+        metadata = existing["metadatas"][0] if existing["ids"] else {}
+        occurrences = int(metadata.get("occurrences", 1)) + 1
+        await run_chroma(
+            collection.update,
+            ids=[trace_id],
+            metadatas=[{"occurrences": occurrences, "last_seen": seen_at}]
+        )
+        # Nothing indexed changed, but other processes' cached results show the old count
+        await run_chroma((await get_trace_index(project_dir)).touch)
+        bump_collection_version(project_dir)
+    return occurrences
+
+def _merged_metadata(members: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Metadata for the surviving trace of a duplicate group (oldest first).
+
+    Occurrences add up, last_seen is the latest sighting, and a pending
+    outcome takes the most recent resolved outcome of the group.
+    """
+    keep = members[0]
+    update: Dict[str, Any] = {
+        "occurrences": sum(int(m.get("occurrences", 1)) for m in members),
+        "last_seen": max(m.get("last_seen") or m.get("timestamp") or "" for m in members),
+    }
+    resolved = [m for m in members if (m.get("outcome") or "pending") != "pending"]
+    if (keep.get("outcome") or "pending") == "pending" and resolved:
+        update["outcome"] = max(resolved, key=lambda m: m.get("timestamp") or "")["outcome"]
+    return update
+
+async def dedupe_store(
+    project_dir: Optional[str] = None,
+    threshold: Optional[float] = None,
+    dry_run: bool = False,
+    batch_size: int = 256
+) -> Dict[str, Any]:
+    """Merge near-duplicate traces already in a store.
+
+    Each page of traces is sent to Chroma as one batched query for its
+    DEDUPE_NEIGHBOURS nearest neighbours, so the pass costs n/batch_size
+    index queries rather than n^2 comparisons. Pairs in the same category
+    at or above the threshold are grouped transitively; each group keeps
+    its oldest trace, which absorbs the others' occurrences (see
+    _merged_metadata), and the rest are deleted. Stores with a reduced
+    ann_dim confirm candidate pairs against the full vectors.
+    """
+    threshold = threshold if threshold is not None else get_dedupe_config(project_dir)["threshold"]
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Dedupe threshold must be in (0, 1], got {threshold}")
+    collection = await get_collection(project_dir)
+    total = await run_chroma(collection.count)
+    space = collection_space(collection)
+    ann_dim = collection_ann_dim(collection)
+
+    parent: Dict[str, str] = {}
+
+    def find(trace_id: str) -> str:
+        while parent.get(trace_id, trace_id) != trace_id:
+            parent[trace_id] = parent.get(parent[trace_id], parent[trace_id])
+            trace_id = parent[trace_id]
+        return trace_id
+
+    metadatas: Dict[str, Dict[str, Any]] = {}
+    for offset in range(0, total, batch_size):
+        page = await run_chroma(
+            collection.get, include=["embeddings", "metadatas"], limit=batch_size, offset=offset
+        )
+        if not page["ids"]:
+            break
+        results = await run_chroma(
+            collection.query,
+            query_embeddings=page["embeddings"],
+            n_results=min(DEDUPE_NEIGHBOURS + 1, total),
+            include=["distances", "metadatas"]
+        )
+
+        pairs = []
+        for i, trace_id in enumerate(page["ids"]):
+            category = page["metadatas"][i].get("category")
+            for j, neighbour in enumerate(results["ids"][i]):
+                if neighbour == trace_id or results["metadatas"][i][j].get("category") != category:
+                    continue
+                if similarity_from_distance(results["distances"][i][j], space) >= threshold:
+                    pairs.append((trace_id, neighbour))
+                    metadatas[trace_id] = page["metadatas"][i]
+                    metadatas[neighbour] = results["metadatas"][i][j]
+
+        if ann_dim and pairs:
+            full = await run_chroma(
+                (await get_rerank_store(project_dir)).get_many, list({i for pair in pairs for i in pair})
+            )
+            pairs = [
+                (a, b) for a, b in pairs
+                if a in full and b in full and float(
+                    full[a] @ full[b] / ((np.linalg.norm(full[a]) * np.linalg.norm(full[b])) or 1.0)
+                ) >= threshold
+            ]
+        for a, b in pairs:
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+    groups: Dict[str, List[str]] = {}
+    for trace_id in parent:
+        groups.setdefault(find(trace_id), []).append(trace_id)
+    for root in list(groups):
+        if root not in groups[root]:
+            groups[root].append(root)
+
+    merges = []
+    for members in groups.values():
+        members.sort(key=lambda trace_id: (metadatas[trace_id].get("timestamp") or "", trace_id))
+        merges.append((members, _merged_metadata([metadatas[m] for m in members])))
+
+    report = {
+        "threshold": threshold,
+        "dry_run": dry_run,
+        "traces": total,
+        "groups": len(merges),
+        "duplicates": sum(len(members) - 1 for members, _ in merges),
+        "examples": [{"keep": members[0], "merge": members[1:]} for members, _ in merges[:10]]
+    }
+    if dry_run or not merges:
+        return report
+
+    # Outcome changes go through apply_outcome_updates so the derived indexes follow
+    outcome_changes = {}
+    for members, update in merges:
+        if "outcome" in update:
+            outcome_changes[members[0]] = update.pop("outcome")
+    async with get_write_lock(project_dir):
+        await run_chroma(
+            collection.update,
+            ids=[members[0] for members, _ in merges],
+            metadatas=[update for _, update in merges]
+        )
+        duplicates = [trace_id for members, _ in merges for trace_id in members[1:]]
+        for start in range(0, len(duplicates), 1000):
+            await remove_traces(collection, duplicates[start:start + 1000], project_dir)
+    if outcome_changes:
+        await apply_outcome_updates(collection, outcome_changes, project_dir)
+    report["remaining"] = await run_chroma(collection.count)
+    return report
+
+_session_slots: "weakref.WeakKeyDictionary[Any, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+_NO_SLOT = nullcontext()
+
+def resolve_project_path(path: str, project_dir: Optional[str] = None) -> Path:
+    """A user-supplied file path; relative paths resolve against the project."""
+    resolved = Path(path).expanduser()
+    if not resolved.is_absolute() and project_dir:
+        resolved = Path(project_dir) / resolved
+    return resolved
+
+def session_slot(tool: str):
+    """Slot limiting the calling MCP session to SESSION_MAX_CONCURRENCY tool calls.
+
+    A no-op outside an MCP request (tools called directly) or when the
+    limit is 0. Semaphores are per session object and go away with it.
+    """
+    request = request_ctx.get(None)
+    if request is None or SESSION_MAX_CONCURRENCY <= 0:
+        return _NO_SLOT
+    slot = _session_slots.get(request.session)
+    if slot is None:
+        slot = _session_slots[request.session] = asyncio.Semaphore(SESSION_MAX_CONCURRENCY)
+    if slot.locked():
+        SESSION_WAITS.inc(tool)
+    return slot
+
+def timed_tool(fn):
+    """Record a tool's latency, error count and response size under its name.
+
+    Also takes a session_slot first, so latency excludes time spent queued.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def timed(*args, **kwargs):
+        async with session_slot(name):
+            start = time.perf_counter()
+            result = None
+            try:
+                result = await fn(*args, **kwargs)
+                return result
+            finally:
+                TOOL_LATENCY.observe(name, time.perf_counter() - start)
+                if isinstance(result, str):
+                    TOOL_RESPONSE_CHARS.inc(name, len(result))
+                if not isinstance(result, str) or result.startswith("Error"):
+                    TOOL_ERRORS.inc(name)
+
+    return timed
+
+async def collect_metrics() -> Dict[str, Any]:
+    """Sample store sizes and cache counters into their metric families.
+
+    Returns the store_stats report the sizes were taken from.
+    """
+    stores = await run_chroma(store_stats)
+    entries = stores["stores"]
+    STORE_TRACES.set_all({e["project_dir"]: e["traces"] for e in entries})
+    STORE_VECTOR_BYTES.set_all({e["project_dir"]: e["vector_bytes"] for e in entries})
+    STORE_DISK_BYTES.set_all({
+        e["project_dir"]: e["disk_bytes"] + e["rerank_disk_bytes"] + e["flat_disk_bytes"] for e in entries
+    })
+    ARCHIVE_DISK_BYTES.set_all({e["project_dir"]: e["archive_disk_bytes"] for e in entries})
+    EMBEDDING_CACHE_HITS.set_all({key: cache.hits for key, cache in _embedding_caches.items()})
+    EMBEDDING_CACHE_MISSES.set_all({key: cache.misses for key, cache in _embedding_caches.items()})
+    QUERY_CACHE_HITS.set_all({key: cache.hits for key, cache in _query_caches.items()})
+    QUERY_CACHE_MISSES.set_all({key: cache.misses for key, cache in _query_caches.items()})
+    QUEUED_TRACES.set_all({key: len(queue.queued) for key, queue in _write_behind_queues.items()})
+    return stores
+
+async def write_metrics_file(path: str) -> None:
+    """Write current metrics in Prometheus text format (atomically).
+
+    Failures are reported on stderr rather than raised, so a bad path
+    never takes the server down.
+    """
+    try:
+        await collect_metrics()
+        target = Path(path)
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.write_text(metrics.render_prometheus())
+        os.replace(tmp, target)
+    except Exception as e:
+        print(f"Error: Failed to write metrics to {path} - {type(e).__name__}: {str(e)}", file=sys.stderr)
+
+async def write_metrics_periodically() -> None:
+    """Background task refreshing METRICS_FILE every METRICS_INTERVAL seconds."""
+    while True:
+        await write_metrics_file(METRICS_FILE)
+        await asyncio.sleep(METRICS_INTERVAL)
+
+QUERY_FIELDS = (
+    "rank", "similarity", "bm25", "rrf", "id", "category", "decision",
+    "outcome", "state", "feature_id", "timestamp", "archived", "queued"
+)
+LIST_FIELDS = ("id", "timestamp", "category", "decision", "outcome", "feature_id", "state")
+GET_FIELDS = (
+    "id", "timestamp", "category", "decision", "outcome", "session_id", "feature_id",
+    "state", "project_dir", "occurrences", "last_seen", "archived", "queued"
+)
+
+def query_entry(rank: int, hit: Dict[str, Any]) -> Dict[str, Any]:
+    """Every field of one context_query_traces hit."""
+    metadata = hit["metadata"]
+    similarity = hit.get("similarity")
+    entry = {
+        "rank": rank,
+        "similarity": round(similarity, 3) if similarity is not None else None,
+        "id": hit["id"],
+        "category": metadata.get("category"),
+        "decision": hit["document"],
+        "outcome": metadata.get("outcome"),
+        "state": metadata.get("state"),
+        "feature_id": metadata.get("feature_id"),
+        "timestamp": metadata.get("timestamp")
+    }
+    if "bm25" in hit:
+        entry["bm25"] = round(hit["bm25"], 3)
+    if "rrf" in hit:
+        entry["rrf"] = round(hit["rrf"], 5)
+    if hit.get("archived"):
+        entry["archived"] = True
+    if hit.get("queued"):
+        entry["queued"] = True
+    return entry
+
+def query_markdown(entry: Dict[str, Any], fields: List[str]) -> str:
+    """One hit as a markdown block, showing the selected fields."""
+    # Vector hits show similarity; keyword-only hits show BM25
+    if entry.get("similarity") is not None and "similarity" in fields:
+        score = f" ({entry['similarity'] * 100:.0f}% similar)"
+    elif "bm25" in entry and "bm25" in fields:
+        score = f" (bm25 {entry['bm25']:.2f})"
+    elif entry.get("queued") and "queued" in fields:
+        score = " (queued, keyword match)"
+    elif "similarity" in fields:
+        score = " (N/A)"
+    else:
+        score = ""
+
+    if "decision" in fields:
+        document = entry["decision"]
+        title = document[:100] + "..." if len(document) > 100 else document
+        lines = [f"## {entry['rank']}. {title}{score}", f"- **ID**: `{entry['id']}`"]
+    else:
+        lines = [f"## {entry['rank']}. `{entry['id']}`{score}"]
+    if "category" in fields:
+        lines.append(f"- **Category**: {entry['category']}")
+    if "outcome" in fields:
+        lines.append(f"- **Outcome**: {entry['outcome']}")
+    if entry.get("state") and "state" in fields:
+        lines.append(f"- **State**: {entry['state']}")
+    if entry.get("feature_id") and "feature_id" in fields:
+        lines.append(f"- **Feature**: {entry['feature_id']}")
+    if entry.get("archived") and "archived" in fields:
+        lines.append("- **Archived**: yes")
+    if entry.get("queued") and "queued" in fields:
+        lines.append("- **Queued**: yes (write-behind, not yet embedded)")
+    lines.append("")
+    return "\n".join(lines)
+
+def pack_entries(
+    entries: List[Dict[str, Any]],
+    render: Callable[[Dict[str, Any]], str],
+    budget: int,
+    separator: int = 1
+) -> List[str]:
+    """Rendered leading entries that fit in budget; the first is cut to fit if it must be."""
+    blocks = [render(entry) for entry in entries]
+    fit = pack(blocks, budget, separator)
+    if fit or not entries:
+        return blocks[:fit]
+    # Not even one whole result fits: return the first with its decision shortened
+    first = dict(entries[0])
+    decision = first.get("decision") or ""
+    keep = fit_text(lambda text: render({**first, "decision": text + ELLIPSIS}), decision, budget)
+    first["decision"] = decision[:keep] + ELLIPSIS
+    return [render(first)]
+
+def format_query_results(
+    query: str,
+    mode: str,
+    hits: List[Dict[str, Any]],
+    response_format: str,
+    fields: Sequence[str] = QUERY_FIELDS,
+    budget: int = CHARACTER_LIMIT,
+    start: int = 0,
+    fingerprint: str = ""
+) -> str:
+    """Render context_query_traces hits from `start`, packed into `budget` characters.
+
+    Past the budget the response ends with a cursor that resumes at the
+    first hit left out.
+    """
+    fields = list(fields)
+    entries = [query_entry(start + i, hit) for i, hit in enumerate(hits[start:], 1)]
+
+    if response_format == ResponseFormat.JSON:
+        envelope = {"query": query, "mode": mode, "total": len(hits), "offset": start, "results": [], "next_cursor": None}
+        room = budget - len(compact_json(envelope)) - CURSOR_RESERVE
+        blocks = pack_entries(entries, lambda e: compact_json(project(e, fields)), room)
+        position = start + len(blocks)
+        if position < len(hits):
+            envelope["next_cursor"] = encode_continuation("query", fingerprint, position)
+        # Splice the packed entries in as-is (they are already compact JSON)
+        head, tail = compact_json(envelope).split('"results":[]', 1)
+        return f'{head}"results":[{",".join(blocks)}]{tail}'
+
+    # Markdown format
+    lines = [
+        f"# Similar Traces for: \"{query[:100]}\"",
+        "",
+        f"Found {len(hits)} similar trace(s) ({mode} search)" + (f", from #{start + 1}" if start else ""),
+        ""
+    ]
+    header = "\n".join(lines)
+    blocks = pack_entries(entries, lambda e: query_markdown(e, fields), budget - len(header) - CURSOR_RESERVE)
+    position = start + len(blocks)
+    if position < len(hits):
+        next_cursor = encode_continuation("query", fingerprint, position)
+        blocks.append(f"*{len(hits) - position} more result(s) over the size budget (use cursor=\"{next_cursor}\")*")
+    return "\n".join([header] + blocks)
 
 # ─────────────────────────────────────────────────────────────────
 # Tool Definitions
 # ─────────────────────────────────────────────────────────────────
 
 @mcp.tool(name="context_store_trace")
+@timed_tool
 async def context_store_trace(
     decision: str,
     category: str = "general",
     outcome: str = "pending",
     feature_id: Optional[str] = None,
+    dedupe: Optional[bool] = None,
+    write_behind: Optional[bool] = None,
     project_dir: Optional[str] = None,
     ctx: Optional[Context] = None
 ) -> str:
@@ -267,72 +2678,104 @@ async def context_store_trace(
     semantic search later. Unlike keyword search, this finds decisions
     by meaning and context.
 
+    With write_behind the trace is appended to a local log
+    (.claude/trace-wal.ndjson) and its trace_id returned without waiting
+    for the embedding; it is embedded and added to the store in the
+    background, together with other queued traces. Until then
+    context_query_traces finds it by keyword and context_get_trace returns
+    it marked queued. While another server process is using the project's
+    log, the trace is stored synchronously instead (no "queued" flag).
+
     Args:
         decision: The decision text to store (e.g., 'Chose FastAPI over Flask for async support')
         category: Category for grouping (framework, architecture, api, error, testing, deployment)
         outcome: Initial outcome status (pending/success/failure)
         feature_id: Related feature ID if applicable
+        dedupe: Merge into an existing near-identical trace in the same category
+            instead of inserting (default: context_graph.dedupe.on_store)
+        write_behind: Log the trace and return before it is embedded
+            (default: context_graph.write_behind); never deduplicated on store
         project_dir: Project directory (defaults to current working directory)
 
     Returns:
-        str: JSON with trace_id and metadata
+        str: JSON with trace_id and metadata; a merged trace returns the existing
+            trace_id with "merged": true, its similarity and occurrence count;
+            a write-behind trace has "queued": true
 
     Examples:
         - Store a framework decision: context_store_trace(decision="Chose FastAPI for async", category="framework")
         - Store with outcome: context_store_trace(decision="Used Redis for caching", category="architecture", outcome="success")
         - Link to feature: context_store_trace(decision="Implemented OAuth flow", category="api", feature_id="feat-001")
+        - Skip rewordings: context_store_trace(decision="Picked FastAPI for its async support", category="framework", dedupe=True)
+        - Don't wait for the embedding: context_store_trace(decision="Moved retries into the client", category="api", write_behind=True)
 
     Error Handling:
         - Returns "Error: VOYAGE_API_KEY not found" if key not set
         - Returns "Error: Embedding API failed" if Voyage API call fails
+        - Returns "Error: dedupe needs a synchronous store" with write_behind=True and dedupe=True
     """
     try:
-        api_key = get_voyage_key()
-        collection = get_chroma_client(project_dir)
+        if write_behind is None:
+            # An explicit dedupe=True asks for the synchronous store it needs
+            write_behind = write_behind_enabled(project_dir) and not dedupe
+        elif write_behind and dedupe:
+            return "Error: dedupe needs a synchronous store; pass write_behind=False or leave dedupe unset"
+
+        provider = get_embedding_provider(project_dir)
+        provider.check_available()
+        collection = await get_collection(project_dir)
+        check_collection_provider(collection, provider)
 
         # Generate trace ID
-        timestamp = datetime.now().isoformat()
-        trace_id = f"trace_{hashlib.sha256(f'{timestamp}{decision}'.encode()).hexdigest()[:12]}"
+        metadata = new_trace(decision, category, outcome, feature_id, project_dir)
+        trace_id = metadata["trace_id"]
+        timestamp = metadata["timestamp"]
+
+        result = {
+            "trace_id": trace_id,
+            "timestamp": timestamp,
+            "category": category,
+            "decision": decision[:200] + "..." if len(decision) > 200 else decision,
+            "outcome": outcome
+        }
+
+        # Another server process owning the project's log means a synchronous store
+        queue = await get_write_behind_queue(project_dir) if write_behind else None
+        if queue is not None:
+            await queue.append({"id": trace_id, "document": decision, "metadata": metadata})
+            return json.dumps({**result, "queued": True}, indent=2)
 
         # Get embedding
         if ctx:
             await ctx.report_progress(0.5, "Generating embedding...")
 
-        embedding = await get_embedding(decision, api_key)
+        embedding = await get_embedding(decision, provider, input_type="document", project_dir=project_dir)
+
+        dedupe_config = get_dedupe_config(project_dir)
+        if dedupe_config["on_store"] if dedupe is None else dedupe:
+            duplicate = await find_duplicate(collection, embedding, category, dedupe_config["threshold"], project_dir)
+            if duplicate:
+                occurrences = await merge_duplicate(collection, duplicate["id"], timestamp, project_dir)
+                existing = duplicate["document"]
+                return json.dumps({
+                    "trace_id": duplicate["id"],
+                    "merged": True,
+                    "similarity": round(duplicate["similarity"], 3),
+                    "occurrences": occurrences,
+                    "last_seen": timestamp,
+                    "category": category,
+                    "decision": existing[:200] + "..." if len(existing) > 200 else existing
+                }, indent=2)
 
         if ctx:
             await ctx.report_progress(0.8, "Storing trace...")
 
         # Store in ChromaDB
-        metadata = {
-            "trace_id": trace_id,
-            "timestamp": timestamp,
-            "category": category,
-            "outcome": outcome,
-            "feature_id": feature_id or "",
-            "state": "",
-            "project_dir": project_dir or os.getcwd(),
-            "session_id": ""
-        }
-
-        collection.add(
-            ids=[trace_id],
-            embeddings=[embedding],
-            documents=[decision],
-            metadatas=[metadata]
-        )
+        await add_traces(collection, [trace_id], [embedding], [decision], [metadata], project_dir)
 
         if ctx:
             await ctx.report_progress(1.0, "Trace stored successfully")
 
-        result = {
-            "trace_id": trace_id,
-            "timestamp": timestamp,
-            "category": category,
-            "decision": decision[:200] + "..." if len(decision) > 200 else decision,
-            "outcome": outcome
-        }
-
         return json.dumps(result, indent=2)
 
     except ValueError as e:
@@ -341,138 +2784,443 @@ async def context_store_trace(
         return f"Error: Failed to store trace - {type(e).__name__}: {str(e)}"
 
 
+@mcp.tool(name="context_store_traces_batch")
+@timed_tool
+async def context_store_traces_batch(
+    traces: List[Dict[str, Any]],
+    project_dir: Optional[str] = None,
+    ctx: Optional[Context] = None
+) -> str:
+    """Store many decision traces at once with batched embedding requests.
+
+    Traces are embedded in chunks of up to 128 per Voyage request and each
+    chunk is written to ChromaDB with a single add, so flushing a session's
+    decisions costs a handful of round trips instead of one per trace.
+    Invalid items are reported individually and do not fail the batch.
+
+    Args:
+        traces: List of traces, each with 'decision' and optional 'category',
+            'outcome' (pending/success/failure) and 'feature_id'
+        project_dir: Project directory (defaults to current working directory)
+
+    Returns:
+        str: JSON with stored/failed counts and a per-item result
+            ({"index", "status": "stored"|"error", "trace_id" or "error"})
+
+    Examples:
+        - Flush decisions: context_store_traces_batch(traces=[{"decision": "Chose FastAPI for async", "category": "framework"}, {"decision": "Used Redis for caching", "category": "architecture", "outcome": "success"}])
+
+    Error Handling:
+        - Returns "Error: VOYAGE_API_KEY not found" if key not set
+        - Items failing validation, embedding or storage get status "error"
+    """
+    try:
+        if not traces:
+            return "Error: No traces provided."
+
+        provider = get_embedding_provider(project_dir)
+        provider.check_available()
+        collection = await get_collection(project_dir)
+        check_collection_provider(collection, provider)
+
+        results: List[Dict[str, Any]] = [{} for _ in traces]
+        valid = []
+        for index, item in enumerate(traces):
+            try:
+                trace = StoreTraceInput.model_validate({**item, "project_dir": project_dir})
+            except ValidationError as e:
+                message = "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+                results[index] = {"index": index, "status": "error", "error": message}
+                continue
+            valid.append((index, trace))
+
+        total = len(valid)
+        done = 0
+        if ctx:
+            await ctx.report_progress(0, total)
+
+        for start in range(0, total, EMBEDDING_BATCH_SIZE):
+            chunk = valid[start:start + EMBEDDING_BATCH_SIZE]
+            try:
+                embeddings = await get_embeddings(
+                    [trace.decision for _, trace in chunk],
+                    provider,
+                    input_type="document",
+                    project_dir=project_dir
+                )
+                metadatas = [
+                    new_trace(
+                        trace.decision,
+                        trace.category,
+                        trace.outcome.value,
+                        trace.feature_id,
+                        project_dir,
+                        salt=str(index)
+                    )
+                    for index, trace in chunk
+                ]
+                await add_traces(
+                    collection,
+                    [m["trace_id"] for m in metadatas],
+                    embeddings,
+                    [trace.decision for _, trace in chunk],
+                    metadatas,
+                    project_dir
+                )
+                for (index, _), metadata in zip(chunk, metadatas):
+                    results[index] = {"index": index, "status": "stored", "trace_id": metadata["trace_id"]}
+            except Exception as e:
+                for index, _ in chunk:
+                    results[index] = {"index": index, "status": "error", "error": f"{type(e).__name__}: {str(e)}"}
+
+            done += len(chunk)
+            if ctx:
+                await ctx.report_progress(done, total)
+
+        stored = sum(1 for r in results if r["status"] == "stored")
+        return json.dumps({
+            "total": len(traces),
+            "stored": stored,
+            "failed": len(traces) - stored,
+            "results": results
+        }, indent=2)
+
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    except Exception as e:
+        return f"Error: Failed to store traces - {type(e).__name__}: {str(e)}"
+
+
 @mcp.tool(name="context_query_traces")
+@timed_tool
 async def context_query_traces(
     query: str,
     limit: int = 5,
     category: Optional[str] = None,
     outcome: Optional[str] = None,
+    mode: str = "vector",
+    include_archive: bool = False,
     response_format: str = "markdown",
+    fields: Optional[List[str]] = None,
+    max_tokens: Optional[int] = None,
+    max_chars: Optional[int] = None,
+    cursor: Optional[str] = None,
     project_dir: Optional[str] = None,
     ctx: Optional[Context] = None
 ) -> str:
-    """Query traces by semantic similarity to find relevant past decisions.
+    """Query traces by meaning, by keyword, or both, to find relevant past decisions.
 
-    Uses vector embeddings to find traces similar to your query by meaning,
-    not just keywords. This helps when facing similar situations and wanting
-    to know what decisions were made before.
+    Vector search uses embeddings to match traces by meaning, not just
+    keywords. Lexical search ranks traces by BM25 over an inverted index and
+    needs no embedding call. Hybrid runs both and merges them with
+    reciprocal rank fusion. This helps when facing similar situations
+    and wanting to know what decisions were made before. Traces stored
+    with write_behind that are not embedded yet are matched by keyword and
+    fused into the results the same way, flagged queued.
 
     Args:
         query: Search query to find similar decisions (e.g., 'web framework selection')
         limit: Maximum results to return (1-50, default 5)
         category: Filter by category (optional)
         outcome: Filter by outcome (optional)
-        response_format: Output format (markdown/json)
+        mode: Retrieval mode: vector (default), hybrid, or lexical (no network call)
+        include_archive: Also search traces moved to the archive by compaction
+            (vector and hybrid modes; archived results are flagged)
+        response_format: Output format (markdown/json; JSON is compact)
+        fields: Return only these fields of each result (id is always included):
+            rank, similarity, bm25, rrf, id, category, decision, outcome, state,
+            feature_id, timestamp, archived, queued
+        max_tokens: Response size budget in tokens (about 4 characters each)
+        max_chars: Response size budget in characters (both capped at 25000)
+        cursor: Continuation cursor from a response cut short by its budget;
+            repeat the original query arguments with it
         project_dir: Project directory (defaults to current working directory)
 
     Returns:
-        str: Formatted results with similarity scores
+        str: Formatted results with similarity (vector) or relevance scores.
+            Results that do not fit the budget are left out in rank order
+            and the response ends with a next_cursor for them.
 
     Examples:
         - Find framework decisions: context_query_traces(query="web framework choice")
         - Find in category: context_query_traces(query="database", category="architecture")
+        - Keyword lookup, offline: context_query_traces(query="Redis", mode="lexical")
+        - Meaning and keywords: context_query_traces(query="async retries", mode="hybrid")
         - More results: context_query_traces(query="error handling", limit=10)
         - JSON output: context_query_traces(query="api design", response_format="json")
+        - Include compacted traces: context_query_traces(query="auth flow", include_archive=True)
+        - IDs and scores only: context_query_traces(query="auth", response_format="json", fields=["similarity"])
+        - Small budget: context_query_traces(query="caching", limit=20, max_tokens=500)
+        - The rest: context_query_traces(query="caching", limit=20, max_tokens=500, cursor="WyJxdWVyeSIs...")
 
     Error Handling:
         - Returns "Error: No traces found" if database is empty
-        - Returns "Error: VOYAGE_API_KEY not found" if key not set
+        - Returns "Error: VOYAGE_API_KEY not found" if key not set (vector and hybrid modes)
+        - Returns "Error: Invalid mode" for an unknown mode
+        - Returns "Error: include_archive needs vector or hybrid mode" in lexical mode
+        - Returns "Error: Unknown field(s)" for a field not listed above
+        - Returns "Error: Budget too small" below 200 characters (50 tokens)
+        - Returns "Error: Invalid cursor" for a malformed cursor or one from other arguments
     """
     try:
-        api_key = get_voyage_key()
-        collection = get_chroma_client(project_dir)
+        if mode not in {m.value for m in SearchMode}:
+            return f"Error: Invalid mode '{mode}'. Use one of: {', '.join(m.value for m in SearchMode)}"
+        if include_archive and mode == SearchMode.LEXICAL:
+            return "Error: include_archive needs vector or hybrid mode (archived traces are searched by embedding)"
+        selected = select_fields(fields, QUERY_FIELDS)
+        budget = char_budget(CHARACTER_LIMIT, max_tokens, max_chars)
+        fingerprint = request_fingerprint(query, mode, category, outcome, limit, include_archive)
+        start = decode_continuation(cursor, "query", fingerprint) if cursor else 0
+
+        provider = get_embedding_provider(project_dir)
+        collection = await get_collection(project_dir)
+        if mode != SearchMode.LEXICAL:
+            provider.check_available()
+            check_collection_provider(collection, provider)
+
+        # Taken before the search: a trace committed meanwhile is still found once
+        queue = await get_write_behind_queue(project_dir, create=False)
+        queued = list(queue.queued.values()) if queue else []
 
         # Check if collection has any data
-        count = collection.count()
-        if count == 0:
+        count = await run_chroma(collection.count)
+        if count == 0 and not include_archive and not queued:
             return f"# No traces found\n\nStore decisions first to enable semantic search."
 
+        # Repeated queries against an unchanged store skip embedding and search
+        query_cache = get_query_cache(project_dir)
+        version = collection_version(project_dir)
+        hits = None
+        if query_cache:
+            # The index's write_seq moves with writes from other processes too
+            write_seq = await run_chroma((await get_trace_index(project_dir)).write_seq)
+            cache_mode = f"{mode}+archive" if include_archive else mode
+            cache_key = query_cache_key(provider.model, query, cache_mode, category, outcome, limit, write_seq, count)
+            hits = query_cache.get(cache_key)
+
+        if hits is None:
+            # Hybrid ranks a deeper candidate list from each side before fusing
+            depth = limit if mode != SearchMode.HYBRID else max(limit * 4, 20)
+            vector_hits: List[Dict[str, Any]] = []
+            lexical_hits: List[Dict[str, Any]] = []
+
+            if mode != SearchMode.VECTOR:
+                index = await get_synced_trace_index(collection, project_dir)
+                with STAGE_LATENCY.time("lexical_search"):
+                    rows = await run_chroma(index.search, query, category, outcome, depth)
+                lexical_hits = [
+                    {
+                        "id": row["id"],
+                        "document": row["decision"],
+                        "metadata": index_row_metadata(row),
+                        "bm25": row["score"]
+                    }
+                    for row in rows
+                ]
+
+            if mode != SearchMode.LEXICAL:
+                if ctx:
+                    await ctx.report_progress(0.3, "Generating query embedding...")
+
+                # Get query embedding
+                query_embedding = await get_embedding(query, provider, input_type="query", project_dir=project_dir)
+
+                if ctx:
+                    await ctx.report_progress(0.7, "Searching traces...")
+
+                # Build where clause for filters
+                where = {}
+                if category:
+                    where["category"] = category
+                if outcome:
+                    where["outcome"] = outcome
+
+                # Query ChromaDB
+                if count:
+                    vector_hits = await vector_search(collection, query_embedding, depth, where or None, project_dir)
+                if include_archive:
+                    archive = get_trace_archive(project_dir)
+                    with STAGE_LATENCY.time("archive_search"):
+                        archived = await run_chroma(
+                            archive.search, query_embedding, depth, provider.describe(), category, outcome
+                        )
+                    hot_ids = {hit["id"] for hit in vector_hits}
+                    vector_hits = sorted(
+                        vector_hits + [hit for hit in archived if hit["id"] not in hot_ids],
+                        key=lambda hit: hit["similarity"],
+                        reverse=True
+                    )[:depth]
+
+            if mode == SearchMode.HYBRID:
+                hits = fuse_hits([vector_hits, lexical_hits], limit)
+            else:
+                hits = (vector_hits or lexical_hits)[:limit]
+
+            # A write that landed mid-query already moved the version on
+            if query_cache and version == collection_version(project_dir):
+                query_cache.put(cache_key, hits)
+
+        # Queued write-behind traces have no embedding yet; fuse in keyword matches
+        if queued:
+            found = {hit["id"] for hit in hits}
+            matches = [
+                {"id": record["id"], "document": record["document"], "metadata": record["metadata"], "queued": True}
+                for _, record in match_queued(queued, query, category, outcome, limit)
+                if record["id"] not in found
+            ]
+            if matches:
+                # Ties go to the queued trace, the newer of the two
+                hits = fuse_hits([matches, hits], limit)
+
+        if not hits:
+            return f"# No similar traces found\n\nQuery: '{query}'\n\nNo traces match your search."
+
+        with STAGE_LATENCY.time("format"):
+            return format_query_results(query, mode, hits, response_format, selected, budget, start, fingerprint)
+
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    except Exception as e:
+        return f"Error: Query failed - {type(e).__name__}: {str(e)}"
+
+
+@mcp.tool(name="context_query_all_projects")
+@timed_tool
+async def context_query_all_projects(
+    query: str,
+    limit: int = 5,
+    category: Optional[str] = None,
+    outcome: Optional[str] = None,
+    project_dirs: Optional[List[str]] = None,
+    timeout: Optional[float] = None,
+    response_format: str = "markdown",
+    project_dir: Optional[str] = None,
+    ctx: Optional[Context] = None
+) -> str:
+    """Search for similar decisions across every registered project store.
+
+    Embeds the query once, runs the vector search against each project's
+    .claude/chroma store concurrently, and merges the results globally by
+    similarity. A store that does not answer within the timeout is skipped
+    and reported, so one slow store cannot stall the answer.
+
+    Args:
+        query: Search query to find similar decisions (e.g., 'retry policy')
+        limit: Maximum results to return across all stores (1-50, default 5)
+        category: Filter by category (optional)
+        outcome: Filter by outcome (optional)
+        project_dirs: Stores to search (defaults to this project plus the registered ones)
+        timeout: Per-store timeout in seconds (default CONTEXT_GRAPH_FEDERATED_TIMEOUT)
+        response_format: Output format (markdown/json)
+        project_dir: Project directory whose embedding provider and registry are used
+
+    Returns:
+        str: Merged results with the project each trace came from, plus per-store status
+
+    Examples:
+        - Search the monorepo: context_query_all_projects(query="caching layer")
+        - Specific stores: context_query_all_projects(query="auth", project_dirs=["/repo/api", "/repo/web"])
+
+    Error Handling:
+        - Returns "Error: VOYAGE_API_KEY not found" if key not set
+        - Stores that are missing, time out, or use a different embedding model
+          are listed with their status instead of failing the whole query
+    """
+    try:
+        provider = get_embedding_provider(project_dir)
+        provider.check_available()
+        stores = project_dirs if project_dirs else get_registered_projects(project_dir)
+        timeout = timeout if timeout is not None else FEDERATED_TIMEOUT
+
         if ctx:
             await ctx.report_progress(0.3, "Generating query embedding...")
 
-        # Get query embedding
-        query_embedding = await get_embedding(query, api_key)
+        query_embedding = await get_embedding(query, provider, input_type="query", project_dir=project_dir)
 
         if ctx:
-            await ctx.report_progress(0.7, "Searching traces...")
+            await ctx.report_progress(0.6, f"Searching {len(stores)} project stores...")
 
-        # Build where clause for filters
         where = {}
         if category:
             where["category"] = category
         if outcome:
             where["outcome"] = outcome
 
-        # Query ChromaDB
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=limit,
-            where=where if where else None
-        )
-
-        if not results or not results['ids'][0]:
-            return f"# No similar traces found\n\nQuery: '{query}'\n\nNo traces match your search."
+        async def search(store_dir: Optional[str]) -> tuple:
+            start = time.perf_counter()
+            try:
+                hits = await asyncio.wait_for(
+                    search_project_store(store_dir, query_embedding, provider, limit, where or None),
+                    timeout
+                )
+                status = "ok"
+            except asyncio.TimeoutError:
+                hits, status = [], "timeout"
+            except FileNotFoundError:
+                hits, status = [], "missing"
+            except Exception as e:
+                hits, status = [], f"error: {e}"
+            return hits, status, (time.perf_counter() - start) * 1000
+
+        answers = await asyncio.gather(*(search(store_dir) for store_dir in stores))
+
+        merged = []
+        store_report = []
+        for store_dir, (hits, status, elapsed_ms) in zip(stores, answers):
+            name = store_dir or os.getcwd()
+            store_report.append({
+                "project_dir": name,
+                "status": status,
+                "results": len(hits),
+                "ms": round(elapsed_ms, 1)
+            })
+            merged.extend({**hit, "project_dir": name} for hit in hits)
+        # Stores may use different metrics; similarity is comparable across them
+        merged.sort(key=lambda hit: hit["similarity"], reverse=True)
+        merged = merged[:limit]
 
-        # Format results
         if response_format == ResponseFormat.JSON:
-            output = []
-            for i, trace_id in enumerate(results['ids'][0], 1):
-                metadata = results['metadatas'][0][i-1]
-                document = results['documents'][0][i-1]
-                distance = results['distances'][0][i-1] if results['distances'] else None
-
-                # Convert distance to similarity (ChromaDB uses L2 distance)
-                similarity = 1 / (1 + distance) if distance is not None else None
-
-                output.append({
-                    "rank": i,
-                    "similarity": round(similarity, 3) if similarity else None,
-                    "id": trace_id,
-                    "category": metadata.get("category"),
-                    "decision": document,
-                    "outcome": metadata.get("outcome"),
-                    "state": metadata.get("state"),
-                    "feature_id": metadata.get("feature_id"),
-                    "timestamp": metadata.get("timestamp")
-                })
-
             return json.dumps({
                 "query": query,
-                "total": len(output),
-                "results": output
+                "total": len(merged),
+                "results": [
+                    {
+                        "rank": i,
+                        "similarity": round(hit["similarity"], 3),
+                        "project_dir": hit["project_dir"],
+                        "id": hit["id"],
+                        "category": hit["metadata"].get("category"),
+                        "decision": hit["document"],
+                        "outcome": hit["metadata"].get("outcome"),
+                        "feature_id": hit["metadata"].get("feature_id"),
+                        "timestamp": hit["metadata"].get("timestamp")
+                    }
+                    for i, hit in enumerate(merged, 1)
+                ],
+                "stores": store_report
             }, indent=2)
 
-        else:
-            # Markdown format
-            lines = [
-                f"# Similar Traces for: \"{query[:100]}\"",
-                "",
-                f"Found {len(results['ids'][0])} similar trace(s)",
-                ""
-            ]
+        lines = [
+            f"# Similar Traces Across Projects: \"{query[:100]}\"",
+            "",
+            f"Found {len(merged)} trace(s) in {sum(1 for s in store_report if s['status'] == 'ok')}/{len(stores)} stores",
+            ""
+        ]
+        for i, hit in enumerate(merged, 1):
+            document = hit["document"]
+            short_decision = document[:100] + "..." if len(document) > 100 else document
+            lines.append(f"## {i}. {short_decision} ({hit['similarity'] * 100:.0f}% similar)")
+            lines.append(f"- **Project**: {hit['project_dir']}")
+            lines.append(f"- **ID**: `{hit['id']}`")
+            lines.append(f"- **Category**: {hit['metadata'].get('category')}")
+            lines.append(f"- **Outcome**: {hit['metadata'].get('outcome')}")
+            lines.append("")
 
-            for i, trace_id in enumerate(results['ids'][0], 1):
-                metadata = results['metadatas'][0][i-1]
-                document = results['documents'][0][i-1]
-                distance = results['distances'][0][i-1] if results['distances'] else None
-
-                # Convert distance to similarity percentage
-                similarity = 1 / (1 + distance) if distance is not None else None
-                similarity_pct = f"{similarity * 100:.0f}%" if similarity else "N/A"
-
-                short_decision = document[:100] + "..." if len(document) > 100 else document
-
-                lines.append(f"## {i}. {short_decision} ({similarity_pct} similar)")
-                lines.append(f"- **ID**: `{trace_id}`")
-                lines.append(f"- **Category**: {metadata.get('category')}")
-                lines.append(f"- **Outcome**: {metadata.get('outcome')}")
-                if metadata.get('state'):
-                    lines.append(f"- **State**: {metadata.get('state')}")
-                if metadata.get('feature_id'):
-                    lines.append(f"- **Feature**: {metadata.get('feature_id')}")
-                lines.append("")
+        lines.append("## Stores")
+        for store in store_report:
+            lines.append(f"- {store['project_dir']}: {store['status']} ({store['results']} results, {store['ms']:.0f}ms)")
 
-            return "\n".join(lines)
+        return "\n".join(lines)
 
     except ValueError as e:
         return f"Error: {str(e)}"
@@ -481,80 +3229,138 @@ async def context_query_traces(
 
 
 @mcp.tool(name="context_get_trace")
+@timed_tool
 async def context_get_trace(
     trace_id: str,
     response_format: str = "markdown",
+    fields: Optional[List[str]] = None,
+    max_tokens: Optional[int] = None,
+    max_chars: Optional[int] = None,
+    cursor: Optional[str] = None,
     project_dir: Optional[str] = None
 ) -> str:
     """Retrieve full details of a specific trace by ID.
 
     Args:
         trace_id: The unique trace identifier (e.g., 'trace_abc123...')
-        response_format: Output format (markdown/json)
+        response_format: Output format (markdown/json; JSON is compact)
+        fields: Return only these fields (id is always included): id, timestamp,
+            category, decision, outcome, session_id, feature_id, state,
+            project_dir, occurrences, last_seen, archived, queued
+        max_tokens: Response size budget in tokens (about 4 characters each)
+        max_chars: Response size budget in characters (both capped at 25000)
+        cursor: Continuation cursor from a response whose decision text was cut short
         project_dir: Project directory (defaults to current working directory)
 
     Returns:
-        str: Full trace details
+        str: Full trace details (archived traces are looked up in the archive;
+            write-behind traces not yet in the store are marked queued).
+            A decision too long for the budget is cut, and the response carries
+            a next_cursor for the rest of the text.
 
     Examples:
         - Get trace details: context_get_trace(trace_id="trace_abc123...")
+        - Just the outcome: context_get_trace(trace_id="trace_abc123...", response_format="json", fields=["outcome"])
+        - Rest of a long decision: context_get_trace(trace_id="trace_abc123...", cursor="WyJnZXQiLC...")
     """
     try:
-        collection = get_chroma_client(project_dir)
+        selected = select_fields(fields, GET_FIELDS)
+        budget = char_budget(CHARACTER_LIMIT, max_tokens, max_chars)
+        start = decode_continuation(cursor, "get", trace_id) if cursor else 0
+        collection = await get_collection(project_dir)
+
+        # A write-behind trace leaves the queue only after it is in the store
+        queue = await get_write_behind_queue(project_dir, create=False)
+        queued = queue.queued.get(trace_id) if queue else None
 
         # Get the trace
-        results = collection.get(
+        results = await run_chroma(
+            collection.get,
             ids=[trace_id],
-            include=["embeddings", "documents", "metadatas"]
-        )
-
-        if not results or not results['ids']:
-            return f"Error: Trace '{trace_id}' not found."
-
-        metadata = results['metadatas'][0]
-        document = results['documents'][0]
+            include=["documents", "metadatas"]
+        ) if queued is None else None
+
+        archived = False
+        if queued is not None:
+            metadata, document = queued["metadata"], queued["document"]
+        elif results and results['ids']:
+            metadata = results['metadatas'][0]
+            document = results['documents'][0]
+        else:
+            record = await run_chroma(get_trace_archive(project_dir).get, trace_id)
+            if record is None:
+                return f"Error: Trace '{trace_id}' not found."
+            metadata, document, archived = record["metadata"], record["document"], True
+
+        trace = project({
+            "id": trace_id,
+            "timestamp": metadata.get("timestamp"),
+            "category": metadata.get("category"),
+            "decision": document,
+            "outcome": metadata.get("outcome"),
+            "session_id": metadata.get("session_id"),
+            "feature_id": metadata.get("feature_id"),
+            "state": metadata.get("state"),
+            "project_dir": metadata.get("project_dir"),
+            "occurrences": metadata.get("occurrences", 1),
+            "last_seen": metadata.get("last_seen") or metadata.get("timestamp"),
+            "archived": archived,
+            "queued": queued is not None
+        }, selected)
 
         if response_format == ResponseFormat.JSON:
-            return json.dumps({
-                "id": trace_id,
-                "timestamp": metadata.get("timestamp"),
-                "category": metadata.get("category"),
-                "decision": document,
-                "outcome": metadata.get("outcome"),
-                "session_id": metadata.get("session_id"),
-                "feature_id": metadata.get("feature_id"),
-                "state": metadata.get("state"),
-                "project_dir": metadata.get("project_dir")
-            }, indent=2)
+            def render(text: str, next_cursor: Optional[str] = None) -> str:
+                shown = {**trace, "decision": text} if "decision" in trace else dict(trace)
+                if start:
+                    shown["decision_offset"] = start
+                if next_cursor:
+                    shown["next_cursor"] = next_cursor
+                return compact_json(shown)
 
         else:
-            lines = [
-                f"# Trace: {trace_id}",
-                "",
-                f"**Decision**: {document}",
-                f"**Category**: {metadata.get('category')}",
-                f"**Outcome**: {metadata.get('outcome')}",
-                f"**Timestamp**: {metadata.get('timestamp')}",
-                ""
-            ]
+            def render(text: str, next_cursor: Optional[str] = None) -> str:
+                lines = [f"# Trace: {trace_id}", ""]
+                if "decision" in trace:
+                    lines.append(f"**Decision**{f' (from character {start})' if start else ''}: {text}")
+                for name, label in (("category", "Category"), ("outcome", "Outcome"), ("timestamp", "Timestamp")):
+                    if name in trace:
+                        lines.append(f"**{label}**: {trace[name]}")
+                lines.append("")
 
-            if metadata.get('session_id'):
-                lines.append(f"**Session**: {metadata.get('session_id')}")
-            if metadata.get('feature_id'):
-                lines.append(f"**Feature**: {metadata.get('feature_id')}")
-            if metadata.get('state'):
-                lines.append(f"**State**: {metadata.get('state')}")
-            if metadata.get('project_dir'):
-                lines.append(f"**Project**: {metadata.get('project_dir')}")
-            lines.append("")
+                for name, label in (("session_id", "Session"), ("feature_id", "Feature"),
+                                    ("state", "State"), ("project_dir", "Project")):
+                    if trace.get(name):
+                        lines.append(f"**{label}**: {trace[name]}")
+                if trace.get("occurrences", 1) > 1:
+                    last_seen = f" (last seen {trace['last_seen']})" if "last_seen" in trace else ""
+                    lines.append(f"**Occurrences**: {trace['occurrences']}{last_seen}")
+                if trace.get("archived"):
+                    lines.append("**Archived**: yes")
+                if trace.get("queued"):
+                    lines.append("**Queued**: yes (write-behind, not yet embedded)")
+                lines.append("")
+                if next_cursor:
+                    lines.append(f"*Decision continues (use cursor=\"{next_cursor}\")*")
 
-            return "\n".join(lines)
+                return "\n".join(lines)
+
+        # A decision longer than the budget allows is cut; the cursor resumes the text
+        text = document[start:]
+        if len(render(text)) <= budget:
+            return render(text)
+        keep = fit_text(lambda part: render(part + ELLIPSIS), text, budget - CURSOR_RESERVE)
+        if "decision" not in trace or keep == 0:
+            return f"Error: Trace '{trace_id}' does not fit in {budget} characters; request fewer fields"
+        return render(text[:keep] + ELLIPSIS, encode_continuation("get", trace_id, start + keep))
 
+    except ValueError as e:
+        return f"Error: {str(e)}"
     except Exception as e:
         return f"Error: Failed to get trace - {type(e).__name__}: {str(e)}"
 
 
 @mcp.tool(name="context_update_outcome")
+@timed_tool
 async def context_update_outcome(
     trace_id: str,
     outcome: str,
@@ -579,32 +3385,23 @@ async def context_update_outcome(
 
     Error Handling:
         - Returns "Error: Trace '{trace_id}' not found" if invalid ID
+        - Returns "Error: Invalid outcome" for anything but pending/success/failure
+        - Returns "Error: Trace '{trace_id}' is still queued" if a write-behind trace
+          is not in the store within CONTEXT_GRAPH_WRITE_BEHIND_SETTLE_TIMEOUT
     """
     try:
-        collection = get_chroma_client(project_dir)
+        if outcome not in {o.value for o in TraceOutcome}:
+            return f"Error: Invalid outcome '{outcome}'. Use pending, success or failure."
 
-        # Get current trace
-        results = collection.get(
-            ids=[trace_id],
-            include=["metadatas", "documents", "embeddings"]
-        )
+        collection = await get_collection(project_dir)
+        queue = await settle_write_behind(project_dir)
 
-        if not results or not results['ids']:
+        updated = await apply_outcome_updates(collection, {trace_id: outcome}, project_dir)
+        if trace_id not in updated:
+            if queue and trace_id in queue.queued:
+                return f"Error: Trace '{trace_id}' is still queued for the store (write-behind); retry shortly."
             return f"Error: Trace '{trace_id}' not found."
 
-        # Update metadata
-        metadata = results['metadatas'][0].copy()
-        metadata['outcome'] = outcome
-
-        # Update in ChromaDB (delete and re-add since ChromaDB doesn't have update)
-        collection.delete(ids=[trace_id])
-        collection.add(
-            ids=[trace_id],
-            embeddings=[results['embeddings'][0]],
-            documents=[results['documents'][0]],
-            metadatas=[metadata]
-        )
-
         result = {
             "trace_id": trace_id,
             "outcome": outcome,
@@ -617,135 +3414,227 @@ async def context_update_outcome(
         return f"Error: Failed to update outcome - {type(e).__name__}: {str(e)}"
 
 
+@mcp.tool(name="context_update_outcomes")
+@timed_tool
+async def context_update_outcomes(
+    updates: List[Dict[str, str]],
+    project_dir: Optional[str] = None
+) -> str:
+    """Update the outcome status of many traces in one call.
+
+    Applies all updates with a single metadata write, e.g. flipping every
+    pending trace of a completed feature to success.
+
+    Args:
+        updates: List of {"trace_id": ..., "outcome": "pending"|"success"|"failure"}
+        project_dir: Project directory (defaults to current working directory)
+
+    Returns:
+        str: JSON with updated/failed counts and a per-item result
+
+    Examples:
+        - Complete a feature: context_update_outcomes(updates=[{"trace_id": "trace_abc...", "outcome": "success"}, {"trace_id": "trace_def...", "outcome": "success"}])
+
+    Error Handling:
+        - Unknown trace IDs and invalid outcomes are reported per item
+    """
+    try:
+        if not updates:
+            return "Error: No updates provided."
+
+        collection = await get_collection(project_dir)
+        queue = await settle_write_behind(project_dir)
+        valid_outcomes = {o.value for o in TraceOutcome}
+
+        results: List[Dict[str, Any]] = []
+        pending: Dict[str, str] = {}
+        for item in updates:
+            trace_id = item.get("trace_id")
+            outcome = item.get("outcome")
+            if not trace_id:
+                results.append({"trace_id": trace_id, "error": "trace_id is required"})
+            elif outcome not in valid_outcomes:
+                results.append({"trace_id": trace_id, "error": f"Invalid outcome '{outcome}'. Use pending, success or failure."})
+            else:
+                pending[trace_id] = outcome
+                results.append({"trace_id": trace_id, "outcome": outcome})
+
+        updated = await apply_outcome_updates(collection, pending, project_dir) if pending else set()
+        for result in results:
+            if "error" in result:
+                continue
+            if result["trace_id"] in updated:
+                result["updated"] = True
+            elif queue and result["trace_id"] in queue.queued:
+                result["error"] = "Trace is still queued for the store (write-behind)"
+            else:
+                result["error"] = "Trace not found"
+
+        count = sum(1 for r in results if r.get("updated"))
+        return json.dumps({
+            "total": len(updates),
+            "updated": count,
+            "failed": len(updates) - count,
+            "results": results
+        }, indent=2)
+
+    except Exception as e:
+        return f"Error: Failed to update outcomes - {type(e).__name__}: {str(e)}"
+
+
 @mcp.tool(name="context_list_traces")
+@timed_tool
 async def context_list_traces(
     category: Optional[str] = None,
     outcome: Optional[str] = None,
     limit: int = 20,
     offset: int = 0,
+    cursor: Optional[str] = None,
     response_format: str = "markdown",
+    fields: Optional[List[str]] = None,
+    max_tokens: Optional[int] = None,
+    max_chars: Optional[int] = None,
     project_dir: Optional[str] = None
 ) -> str:
     """List all stored traces with optional filtering and pagination.
 
+    Listing reads a sidecar SQLite index, so each page costs O(limit)
+    regardless of how many traces are stored. Prefer the returned cursor
+    over offset for paging through large stores. Write-behind traces still
+    queued are given a few seconds to reach the store first.
+
     Args:
         category: Filter by category (optional)
         outcome: Filter by outcome (optional)
         limit: Maximum results to return (1-100, default 20)
-        offset: Number of results to skip (default 0)
-        response_format: Output format (markdown/json)
+        offset: Number of results to skip (default 0, ignored when cursor is set)
+        cursor: Continuation cursor from a previous page's next_cursor (optional)
+        response_format: Output format (markdown/json; JSON is compact)
+        fields: Return only these fields of each trace (id is always included):
+            id, timestamp, category, decision, outcome, feature_id, state
+        max_tokens: Response size budget in tokens (about 4 characters each)
+        max_chars: Response size budget in characters (both capped at 25000)
         project_dir: Project directory (defaults to current working directory)
 
     Returns:
-        str: Formatted list of traces with pagination info
+        str: Formatted list of traces with pagination info. A page that does
+            not fit the budget is cut short; its next_cursor (or next_offset)
+            continues from the last trace returned.
 
     Examples:
         - List all traces: context_list_traces()
         - Filter by category: context_list_traces(category="framework")
         - Get more results: context_list_traces(limit=50)
+        - Next page: context_list_traces(cursor="WyIyMDI1LTAx...")
         - Paginate: context_list_traces(offset=20)
+        - IDs and categories, compact: context_list_traces(response_format="json", fields=["category"])
+        - Within a budget: context_list_traces(limit=100, max_tokens=1000)
 
     Error Handling:
-        - Returns "Error: No traces database found" if not initialized
+        - Returns "Error: No traces found" if the store is empty
+        - Returns "Error: Invalid cursor" if the cursor is malformed
+        - Returns "Error: Unknown field(s)" for a field not listed above
+        - Returns "Error: Budget too small" below 200 characters (50 tokens)
     """
     try:
-        collection = get_chroma_client(project_dir)
-
-        # Get all traces
-        results = collection.get(
-            include=["documents", "metadatas"]
-        )
+        selected = select_fields(fields, LIST_FIELDS)
+        budget = char_budget(CHARACTER_LIMIT, max_tokens, max_chars)
+        collection = await get_collection(project_dir)
+        await settle_write_behind(project_dir)
+        index = await get_synced_trace_index(collection, project_dir)
 
-        if not results or not results['ids']:
+        if await run_chroma(index.count) == 0:
             return "Error: No traces found. Store a trace first."
 
-        # Filter and format
-        traces = []
-        for i, trace_id in enumerate(results['ids']):
-            metadata = results['metadatas'][i]
-            document = results['documents'][i]
-
-            # Apply filters
-            if category and metadata.get('category') != category:
-                continue
-            if outcome and metadata.get('outcome') != outcome:
-                continue
-
-            traces.append({
-                'id': trace_id,
-                'timestamp': metadata.get('timestamp'),
-                'category': metadata.get('category'),
-                'decision': document,
-                'outcome': metadata.get('outcome'),
-                'feature_id': metadata.get('feature_id'),
-                'state': metadata.get('state')
-            })
-
-        # Sort by timestamp (newest first)
-        traces.sort(key=lambda x: x['timestamp'], reverse=True)
+        # One extra row tells us whether another page exists
+        page = await run_chroma(
+            index.list_traces,
+            category=category,
+            outcome=outcome,
+            limit=limit + 1,
+            offset=offset,
+            cursor=cursor
+        )
+        total = await run_chroma(index.count, category, outcome)
+
+        if cursor:
+            offset = 0
+
+        # Pack whole traces into the budget; a cut page continues after its last trace
+        def page_end(shown: int) -> Dict[str, Any]:
+            more = shown < len(page)
+            return {
+                "has_more": more,
+                "next_offset": offset + shown if more and not cursor else None,
+                "next_cursor": encode_cursor(page[shown - 1]['timestamp'], page[shown - 1]['id']) if more else None
+            }
 
-        # Apply pagination
-        total = len(traces)
-        paginated = traces[offset:offset + limit]
+        entries = [
+            {**t, "decision": t['decision'][:100] + "..." if len(t['decision']) > 100 else t['decision']}
+            for t in page[:limit]
+        ]
 
         if response_format == ResponseFormat.JSON:
-            results_data = []
-            for t in paginated:
-                results_data.append({
-                    "id": t['id'],
-                    "timestamp": t['timestamp'],
-                    "category": t['category'],
-                    "decision": t['decision'][:100] + "..." if len(t['decision']) > 100 else t['decision'],
-                    "outcome": t['outcome'],
-                    "feature_id": t['feature_id'],
-                    "state": t['state']
-                })
-
-            return json.dumps({
-                "total": total,
-                "count": len(results_data),
-                "offset": offset,
-                "has_more": offset + len(results_data) < total,
-                "next_offset": offset + len(results_data) if offset + len(results_data) < total else None,
-                "traces": results_data
-            }, indent=2)
+            envelope = {"total": total, "count": 0, "offset": offset, **page_end(1), "traces": []}
+            room = budget - len(compact_json(envelope)) - CURSOR_RESERVE
+            blocks = pack_entries(entries, lambda t: compact_json(project(t, selected)), room)
+            envelope.update(count=len(blocks), **page_end(len(blocks)))
+            head, tail = compact_json(envelope).split('"traces":[]', 1)
+            return f'{head}"traces":[{",".join(blocks)}]{tail}'
 
         else:
-            lines = [
-                f"# Decision Traces",
-                "",
-                f"**Total**: {total} | **Showing**: {len(paginated)} (offset {offset})",
-                ""
-            ]
-
-            if category:
-                lines.append(f"**Filter**: category='{category}'")
-            if outcome:
-                lines.append(f"**Filter**: outcome='{outcome}'")
-            lines.append("")
-
-            for t in paginated:
-                short_decision = t['decision'][:80] + "..." if len(t['decision']) > 80 else t['decision']
-
-                lines.append(f"## {short_decision}")
-                lines.append(f"- **ID**: `{t['id']}`")
-                lines.append(f"- **Category**: {t['category']} | **Outcome**: {t['outcome']}")
-                lines.append(f"- **When**: {t['timestamp']}")
+            def header(shown: int) -> str:
+                position = "after cursor" if cursor else f"offset {offset}"
+                lines = [
+                    f"# Decision Traces",
+                    "",
+                    f"**Total**: {total} | **Showing**: {shown} ({position})",
+                    ""
+                ]
+                if category:
+                    lines.append(f"**Filter**: category='{category}'")
+                if outcome:
+                    lines.append(f"**Filter**: outcome='{outcome}'")
                 lines.append("")
-
-            if offset + len(paginated) < total:
-                lines.append(f"*More traces available (use offset={offset + len(paginated)})*")
+                return "\n".join(lines)
+
+            def render(t: Dict[str, Any]) -> str:
+                title = t['decision'][:80] + "..." if len(t['decision']) > 80 else t['decision']
+                block = [f"## {title}" if "decision" in selected else f"## `{t['id']}`"]
+                if "decision" in selected:
+                    block.append(f"- **ID**: `{t['id']}`")
+                tags = [f"**{label}**: {t[name]}" for name, label in (("category", "Category"), ("outcome", "Outcome"))
+                        if name in selected]
+                if tags:
+                    block.append("- " + " | ".join(tags))
+                if "timestamp" in selected:
+                    block.append(f"- **When**: {t['timestamp']}")
+                block.append("")
+                return "\n".join(block)
+
+            blocks = pack_entries(entries, render, budget - len(header(len(entries))) - CURSOR_RESERVE)
+            end = page_end(len(blocks))
+            lines = [header(len(blocks))] + blocks
+            if end["has_more"]:
+                lines.append(f"*More traces available (use cursor=\"{end['next_cursor']}\")*")
 
             return "\n".join(lines)
 
+    except ValueError as e:
+        return f"Error: {str(e)}"
     except Exception as e:
         return f"Error: Failed to list traces - {type(e).__name__}: {str(e)}"
 
 
 @mcp.tool(name="context_list_categories")
+@timed_tool
 async def context_list_categories(project_dir: Optional[str] = None) -> str:
     """List all categories and their trace counts.
 
+    Counts come from a materialized aggregate maintained alongside every
+    store, outcome update and delete, so this answers in constant time
+    regardless of store size.
+
     Args:
         project_dir: Project directory (defaults to current working directory)
 
@@ -756,27 +3645,12 @@ async def context_list_categories(project_dir: Optional[str] = None) -> str:
         - List all categories: context_list_categories()
     """
     try:
-        collection = get_chroma_client(project_dir)
-
-        # Get all traces
-        results = collection.get(
-            include=["metadatas"]
-        )
-
-        if not results or not results['ids']:
-            return "# No categories found\n\nStore traces to populate categories."
+        collection = await get_collection(project_dir)
+        await settle_write_behind(project_dir)
+        index = await get_synced_trace_index(collection, project_dir)
 
         # Count by category and outcome
-        categories = {}
-        for metadata in results['metadatas']:
-            cat = metadata.get('category', 'general')
-            outcome = metadata.get('outcome', 'pending')
-
-            if cat not in categories:
-                categories[cat] = {}
-            if outcome not in categories[cat]:
-                categories[cat][outcome] = 0
-            categories[cat][outcome] += 1
+        categories = await run_chroma(index.category_counts)
 
         if not categories:
             return "# No categories found\n\nStore traces to populate categories."
@@ -799,9 +3673,550 @@ async def context_list_categories(project_dir: Optional[str] = None) -> str:
         return f"Error: Failed to list categories - {type(e).__name__}: {str(e)}"
 
 
+@mcp.tool(name="context_verify_index")
+@timed_tool
+async def context_verify_index(
+    repair: bool = False,
+    project_dir: Optional[str] = None
+) -> str:
+    """Check the listing index and category counts against ChromaDB.
+
+    Compares the trace count, the materialized category/outcome aggregate
+    and a full recount of ChromaDB metadata. With repair=True, rebuilds the
+    sidecar index (and its aggregate) from ChromaDB when drift is found.
+
+    Args:
+        repair: Rebuild the index if any drift is detected (default False)
+        project_dir: Project directory (defaults to current working directory)
+
+    Returns:
+        str: JSON report with ok, counts, drift entries and whether it was repaired
+
+    Examples:
+        - Check for drift: context_verify_index()
+        - Fix drift: context_verify_index(repair=True)
+    """
+    try:
+        collection = await get_collection(project_dir)
+        index = await get_trace_index(project_dir)
+
+        async with get_write_lock(project_dir):
+            report = await run_chroma(verify_trace_index, collection, index)
+            if repair and not report["ok"]:
+                await run_chroma(rebuild_trace_index, collection, index)
+                # Lexical and hybrid results cached against the drifted index are stale
+                bump_collection_version(project_dir)
+                report["repaired"] = True
+
+        return json.dumps(report, indent=2)
+
+    except Exception as e:
+        return f"Error: Failed to verify index - {type(e).__name__}: {str(e)}"
+
+
+@mcp.tool(name="context_export_traces")
+@timed_tool
+async def context_export_traces(
+    path: str,
+    include_embeddings: bool = True,
+    category: Optional[str] = None,
+    project_dir: Optional[str] = None
+) -> str:
+    """Export a project's traces to an NDJSON file for backup or moving.
+
+    Streams the store page by page, so memory stays bounded whatever its
+    size. With include_embeddings, vectors are written as base64 float16 and
+    an import into a store using the same embedding model skips re-embedding.
+
+    Args:
+        path: Output file (relative paths resolve against the project directory)
+        include_embeddings: Write embeddings alongside the traces (default True)
+        category: Export only this category
+        project_dir: Project directory (defaults to current working directory)
+
+    Returns:
+        str: JSON with the file path, exported count and embedding provider
+
+    Examples:
+        - Back up a store: context_export_traces(path=".claude/traces.ndjson")
+        - Text only: context_export_traces(path="traces.ndjson", include_embeddings=False)
+    """
+    try:
+        target = resolve_project_path(path, project_dir)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, "w", encoding="utf-8") as out:
+            result = await export_traces(out, project_dir, include_embeddings, category)
+        return json.dumps({"path": str(target), **result}, indent=2)
+
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    except Exception as e:
+        return f"Error: Failed to export traces - {type(e).__name__}: {str(e)}"
+
+
+@mcp.tool(name="context_import_traces")
+@timed_tool
+async def context_import_traces(
+    path: str,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    project_dir: Optional[str] = None
+) -> str:
+    """Import traces from an NDJSON export made by context_export_traces.
+
+    Reads and writes in batches. Embeddings in the file are reused when they
+    come from the project's embedding model; other traces are re-embedded.
+    Trace IDs already in the store are skipped, so an interrupted import
+    can simply be run again.
+
+    Args:
+        path: Export file (relative paths resolve against the project directory)
+        batch_size: Traces per write (default 1000)
+        project_dir: Project directory (defaults to current working directory)
+
+    Returns:
+        str: JSON with imported, skipped_existing, reused_embeddings and embedded counts
+
+    Examples:
+        - Seed a store: context_import_traces(path="/backups/traces.ndjson")
+
+    Error Handling:
+        - Returns "Error: Line N: ..." for a malformed line; earlier batches stay imported
+        - Returns "Error: VOYAGE_API_KEY not found" if re-embedding is needed and no key is set
+    """
+    try:
+        if batch_size < 1:
+            return "Error: batch_size must be at least 1"
+        source = resolve_project_path(path, project_dir)
+        if not source.is_file():
+            return f"Error: File not found: {source}"
+        with open(source, encoding="utf-8") as lines:
+            result = await import_traces(lines, project_dir, batch_size)
+        return json.dumps({"path": str(source), **result}, indent=2)
+
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    except Exception as e:
+        return f"Error: Failed to import traces - {type(e).__name__}: {str(e)}"
+
+
+@mcp.tool(name="context_compact_traces")
+@timed_tool
+async def context_compact_traces(
+    max_age_days: Optional[int] = None,
+    outcomes: Optional[List[str]] = None,
+    dry_run: bool = False,
+    project_dir: Optional[str] = None
+) -> str:
+    """Move old traces out of the vector index into the compressed archive.
+
+    Applies the retention policy in context_graph.retention (or the ages
+    given here): matching traces are written to .claude/archive/ with their
+    document, metadata and a quantized embedding, then removed from ChromaDB.
+    They stay reachable via context_get_trace and
+    context_query_traces(include_archive=True).
+
+    Args:
+        max_age_days: Archive traces older than this (overrides the configured policy)
+        outcomes: Only archive traces with these outcomes (with max_age_days)
+        dry_run: Report how many traces would be archived without moving any
+        project_dir: Project directory (defaults to current working directory)
+
+    Returns:
+        str: JSON with the policy, per-outcome counts, segments written and traces remaining
+
+    Examples:
+        - Preview: context_compact_traces(dry_run=True)
+        - Archive finished work older than 30 days: context_compact_traces(max_age_days=30, outcomes=["success", "failure"])
+
+    Error Handling:
+        - Returns "Error: No retention policy" if none is configured or given
+    """
+    try:
+        return json.dumps(await compact_store(project_dir, max_age_days, outcomes, dry_run), indent=2)
+
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    except Exception as e:
+        return f"Error: Compaction failed - {type(e).__name__}: {str(e)}"
+
+
+@mcp.tool(name="context_dedupe_traces")
+@timed_tool
+async def context_dedupe_traces(
+    threshold: Optional[float] = None,
+    dry_run: bool = False,
+    project_dir: Optional[str] = None
+) -> str:
+    """Merge near-duplicate traces already in the store.
+
+    Finds traces in the same category whose embeddings are at least
+    threshold similar, using batched nearest-neighbour queries. Each group
+    keeps its oldest trace, which gains the group's occurrence count and
+    latest sighting; the other traces are deleted.
+
+    Args:
+        threshold: Minimum cosine similarity to merge (default: context_graph.dedupe.threshold, 0.95)
+        dry_run: Report the groups without changing anything
+        project_dir: Project directory (defaults to current working directory)
+
+    Returns:
+        str: JSON with group and duplicate counts and example groups
+
+    Examples:
+        - Preview: context_dedupe_traces(dry_run=True)
+        - Merge close rewordings: context_dedupe_traces(threshold=0.92)
+    """
+    try:
+        return json.dumps(await dedupe_store(project_dir, threshold, dry_run), indent=2)
+
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    except Exception as e:
+        return f"Error: Dedupe failed - {type(e).__name__}: {str(e)}"
+
+
+@mcp.tool(name="context_stats")
+@timed_tool
+async def context_stats(reset: bool = False) -> str:
+    """Report server resource usage, latency percentiles and counters.
+
+    Lists the ChromaDB stores currently open (with an estimate of the vector
+    memory each holds and its size on disk), store evictions, and hit rates
+    of the per-project embedding and query caches. The "metrics" section
+    has p50/p95/p99 latency per tool and per internal stage (embed,
+    embed_request, chroma_add, sidecar_add, chroma_query, flat_search,
+    rerank, lexical_search, archive_search, format, wal_append,
+    write_behind_commit) plus embedding request, text and byte counters,
+    since the server started or the last reset. "write_behind" shows each
+    project's queued traces and its log.
+
+    Args:
+        reset: Clear latency histograms and request counters after reporting them
+            (store sizes and cache hit counts are read live and are not reset)
+
+    Returns:
+        str: JSON with "stores", "embedding_caches", "query_caches", "flat_indexes", "write_behind" and "metrics" sections
+
+    Examples:
+        - Check memory held by open stores: context_stats()
+        - Where does query time go: context_stats() -> metrics.stage_duration_seconds
+        - Measure one workload: context_stats(reset=True), run it, then context_stats()
+    """
+    try:
+        report = json.dumps({
+            "stores": await collect_metrics(),
+            "embedding_caches": {key: cache.stats() for key, cache in _embedding_caches.items()},
+            "query_caches": {key: cache.stats() for key, cache in _query_caches.items()},
+            "flat_indexes": {key: index.stats() for key, index in _flat_indexes.items()},
+            "write_behind": {key: queue.stats() for key, queue in _write_behind_queues.items()},
+            "metrics": metrics.snapshot()
+        }, indent=2)
+        if reset:
+            metrics.reset()
+        return report
+
+    except Exception as e:
+        return f"Error: Failed to collect stats - {type(e).__name__}: {str(e)}"
+
+
+# ─────────────────────────────────────────────────────────────────
+# Shared Server
+# ─────────────────────────────────────────────────────────────────
+
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+def bind_unix_socket(path: str) -> "socket.socket":
+    """A Unix socket bound at path, accessible to the owner only.
+
+    A socket file left by a server that did not exit cleanly is replaced;
+    one with a server still listening behind it is an error.
+    """
+    import socket
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+        else:
+            raise RuntimeError(f"A server is already listening on {path}")
+        finally:
+            probe.close()
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(old_umask)
+    return sock
+
+def serve(
+    host: str = SERVE_HOST,
+    port: int = SERVE_PORT,
+    socket_path: Optional[str] = SERVE_SOCKET,
+    max_sessions: int = SERVE_MAX_SESSIONS,
+    idle_timeout: float = SERVE_SESSION_IDLE_TIMEOUT,
+    shutdown_grace: int = SERVE_SHUTDOWN_GRACE
+) -> None:
+    """Serve many MCP clients from one process over streamable HTTP.
+
+    Listens on host:port, or on a Unix socket when socket_path is given.
+    Every session shares the open stores, caches, embedding batcher and
+    HTTP pool, which stay open from startup to shutdown rather than per
+    session. Sessions idle for idle_timeout seconds are closed; past
+    max_sessions, new clients get a 503. On SIGINT/SIGTERM the server
+    stops accepting connections, lets tool calls under way finish (up to
+    shutdown_grace seconds), then closes sessions and stores.
+    """
+    import uvicorn
+    from mcp.server.transport_security import TransportSecuritySettings
+    from sse_starlette.sse import AppStatus
+
+    # Keep DNS rebinding protection; clients on the socket send a bare "localhost" Host
+    allowed_hosts = [f"{h}:*" for h in ("127.0.0.1", "localhost", "[::1]")]
+    if socket_path:
+        allowed_hosts.append("localhost")
+    elif host not in LOOPBACK_HOSTS:
+        allowed_hosts.append(f"{host}:*")
+    mcp.settings.transport_security = TransportSecuritySettings(
+        enable_dns_rebinding_protection=True,
+        allowed_hosts=allowed_hosts,
+        allowed_origins=[f"http://{h}" for h in allowed_hosts]
+    )
+    mcp.settings.max_sessions = max_sessions
+    mcp.settings.session_idle_timeout = idle_timeout
+
+    app = mcp.streamable_http_app()
+    sessions_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Resources outlive the session manager, so each session's own
+        # server_lifespan only nests inside them
+        async with server_resources():
+            async with sessions_lifespan(app):
+                yield
+
+    app.router.lifespan_context = lifespan
+
+    # sse-starlette ends every event stream as soon as the signal arrives,
+    # which would drop the results of calls under way; streams are ended
+    # below once those calls have answered
+    AppStatus.disable_automatic_graceful_drain()
+    requests_in_flight = 0
+
+    async def counted(scope, receive, send):
+        # POSTs carry the calls; GETs are the idle event streams
+        nonlocal requests_in_flight
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await app(scope, receive, send)
+        requests_in_flight += 1
+        try:
+            await app(scope, receive, send)
+        finally:
+            requests_in_flight -= 1
+
+    class SharedServer(uvicorn.Server):
+        async def shutdown(self, sockets=None) -> None:
+            for server in self.servers:
+                server.close()
+            if socket_path:
+                # Here rather than after run(): uvicorn re-raises the signal once it stops
+                Path(socket_path).unlink(missing_ok=True)
+            deadline = time.monotonic() + shutdown_grace
+            while requests_in_flight and time.monotonic() < deadline and not self.force_exit:
+                await asyncio.sleep(0.1)
+            AppStatus.should_exit = True
+            await super().shutdown(sockets)
+
+    sockets = [bind_unix_socket(socket_path)] if socket_path else None
+    config = uvicorn.Config(
+        counted, host=host, port=port, log_level="info", access_log=False,
+        lifespan="on", timeout_graceful_shutdown=shutdown_grace
+    )
+    endpoint = f"unix:{socket_path}" if socket_path else f"http://{host}:{port}"
+    print(f"Context graph server at {endpoint}{mcp.settings.streamable_http_path}", file=sys.stderr)
+    try:
+        SharedServer(config).run(sockets=sockets)
+    finally:
+        if socket_path:
+            Path(socket_path).unlink(missing_ok=True)
+
+async def connect(url: str, socket_path: Optional[str] = None, project_dir: Optional[str] = None) -> None:
+    """Relay MCP over stdio to a shared server, for clients that only launch stdio servers.
+
+    Tool calls without a project_dir get this process's project, so an
+    agent keeps its own store when the server was started elsewhere.
+    """
+    import logging
+    import anyio
+    from mcp.client.streamable_http import streamable_http_client
+    from mcp.server.stdio import stdio_server
+
+    project_dir = project_dir or os.getcwd()
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one INFO line per relayed message
+
+    def with_project(message):
+        request = message.message.root
+        if isinstance(request, mcp_types.JSONRPCRequest) and request.method == "tools/call":
+            arguments = (request.params or {}).setdefault("arguments", {})
+            if arguments.get("project_dir") is None:
+                arguments["project_dir"] = project_dir
+        return message
+
+    transport = httpx.AsyncHTTPTransport(uds=socket_path) if socket_path else None
+    timeout = httpx.Timeout(HTTP_TIMEOUT, read=300.0)  # event streams stay open between messages
+    async with httpx.AsyncClient(transport=transport, timeout=timeout) as http_client:
+        async with streamable_http_client(url, http_client=http_client) as (remote_read, remote_write, _):
+            async with stdio_server() as (local_read, local_write):
+                async with anyio.create_task_group() as relay:
+                    async def pump(source, sink, rewrite=None):
+                        async for message in source:
+                            if isinstance(message, Exception):
+                                print(f"Error: Relay - {type(message).__name__}: {message}", file=sys.stderr)
+                                continue
+                            await sink.send(rewrite(message) if rewrite else message)
+                        relay.cancel_scope.cancel()
+
+                    relay.start_soon(pump, local_read, remote_write, with_project)
+                    relay.start_soon(pump, remote_read, local_write)
+
+
 # ─────────────────────────────────────────────────────────────────
 # Main Entry Point
 # ─────────────────────────────────────────────────────────────────
 
-if __name__ == "__main__":
+def run_command(coro: Awaitable[Any]) -> Any:
+    """Run a CLI command's coroutine with the server resources held.
+
+    The HTTP client, caches, indexes and stores it opens are flushed and
+    closed before the event loop goes away.
+    """
+    async def held() -> Any:
+        async with server_resources():
+            return await coro
+    return asyncio.run(held())
+
+def main() -> None:
+    """Run the MCP server (default), the shared server, or a maintenance command."""
+    global SESSION_MAX_CONCURRENCY
+
+    parser = argparse.ArgumentParser(description="Context Graph MCP server")
+    commands = parser.add_subparsers(dest="command")
+
+    verify = commands.add_parser("verify-index", help="Check the listing index and category counts against ChromaDB")
+    verify.add_argument("--project-dir", "-p", default=None, help="Project directory")
+    verify.add_argument("--repair", action="store_true", help="Rebuild the index if drift is found")
+
+    migrate = commands.add_parser(
+        "migrate-index",
+        help="Rebuild the vector index with the metric/HNSW settings in project config (server must be stopped)"
+    )
+    migrate.add_argument("--project-dir", "-p", default=None, help="Project directory")
+
+    export = commands.add_parser("export", help="Write the trace store as NDJSON")
+    export.add_argument("--project-dir", "-p", default=None, help="Project directory")
+    export.add_argument("--output", "-o", default="-", help="Output file (default: stdout)")
+    export.add_argument("--no-embeddings", action="store_true", help="Omit embeddings (import will re-embed)")
+    export.add_argument("--category", default=None, help="Export only this category")
+
+    load = commands.add_parser("import", help="Load traces from an NDJSON export")
+    load.add_argument("input", help="Export file ('-' for stdin)")
+    load.add_argument("--project-dir", "-p", default=None, help="Project directory")
+    load.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="Traces per write")
+
+    compact = commands.add_parser("compact", help="Archive traces past the retention policy")
+    compact.add_argument("--project-dir", "-p", default=None, help="Project directory")
+    compact.add_argument("--max-age-days", type=int, default=None, help="Override the configured age")
+    compact.add_argument("--outcome", action="append", dest="outcomes", help="Only this outcome (repeatable)")
+    compact.add_argument("--dry-run", action="store_true", help="Count without archiving")
+
+    dedupe = commands.add_parser("dedupe", help="Merge near-duplicate traces")
+    dedupe.add_argument("--project-dir", "-p", default=None, help="Project directory")
+    dedupe.add_argument("--threshold", type=float, default=None, help="Minimum cosine similarity to merge")
+    dedupe.add_argument("--dry-run", action="store_true", help="Report groups without merging")
+
+    shared = commands.add_parser("serve", help="Serve many MCP clients over streamable HTTP or a Unix socket")
+    shared.add_argument("--host", default=SERVE_HOST, help="Interface to listen on")
+    shared.add_argument("--port", type=int, default=SERVE_PORT, help="TCP port")
+    shared.add_argument("--socket", default=SERVE_SOCKET, help="Listen on this Unix socket instead of TCP")
+    shared.add_argument("--max-sessions", type=int, default=SERVE_MAX_SESSIONS, help="Open MCP sessions at most")
+    shared.add_argument("--session-concurrency", type=int, default=SESSION_MAX_CONCURRENCY,
+                        help="Tool calls one session may run at once (0 = unlimited)")
+    shared.add_argument("--idle-timeout", type=float, default=SERVE_SESSION_IDLE_TIMEOUT,
+                        help="Close sessions idle this many seconds")
+    shared.add_argument("--shutdown-grace", type=int, default=SERVE_SHUTDOWN_GRACE,
+                        help="Seconds to let calls under way finish on shutdown")
+
+    relay = commands.add_parser("connect", help="Relay stdio to a running shared server")
+    relay.add_argument("--url", default=None, help="Server URL (default: the serve defaults)")
+    relay.add_argument("--socket", default=SERVE_SOCKET, help="Connect through this Unix socket")
+    relay.add_argument("--project-dir", "-p", default=None, help="Project for calls that name none (default: cwd)")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        SESSION_MAX_CONCURRENCY = args.session_concurrency
+        try:
+            serve(args.host, args.port, args.socket, args.max_sessions, args.idle_timeout, args.shutdown_grace)
+        except Exception as e:
+            print(f"Error: Server failed - {type(e).__name__}: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.command == "connect":
+        host = "localhost" if args.socket else f"{SERVE_HOST}:{SERVE_PORT}"
+        url = args.url or f"http://{host}{mcp.settings.streamable_http_path}"
+        asyncio.run(connect(url, args.socket, args.project_dir))
+        sys.exit(0)
+
+    if args.command == "dedupe":
+        result = run_command(context_dedupe_traces(args.threshold, args.dry_run, args.project_dir))
+        print(result)
+        sys.exit(1 if result.startswith("Error") else 0)
+
+    if args.command == "compact":
+        result = run_command(context_compact_traces(args.max_age_days, args.outcomes, args.dry_run, args.project_dir))
+        print(result)
+        sys.exit(1 if result.startswith("Error") else 0)
+
+    if args.command in ("export", "import"):
+        try:
+            if args.command == "export":
+                out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+                with out:
+                    result = run_command(export_traces(out, args.project_dir, not args.no_embeddings, args.category))
+            else:
+                source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+                with source:
+                    result = run_command(import_traces(source, args.project_dir, args.batch_size))
+        except Exception as e:
+            print(f"Error: {args.command.capitalize()} failed - {type(e).__name__}: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(result, indent=2), file=sys.stderr)
+        sys.exit(0)
+
+    if args.command == "migrate-index":
+        try:
+            print(json.dumps(migrate_collection(args.project_dir), indent=2))
+        except Exception as e:
+            print(f"Error: Migration failed - {type(e).__name__}: {str(e)}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.command == "verify-index":
+        result = run_command(context_verify_index(repair=args.repair, project_dir=args.project_dir))
+        print(result)
+        if result.startswith("Error"):
+            sys.exit(1)
+        report = json.loads(result)
+        sys.exit(0 if report["ok"] or report["repaired"] else 1)
+
     mcp.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Concurrency test for context-graph MCP server.
+Checks that semantic queries are not blocked behind a large list
+operation now that ChromaDB calls run off the event loop, and that
+processes sharing a flat index see each other's writes.
+Uses the local embedding provider; no API key or network required.
+"""
+
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+TRACE_COUNT = 30000
+DIM = 16
+
+os.environ["CONTEXT_GRAPH_EMBEDDING_PROVIDER"] = "local"
+os.environ["CONTEXT_GRAPH_LOCAL_EMBEDDING_DIM"] = str(DIM)
+
+import server
+from flat_index import FlatIndex
+
+# Writes to a flat index from another process: grows it past its first
+# allocation, deletes and relabels rows the parent wrote
+FLAT_WRITER = r"""
+import sys
+import numpy as np
+sys.path.insert(0, sys.argv[1])
+from flat_index import FlatIndex
+
+index = FlatIndex(sys.argv[2], int(sys.argv[3]))
+rng = np.random.default_rng(1)
+ids = [f"peer_{i}" for i in range(3000)]
+index.add(ids, rng.normal(size=(len(ids), index.dim)).tolist(), ["peer"] * len(ids), ["pending"] * len(ids))
+index.delete([f"own_{i}" for i in range(5)])
+index.update_outcomes({"own_9": "failure"})
+index.close()
+"""
+
+
+def populate(project_dir: str, count: int) -> None:
+    """Fill a store directly with synthetic traces."""
+    collection = server.get_chroma_client(project_dir)
+    rng = random.Random(7)
+    batch = 5000
+    for start in range(0, count, batch):
+        ids = [f"trace_{i:012d}" for i in range(start, min(start + batch, count))]
+        collection.add(
+            ids=ids,
+            embeddings=[[rng.uniform(-1, 1) for _ in range(DIM)] for _ in ids],
+            documents=[f"Synthetic decision {i} about caching and retries " * 4 for i in range(len(ids))],
+            metadatas=[{
+                "trace_id": trace_id,
+                "timestamp": f"2025-01-01T00:00:{i % 60:02d}",
+                "category": rng.choice(["framework", "architecture", "api", "error"]),
+                "outcome": rng.choice(["pending", "success", "failure"]),
+                "feature_id": "",
+                "state": "",
+                "project_dir": project_dir,
+                "session_id": ""
+            } for i, trace_id in enumerate(ids)]
+        )
+
+
+async def heartbeat(stop: asyncio.Event, gaps: list) -> None:
+    """Record the longest event-loop stall while work is in flight."""
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.005)
+        now = time.perf_counter()
+        gaps.append(now - last - 0.005)
+        last = now
+
+
+async def timed(coro) -> float:
+    await coro
+    return time.perf_counter()
+
+
+async def test_queries_not_blocked_by_list(project_dir: str) -> bool:
+    """Queries issued after a full list start should finish before it."""
+    print("\nTesting queries alongside a large list operation...")
+
+    stop = asyncio.Event()
+    gaps: list = []
+    ticker = asyncio.create_task(heartbeat(stop, gaps))
+
+    start = time.perf_counter()
+    list_task = asyncio.create_task(timed(server.context_list_traces(limit=100, project_dir=project_dir)))
+    await asyncio.sleep(0.01)
+
+    query_done = await asyncio.gather(*(
+        timed(server.context_query_traces(query=f"caching strategy {i}", project_dir=project_dir))
+        for i in range(5)
+    ))
+    list_done = await list_task
+
+    stop.set()
+    await ticker
+
+    list_ms = (list_done - start) * 1000
+    query_ms = (max(query_done) - start) * 1000
+    max_gap_ms = max(gaps) * 1000 if gaps else 0.0
+
+    print(f"  list finished after   {list_ms:8.1f}ms")
+    print(f"  queries finished after {query_ms:8.1f}ms")
+    print(f"  longest loop stall    {max_gap_ms:8.1f}ms")
+
+    if query_ms >= list_ms:
+        print("✗ Queries waited for the list operation")
+        return False
+    print("✓ Queries completed while the list operation was still running")
+    return True
+
+
+async def test_writes_serialized(project_dir: str) -> bool:
+    """Concurrent outcome updates on one store must all apply."""
+    print("\nTesting serialized writes...")
+    ids = [f"trace_{i:012d}" for i in range(20)]
+    await asyncio.gather(*(
+        server.context_update_outcome(trace_id=trace_id, outcome="success", project_dir=project_dir)
+        for trace_id in ids
+    ))
+    collection = server.get_chroma_client(project_dir)
+    results = collection.get(ids=ids, include=["metadatas"])
+    outcomes = {m["outcome"] for m in results["metadatas"]}
+    if len(results["ids"]) != len(ids) or outcomes != {"success"}:
+        print(f"✗ Lost updates: {len(results['ids'])} traces, outcomes {outcomes}")
+        return False
+    print(f"✓ {len(ids)} concurrent updates applied")
+    return True
+
+
+async def test_flat_index_shared_between_processes() -> bool:
+    """A peer's writes to the flat index are picked up by reloading, and later writes land in its files."""
+    print("\nTesting a flat index shared by two processes...")
+    rng = random.Random(3)
+    with tempfile.TemporaryDirectory() as directory:
+        index = FlatIndex(Path(directory), DIM)
+        try:
+            own = [f"own_{i}" for i in range(10)]
+            index.add(own, [[rng.uniform(-1, 1) for _ in range(DIM)] for _ in own], ["own"] * 10, ["pending"] * 10)
+            subprocess.run(
+                [sys.executable, "-c", FLAT_WRITER, str(Path(__file__).parent), directory, str(DIM)],
+                check=True, timeout=60
+            )
+
+            if index.count() != 3005 or index.reloads != 1:
+                print(f"✗ Expected the peer's rows after one reload: {index.stats()}")
+                return False
+            if [trace_id for trace_id, _ in index.search([1.0] * DIM, 10, outcome="failure")] != ["own_9"]:
+                print("✗ The peer's outcome change is not visible")
+                return False
+
+            index.add(["own_late"], [[1.0] * DIM], ["own"], ["success"])
+            reopened = FlatIndex(Path(directory), DIM)
+            found = reopened.search([1.0] * DIM, 1, outcome="success")
+            count = reopened.count()
+            reopened.close()
+            if count != 3006 or [trace_id for trace_id, _ in found] != ["own_late"]:
+                print(f"✗ A write after the peer grew the files was lost: {count} rows, found {found}")
+                return False
+            print("✓ Peer's 3000 adds, deletes and outcome change seen without a rebuild; later writes kept")
+            return True
+        finally:
+            index.close()
+
+
+async def main():
+    """Run all tests."""
+    print("=" * 50)
+    print("Context Graph MCP Server - Concurrency Tests")
+    print("=" * 50)
+
+    results = []
+    with tempfile.TemporaryDirectory() as project_dir:
+        print(f"\nPopulating {TRACE_COUNT} synthetic traces...")
+        populate(project_dir, TRACE_COUNT)
+
+        results.append(await test_queries_not_blocked_by_list(project_dir))
+        results.append(await test_writes_serialized(project_dir))
+        results.append(await test_flat_index_shared_between_processes())
+
+        server.close_embedding_caches()
+
+    print("\n" + "=" * 50)
+    passed = sum(results)
+    total = len(results)
+    print(f"Results: {passed}/{total} tests passed")
+    print("=" * 50)
+    return passed == total
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    sys.exit(0 if success else 1)
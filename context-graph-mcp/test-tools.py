@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Tool behaviour tests for context-graph MCP server.
+Calls the tool functions directly against throwaway project directories.
+Uses the local embedding provider; no API key or network required.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+os.environ["CONTEXT_GRAPH_EMBEDDING_PROVIDER"] = "local"
+
+import server
+from response_budget import ELLIPSIS, decode_continuation, fit_text, pack, request_fingerprint
+from trace_index import TraceIndex, index_path
+
+TOPICS = ["caching", "retries", "auth", "logging", "schema", "deploys"]
+
+
+async def populate(project_dir: str, count: int = 24) -> None:
+    """Store synthetic traces through the batch tool."""
+    traces = [
+        {
+            "decision": f"Decision {i}: chose a {TOPICS[i % len(TOPICS)]} approach for service {i} after comparing options",
+            "category": ["framework", "architecture", "api"][i % 3],
+            "outcome": ["pending", "success", "failure"][i % 3]
+        }
+        for i in range(count)
+    ]
+    result = json.loads(await server.context_store_traces_batch(traces=traces, project_dir=project_dir))
+    assert result["stored"] == count, result
+
+
+async def teardown() -> None:
+    """Close everything the tools opened so the temporary directory can go."""
+    await server.close_write_behind_queues()
+    server.close_chroma_stores()
+    server.close_trace_indexes()
+    server.close_rerank_stores()
+    server.close_flat_indexes()
+    server.close_trace_archives()
+    server.close_embedding_caches()
+
+
+async def test_budget_helpers() -> bool:
+    """Greedy packing, fit_text truncation and cursor fingerprints."""
+    print("\nTesting response budget helpers...")
+    if pack(["aaaa", "bbbb", "cccc"], 9) != 2 or pack(["aaaa", "bbbb"], 3) != 0:
+        print("✗ pack did not stop at the first block over the budget")
+        return False
+
+    render = lambda text: json.dumps({"decision": text + ELLIPSIS})
+    text = "x" * 500
+    keep = fit_text(render, text, 120)
+    if len(render(text[:keep])) > 120 or len(render(text[:keep + 1])) <= 120:
+        print(f"✗ fit_text kept {keep} characters, not the longest prefix that fits")
+        return False
+
+    fingerprint = request_fingerprint("caching", "vector", None, None, 10, False)
+    changed = request_fingerprint("caching", "vector", "api", None, 10, False)
+    if fingerprint == changed:
+        print("✗ Fingerprint ignores a changed filter")
+        return False
+    try:
+        decode_continuation("not a cursor", "query", fingerprint)
+        print("✗ Malformed cursor accepted")
+        return False
+    except ValueError:
+        pass
+
+    print(f"✓ Packing, truncation to {keep} characters and fingerprints behave")
+    return True
+
+
+async def test_query_pages(project_dir: str) -> bool:
+    """Pages under a small budget concatenate to the unbudgeted results."""
+    print("\nTesting budgeted query pages...")
+    args = {"query": "caching approach for service", "limit": 20, "response_format": "json", "project_dir": project_dir}
+    full = json.loads(await server.context_query_traces(**args))
+    expected = [result["id"] for result in full["results"]]
+
+    paged, pages, cursor = [], 0, None
+    while True:
+        response = await server.context_query_traces(**args, max_chars=1500, cursor=cursor)
+        if len(response) > 1500:
+            print(f"✗ Page of {len(response)} characters exceeds the 1500 character budget")
+            return False
+        page = json.loads(response)
+        paged += [result["id"] for result in page["results"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if not cursor or pages > len(expected):
+            break
+
+    if pages < 2 or paged != expected:
+        print(f"✗ {pages} page(s) gave {len(paged)} results; expected {len(expected)} in the same order")
+        return False
+    print(f"✓ {pages} pages under 1500 characters concatenate to all {len(expected)} results")
+    return True
+
+
+async def test_cursor_rejected_for_other_args(project_dir: str) -> bool:
+    """A continuation cursor only resumes the request it came from."""
+    print("\nTesting cursor rejection on changed arguments...")
+    first = json.loads(await server.context_query_traces(
+        query="retries approach", limit=20, response_format="json", max_chars=500, project_dir=project_dir
+    ))
+    cursor = first["next_cursor"]
+    if not cursor:
+        print("✗ Expected a cursor under a 500 character budget")
+        return False
+    response = await server.context_query_traces(
+        query="retries approach", limit=20, category="api", response_format="json",
+        max_chars=500, cursor=cursor, project_dir=project_dir
+    )
+    if not response.startswith("Error: Invalid cursor"):
+        print(f"✗ Cursor applied to a different request: {response[:120]}")
+        return False
+    print("✓ Cursor rejected when the category filter changes")
+    return True
+
+
+async def test_oversized_result_truncated(project_dir: str) -> bool:
+    """A single result larger than the budget is cut to fit, not dropped."""
+    print("\nTesting truncation of an oversized result...")
+    decision = "Oversized decision about sharding " + "with a very long rationale " * 200
+    await server.context_store_trace(decision=decision, category="architecture", project_dir=project_dir)
+    response = await server.context_query_traces(
+        query="oversized sharding rationale", limit=1, response_format="json", max_chars=1000, project_dir=project_dir
+    )
+    result = json.loads(response)["results"][0]
+    shown = result["decision"]
+    if len(response) > 1000 or len(shown) < 200 or not shown.endswith(ELLIPSIS) or not decision.startswith(shown[:-1]):
+        print(f"✗ Expected a truncated prefix within 1000 characters, got {len(response)} with {len(shown)}")
+        return False
+    print(f"✓ Decision cut to {len(shown)} characters to fit the budget")
+    return True
+
+
+async def test_lexical_ranking(project_dir: str) -> bool:
+    """BM25 ranks rarer and repeated terms higher; hybrid fuses both rankings."""
+    print("\nTesting lexical and hybrid ranking...")
+    once = json.loads(await server.context_store_trace(
+        decision="Put the zookeeper ensemble behind the config service", category="architecture", project_dir=project_dir
+    ))["trace_id"]
+    twice = json.loads(await server.context_store_trace(
+        decision="Replaced zookeeper leader election with zookeeper sessions", category="architecture",
+        project_dir=project_dir
+    ))["trace_id"]
+
+    lexical = json.loads(await server.context_query_traces(
+        query="zookeeper", mode="lexical", limit=5, response_format="json", project_dir=project_dir
+    ))["results"]
+    ranked = [result["id"] for result in lexical]
+    if ranked != [twice, once] or not lexical[0]["bm25"] > lexical[1]["bm25"] > 0:
+        print(f"✗ Expected the repeated term first and only the two matches, got {[r.get('bm25') for r in lexical]}")
+        return False
+
+    hybrid = json.loads(await server.context_query_traces(
+        query="zookeeper", mode="hybrid", limit=5, response_format="json", project_dir=project_dir
+    ))["results"]
+    if [result["id"] for result in hybrid[:2]] != [twice, once] or any("rrf" not in result for result in hybrid):
+        print(f"✗ Hybrid results lost the lexical ranking: {[r['id'] for r in hybrid]}")
+        return False
+    scores = [result["rrf"] for result in hybrid]
+    if scores != sorted(scores, reverse=True):
+        print(f"✗ Hybrid results are not in fused score order: {scores}")
+        return False
+    print(f"✓ BM25 {lexical[0]['bm25']} > {lexical[1]['bm25']}; hybrid keeps the order with fused scores")
+    return True
+
+
+async def test_list_keyset_pages(project_dir: str) -> bool:
+    """Keyset cursors page through every trace once, even with writes in between."""
+    print("\nTesting list cursor pages...")
+    full = json.loads(await server.context_list_traces(limit=100, response_format="json", project_dir=project_dir))
+    expected = [trace["id"] for trace in full["traces"]]
+
+    first = json.loads(await server.context_list_traces(limit=5, response_format="json", project_dir=project_dir))
+    paged = [trace["id"] for trace in first["traces"]]
+    # Newer traces sort first; offset paging would now repeat a row
+    await server.context_store_trace(decision="Stored while paging", category="api", project_dir=project_dir)
+    cursor = first["next_cursor"]
+    while cursor:
+        page = json.loads(await server.context_list_traces(
+            limit=5, cursor=cursor, response_format="json", project_dir=project_dir
+        ))
+        paged += [trace["id"] for trace in page["traces"]]
+        cursor = page["next_cursor"]
+        if len(paged) > len(expected):
+            break
+
+    if paged != expected:
+        print(f"✗ Pages gave {len(paged)} traces ({len(set(paged))} distinct); expected {len(expected)} in order")
+        return False
+    print(f"✓ {len(expected)} traces in {-(-len(expected) // 5)} pages, none repeated after a concurrent store")
+    return True
+
+
+async def test_export_import_round_trip(project_dir: str) -> bool:
+    """Export, import into an empty store reusing embeddings, then import again."""
+    print("\nTesting export and import round trip...")
+    target = str(Path(project_dir) / "imported")
+    os.makedirs(target)
+    exported = json.loads(await server.context_export_traces(path="traces.ndjson", project_dir=project_dir))
+    path = exported["path"]
+
+    first = json.loads(await server.context_import_traces(path=path, batch_size=7, project_dir=target))
+    again = json.loads(await server.context_import_traces(path=path, batch_size=7, project_dir=target))
+    count = exported["exported"]
+    if (first["imported"], first["reused_embeddings"], first["embedded"]) != (count, count, 0):
+        print(f"✗ First import: {first}, expected {count} imported with reused embeddings")
+        return False
+    if (again["imported"], again["skipped_existing"]) != (0, count):
+        print(f"✗ Rerun was not idempotent: {again}")
+        return False
+
+    source = await server.get_collection(project_dir)
+    copy = await server.get_collection(target)
+    original = source.get(include=["documents", "metadatas", "embeddings"])
+    restored = copy.get(ids=original["ids"], include=["documents", "metadatas", "embeddings"])
+    by_id = {trace_id: i for i, trace_id in enumerate(restored["ids"])}
+    for i, trace_id in enumerate(original["ids"]):
+        j = by_id.get(trace_id)
+        if j is None or restored["documents"][j] != original["documents"][i] \
+                or restored["metadatas"][j] != original["metadatas"][i]:
+            print(f"✗ Trace {trace_id} did not survive the round trip")
+            return False
+        # Exports carry float16 vectors
+        if float(np.max(np.abs(np.asarray(restored["embeddings"][j]) - original["embeddings"][i]))) > 1e-3:
+            print(f"✗ Embedding of {trace_id} changed by more than float16 rounding")
+            return False
+    print(f"✓ {count} traces restored with reused embeddings; rerun skipped all {again['skipped_existing']}")
+    return True
+
+
+async def test_dedupe(project_dir: str) -> bool:
+    """Rewordings merge on store; context_dedupe_traces previews, then merges."""
+    print("\nTesting near-duplicate merging...")
+    target = str(Path(project_dir) / "dedupe")
+    os.makedirs(target)
+
+    async def store(decision: str, **kwargs) -> dict:
+        return json.loads(await server.context_store_trace(decision=decision, project_dir=target, **kwargs))
+
+    first = await store("Chose FastAPI for its async support", category="framework")
+    merged = await store("Chose FastAPI, for its async support!", category="framework", dedupe=True)
+    other = await store("Chose FastAPI for its async support", category="api", dedupe=True)
+    if not merged.get("merged") or merged["trace_id"] != first["trace_id"] or merged["occurrences"] != 2:
+        print(f"✗ Rewording was not merged on store: {merged}")
+        return False
+    if other.get("merged"):
+        print("✗ A trace in another category was merged")
+        return False
+
+    older = await store("Pinned the HTTP client pool size to 20", category="api")
+    await store("Pinned the HTTP client pool size to 20.", category="api", outcome="success", dedupe=False)
+    collection = await server.get_collection(target)
+    before = collection.count()
+    preview = json.loads(await server.context_dedupe_traces(dry_run=True, project_dir=target))
+    if (preview["groups"], preview["duplicates"]) != (1, 1) or collection.count() != before:
+        print(f"✗ Dry run should report one group and change nothing: {preview}")
+        return False
+    if preview["examples"][0]["keep"] != older["trace_id"]:
+        print("✗ Dry run would not keep the oldest trace")
+        return False
+
+    report = json.loads(await server.context_dedupe_traces(project_dir=target))
+    kept = collection.get(ids=[older["trace_id"]])["metadatas"][0]
+    index = await server.get_trace_index(target)
+    if report["remaining"] != before - 1 or index.count() != before - 1:
+        print(f"✗ Expected {before - 1} traces after merging, got {report['remaining']} (index {index.count()})")
+        return False
+    if kept.get("occurrences") != 2 or kept["outcome"] != "success":
+        print(f"✗ Kept trace did not absorb the duplicate: {kept}")
+        return False
+    print(f"✓ Merged on store and offline; dry run left all {before} traces in place")
+    return True
+
+
+async def test_query_cache_invalidation(project_dir: str) -> bool:
+    """Repeated queries hit the cache until a store or outcome update changes the answer."""
+    print("\nTesting query cache invalidation...")
+    target = str(Path(project_dir) / "cached")
+    os.makedirs(target)
+    await populate(target, 6)
+    cache = server.get_query_cache(target)
+
+    async def query(**kwargs) -> list:
+        response = await server.context_query_traces(
+            query="kafka consumer lag", limit=3, response_format="json", project_dir=target, **kwargs
+        )
+        return [result["id"] for result in json.loads(response)["results"]]
+
+    first = await query()
+    hits = cache.hits
+    if await query() != first or cache.hits != hits + 1:
+        print("✗ Repeating a query against an unchanged store missed the cache")
+        return False
+
+    stored = json.loads(await server.context_store_trace(
+        decision="Alerted on kafka consumer lag per partition", category="api", project_dir=target
+    ))["trace_id"]
+    after_store = await query()
+    if after_store[0] != stored:
+        print(f"✗ Query after a store served stale results: {after_store}")
+        return False
+
+    await query(outcome="success")
+    await server.context_update_outcome(trace_id=stored, outcome="success", project_dir=target)
+    if stored not in await query(outcome="success"):
+        print("✗ Outcome filter served stale results after an update")
+        return False
+
+    # Another process's write: a second handle on the index file, bypassing this server
+    await query()
+    misses = cache.misses
+    other = TraceIndex(index_path(target))
+    other.update_outcomes({stored: "failure"})
+    other.close()
+    await query()
+    if cache.misses != misses + 1:
+        print("✗ A write through another index handle did not invalidate the cache")
+        return False
+    print(f"✓ Cache hit on repeat; stores and outcome updates, here or through another handle, invalidated it")
+    return True
+
+
+async def test_combined_filters(project_dir: str) -> bool:
+    """Category and outcome together filter one store and a federated search."""
+    print("\nTesting category and outcome filters together...")
+    single = json.loads(await server.context_query_traces(
+        query="approach for service", limit=10, category="api", outcome="failure",
+        response_format="json", project_dir=project_dir
+    ))["results"]
+    federated = json.loads(await server.context_query_all_projects(
+        query="approach for service", limit=10, category="api", outcome="failure", response_format="json",
+        project_dirs=[project_dir, str(Path(project_dir) / "imported")], project_dir=project_dir
+    ))
+    statuses = [store["status"] for store in federated["stores"]]
+    results = single + federated["results"]
+    if statuses != ["ok", "ok"] or not single or not federated["results"]:
+        print(f"✗ Filtered searches failed: {len(single)} local results, stores {statuses}")
+        return False
+    if any((result["category"], result["outcome"]) != ("api", "failure") for result in results):
+        print("✗ A result does not match both filters")
+        return False
+    print(f"✓ {len(single)} local and {len(federated['results'])} federated results match both filters")
+    return True
+
+
+async def main():
+    """Run all tests."""
+    print("=" * 50)
+    print("Context Graph MCP Server - Tool Tests")
+    print("=" * 50)
+
+    results = [await test_budget_helpers()]
+    with tempfile.TemporaryDirectory() as project_dir:
+        await populate(project_dir)
+        try:
+            results.append(await test_query_pages(project_dir))
+            results.append(await test_cursor_rejected_for_other_args(project_dir))
+            results.append(await test_oversized_result_truncated(project_dir))
+            results.append(await test_lexical_ranking(project_dir))
+            results.append(await test_list_keyset_pages(project_dir))
+            results.append(await test_export_import_round_trip(project_dir))
+            results.append(await test_combined_filters(project_dir))
+            results.append(await test_dedupe(project_dir))
+            results.append(await test_query_cache_invalidation(project_dir))
+        finally:
+            await teardown()
+
+    print("\n" + "=" * 50)
+    passed = sum(results)
+    total = len(results)
+    print(f"Results: {passed}/{total} tests passed")
+    print("=" * 50)
+    return passed == total
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    sys.exit(0 if success else 1)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Write-behind crash and multi-process tests for context-graph MCP server.
+Runs server processes that die mid-commit and checks that the next start
+replays their log exactly once, that a second process leaves a live
+owner's log alone, and that traces the store rejects for good are
+dead-lettered instead of blocking the queue.
+Uses the local embedding provider; no API key or network required.
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+os.environ["CONTEXT_GRAPH_EMBEDDING_PROVIDER"] = "local"
+
+import server
+from trace_wal import wal_path
+
+# Stores traces with write-behind in a child process, then dies or waits.
+#   hang:  the committer never commits; exit as soon as the traces are logged
+#   crash: the traces reach the store, then exit before the commit line is written
+#   hold:  the committer never commits; stay alive (owning the log) until killed
+CHILD = r"""
+import asyncio, json, os, sys
+sys.path.insert(0, sys.argv[1])
+import server
+from trace_wal import TraceWAL
+
+project_dir, mode, count = sys.argv[2], sys.argv[3], int(sys.argv[4])
+
+async def never(*args):
+    await asyncio.Event().wait()
+
+if mode in ("hang", "hold"):
+    server.commit_queued_traces = never
+else:
+    TraceWAL.commit = lambda self, ids: os._exit(0)
+
+async def main():
+    ids = []
+    for i in range(count):
+        result = json.loads(await server.context_store_trace(
+            decision=f"{mode} decision {i} about queue replay", category="testing",
+            write_behind=True, project_dir=project_dir
+        ))
+        assert result.get("queued"), result
+        ids.append(result["trace_id"])
+    print(json.dumps(ids), flush=True)
+    if mode == "crash":
+        await asyncio.sleep(30)
+    elif mode == "hold":
+        await asyncio.Event().wait()
+    os._exit(0)
+
+asyncio.run(main())
+"""
+
+
+def start_child(project_dir: str, mode: str, count: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-c", CHILD, str(Path(__file__).parent), project_dir, mode, str(count)],
+        stdout=subprocess.PIPE, text=True
+    )
+
+
+def run_child(project_dir: str, mode: str, count: int) -> list:
+    """Run a child to its (abrupt) exit; returns the trace IDs it was given."""
+    child = start_child(project_dir, mode, count)
+    out, _ = child.communicate(timeout=60)
+    return json.loads(out.splitlines()[0])
+
+
+async def teardown() -> None:
+    await server.close_write_behind_queues()
+    server.close_chroma_stores()
+    server.close_trace_indexes()
+    server.close_embedding_caches()
+
+
+async def test_replay_exactly_once() -> bool:
+    """Traces logged before a crash are stored once on restart, committed or not."""
+    print("\nTesting replay after crashes...")
+    with tempfile.TemporaryDirectory() as project_dir:
+        try:
+            stored = run_child(project_dir, "crash", 3)
+            logged = run_child(project_dir, "hang", 4)
+
+            queue = await server.get_write_behind_queue(project_dir, create=False)
+            if queue is None or queue.replayed != len(stored) + len(logged):
+                print(f"✗ Expected {len(stored) + len(logged)} traces replayed, got {queue and queue.replayed}")
+                return False
+            if not await queue.settle(30):
+                print(f"✗ Replayed traces did not reach the store: {queue.stats()}")
+                return False
+
+            collection = await server.get_collection(project_dir)
+            ids = collection.get(include=[])["ids"]
+            if sorted(ids) != sorted(stored + logged):
+                print(f"✗ Store holds {len(ids)} traces, expected each of {len(stored + logged)} once")
+                return False
+            if wal_path(project_dir).stat().st_size != 0:
+                print("✗ Log not truncated once everything was committed")
+                return False
+            print(f"✓ {len(stored)} traces stored before the crash kept once, {len(logged)} logged ones replayed")
+            return True
+        finally:
+            await teardown()
+
+
+async def test_second_process_leaves_log_alone() -> bool:
+    """A live owner's queue is not replayed elsewhere; other processes store synchronously."""
+    print("\nTesting two processes on one project...")
+    with tempfile.TemporaryDirectory() as project_dir:
+        owner = start_child(project_dir, "hold", 2)
+        try:
+            queued = json.loads(owner.stdout.readline())
+            if await server.get_write_behind_queue(project_dir, create=False) is not None:
+                print("✗ Opened a log another process owns")
+                return False
+
+            result = json.loads(await server.context_store_trace(
+                decision="Stored while another server owns the log", category="testing",
+                write_behind=True, project_dir=project_dir
+            ))
+            collection = await server.get_collection(project_dir)
+            if result.get("queued") or collection.get(ids=[result["trace_id"]], include=[])["ids"] != [result["trace_id"]]:
+                print(f"✗ Expected a synchronous store, got {result}")
+                return False
+
+            owner.kill()
+            owner.wait()
+            queue = await server.get_write_behind_queue(project_dir, create=False)
+            if queue is None or not await queue.settle(30):
+                print("✗ The dead owner's traces were not replayed")
+                return False
+            ids = collection.get(include=[])["ids"]
+            if sorted(ids) != sorted(queued + [result["trace_id"]]):
+                print(f"✗ Store holds {ids}")
+                return False
+            print(f"✓ Stored synchronously beside a live owner; its {len(queued)} traces replayed once it was killed")
+            return True
+        finally:
+            if owner.poll() is None:
+                owner.kill()
+                owner.wait()
+            await teardown()
+
+
+async def test_permanent_failures_dead_lettered() -> bool:
+    """Traces the provider always rejects are set aside; the rest of the queue still commits."""
+    print("\nTesting permanent commit failures...")
+    with tempfile.TemporaryDirectory() as project_dir:
+        provider = server.get_embedding_provider(project_dir)
+        embed = provider.embed
+        request = httpx.Request("POST", server.VOYAGE_API_URL)
+        outages = []
+
+        async def rejecting(texts, input_type):
+            if outages:
+                raise outages.pop()
+            if any("rejected" in text for text in texts):
+                raise httpx.HTTPStatusError("400 Bad Request", request=request, response=httpx.Response(400, request=request))
+            return await embed(texts, input_type)
+
+        async def failing(texts, input_type):
+            raise ValueError("dimension mismatch")
+
+        async def store(decision: str) -> str:
+            result = json.loads(await server.context_store_trace(
+                decision=decision, category="testing", write_behind=True, project_dir=project_dir
+            ))
+            assert result.get("queued"), result
+            return result["trace_id"]
+
+        try:
+            provider.embed = rejecting
+            good = [await store(f"Accepted decision {i} about dead letters") for i in range(3)]
+            bad = await store("A rejected decision the API refuses every time")
+            queue = await server.get_write_behind_queue(project_dir)
+            if not await queue.settle(30):
+                print(f"✗ A rejected trace stalled the queue: {queue.stats()}")
+                return False
+
+            collection = await server.get_collection(project_dir)
+            if sorted(collection.get(include=[])["ids"]) != sorted(good):
+                print("✗ Expected the accepted traces in the store and the rejected one left out")
+                return False
+            dead = [json.loads(line) for line in queue.wal.dead_letter_path.read_text().splitlines()]
+            if [entry["id"] for entry in dead] != [bad] or "HTTPStatusError" not in dead[0]["error"]:
+                print(f"✗ Dead-letter file holds {dead}")
+                return False
+            if queue.dead_lettered != 1 or bad not in (queue.last_error or ""):
+                print(f"✗ Dead letter not reported: {queue.stats()}")
+                return False
+
+            provider.embed = failing
+            await store("Stored while the provider always fails")
+            await store("Also stored while the provider always fails")
+            if not await queue.settle(30) or queue.dead_lettered != 3:
+                print(f"✗ Expected every trace dead-lettered by a failing provider: {queue.stats()}")
+                return False
+            if wal_path(project_dir).stat().st_size != 0:
+                print("✗ Log not truncated once the failed traces were set aside")
+                return False
+
+            provider.embed = rejecting
+            outages.append(httpx.ConnectError("connection refused", request=request))
+            later = await store("Stored after a brief outage")
+            if not await queue.settle(30) or queue.failures != 1 or queue.dead_lettered != 3:
+                print(f"✗ A transient error should be retried, not dead-lettered: {queue.stats()}")
+                return False
+            if collection.get(ids=[later], include=[])["ids"] != [later]:
+                print("✗ Trace stored after the outage did not reach the store")
+                return False
+            print(f"✓ {queue.dead_lettered} rejected traces dead-lettered, {len(good) + 1} stored, one outage retried")
+            return True
+        finally:
+            del provider.embed
+            await teardown()
+
+
+async def main():
+    """Run all tests."""
+    print("=" * 50)
+    print("Context Graph MCP Server - Write-Behind Tests")
+    print("=" * 50)
+
+    results = [
+        await test_replay_exactly_once(),
+        await test_second_process_leaves_log_alone(),
+        await test_permanent_failures_dead_lettered()
+    ]
+
+    print("\n" + "=" * 50)
+    passed = sum(results)
+    total = len(results)
+    print(f"Results: {passed}/{total} tests passed")
+    print("=" * 50)
+    return passed == total
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    sys.exit(0 if success else 1)
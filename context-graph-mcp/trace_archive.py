@@ -0,0 +1,233 @@
+"""
+Compressed, columnar archive of traces removed from the hot store.
+
+Compaction moves old traces out of ChromaDB into immutable segments under
+.claude/archive/, compressed .npz files of up to one compaction batch
+each. Columns:
+
+    ids, timestamps, categories, outcomes     fixed-width byte strings
+    documents, metadata                       UTF-8 / JSON blobs + row offsets
+    vectors, vector_scales, has_vector        optional quantized embeddings
+    info                                      JSON: precision, dim, embedding model
+
+Vectors are stored as int8 (one scale per row), float16 or not at all.
+Archived traces are searched by exact cosine similarity over whichever
+segments were built with the query's embedding model; segments are loaded
+on first use and scored in chunks, so the quantized matrix is never
+expanded to float32 all at once.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+ARCHIVE_DIRNAME = "archive"
+SEGMENT_VERSION = 1
+VECTOR_PRECISIONS = ("int8", "float16", "none")
+SCORE_CHUNK_ROWS = 8192
+
+
+def archive_path(project_dir: Optional[str] = None) -> Path:
+    """Archive directory, alongside .claude/chroma."""
+    base = Path(project_dir) / ".claude" if project_dir else Path(".claude")
+    return base / ARCHIVE_DIRNAME
+
+
+def _pack_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_string(blob: np.ndarray, offsets: np.ndarray, row: int) -> str:
+    return blob[offsets[row]:offsets[row + 1]].tobytes().decode("utf-8")
+
+
+def _quantize_rows(vectors: np.ndarray, precision: str) -> Tuple[np.ndarray, np.ndarray]:
+    if precision == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    peaks = np.abs(vectors).max(axis=1)
+    scales = np.where(peaks > 0, peaks / 127, 1.0).astype(np.float32)
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+
+class Segment:
+    """One loaded archive file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with np.load(path) as data:
+            self.columns = {name: data[name] for name in data.files}
+        self.info = json.loads(self.columns["info"].tobytes().decode("utf-8"))
+        self.ids = [trace_id.decode() for trace_id in self.columns["ids"]]
+        self.rows = {trace_id: row for row, trace_id in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def record(self, row: int) -> Dict[str, Any]:
+        c = self.columns
+        return {
+            "id": self.ids[row],
+            "document": _unpack_string(c["documents"], c["document_offsets"], row),
+            "metadata": json.loads(_unpack_string(c["metadata"], c["metadata_offsets"], row)),
+        }
+
+    def scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the query with the given rows."""
+        vectors, scales = self.columns["vectors"], self.columns["vector_scales"]
+        out = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORE_CHUNK_ROWS):
+            chunk = rows[start:start + SCORE_CHUNK_ROWS]
+            matrix = vectors[chunk].astype(np.float32) * scales[chunk, None]
+            norms = np.linalg.norm(matrix, axis=1)
+            out[start:start + len(chunk)] = (matrix @ query) / np.where(norms > 0, norms, 1.0)
+        return out
+
+
+class TraceArchive:
+    """The set of archive segments for one project."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._segments: Optional[List[Segment]] = None
+
+    def _loaded(self) -> List[Segment]:
+        if self._segments is None:
+            paths = sorted(self.directory.glob("segment-*.npz")) if self.directory.is_dir() else []
+            self._segments = [Segment(path) for path in paths]
+        return self._segments
+
+    def write_segment(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        vectors: List[Optional[List[float]]],
+        precision: str,
+        provider: Dict[str, Any]
+    ) -> Path:
+        """Write traces as a new segment (atomically) and return its path."""
+        if precision not in VECTOR_PRECISIONS:
+            raise ValueError(f"Unknown vector precision '{precision}'. Use one of: {', '.join(VECTOR_PRECISIONS)}")
+        dim = provider["embedding_dim"]
+        documents_blob, document_offsets = _pack_strings(documents)
+        metadata_blob, metadata_offsets = _pack_strings([json.dumps(m, ensure_ascii=False) for m in metadatas])
+        columns = {
+            "ids": np.array([trace_id.encode() for trace_id in ids], dtype="S64"),
+            "timestamps": np.array([(m.get("timestamp") or "").encode() for m in metadatas]),
+            "categories": np.array([(m.get("category") or "general").encode() for m in metadatas]),
+            "outcomes": np.array([(m.get("outcome") or "pending").encode() for m in metadatas]),
+            "documents": documents_blob,
+            "document_offsets": document_offsets,
+            "metadata": metadata_blob,
+            "metadata_offsets": metadata_offsets,
+        }
+
+        has_vector = np.array([
+            precision != "none" and vector is not None and len(vector) == dim for vector in vectors
+        ], dtype=bool)
+        matrix = np.zeros((len(ids), dim if has_vector.any() else 0), dtype=np.float32)
+        for row in np.flatnonzero(has_vector):
+            matrix[row] = vectors[row]
+        if has_vector.any():
+            columns["vectors"], columns["vector_scales"] = _quantize_rows(matrix, precision)
+        else:
+            columns["vectors"] = np.zeros((len(ids), 0), dtype=np.int8)
+            columns["vector_scales"] = np.ones(len(ids), dtype=np.float32)
+        columns["has_vector"] = has_vector
+        columns["info"] = np.frombuffer(json.dumps({
+            "version": SEGMENT_VERSION,
+            "precision": precision,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **provider,
+        }).encode(), dtype=np.uint8)
+
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            name = f"segment-{time.strftime('%Y%m%dT%H%M%S')}-{time.time_ns() % 1_000_000:06d}"
+            tmp = self.directory / f"{name}.npz.tmp"
+            with open(tmp, "wb") as out:
+                np.savez_compressed(out, **columns)
+            path = self.directory / f"{name}.npz"
+            os.replace(tmp, path)
+            if self._segments is not None:
+                self._segments.append(Segment(path))
+        return path
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """An archived trace by ID (newest segment wins), or None."""
+        with self._lock:
+            for segment in reversed(self._loaded()):
+                row = segment.rows.get(trace_id)
+                if row is not None:
+                    return segment.record(row)
+        return None
+
+    def search(
+        self,
+        query: List[float],
+        limit: int,
+        provider: Dict[str, Any],
+        category: Optional[str] = None,
+        outcome: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Top archived traces by cosine similarity, as hits like vector_search's."""
+        vector = np.asarray(query, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        candidates: List[Tuple[float, Segment, int]] = []
+        with self._lock:
+            for segment in self._loaded():
+                info = segment.info
+                if (info.get("embedding_model"), info.get("embedding_dim")) != (
+                    provider.get("embedding_model"), provider.get("embedding_dim")
+                ):
+                    continue
+                mask = segment.columns["has_vector"].copy()
+                if category:
+                    mask &= segment.columns["categories"] == category.encode()
+                if outcome:
+                    mask &= segment.columns["outcomes"] == outcome.encode()
+                rows = np.flatnonzero(mask)
+                if len(rows) == 0:
+                    continue
+                scores = segment.scores(vector, rows)
+                k = min(limit, len(rows))
+                top = np.argpartition(-scores, k - 1)[:k]
+                candidates.extend((float(scores[i]), segment, int(rows[i])) for i in top)
+
+            candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            hits, seen = [], set()
+            for similarity, segment, row in candidates:
+                record = segment.record(row)
+                if record["id"] in seen:
+                    continue
+                seen.add(record["id"])
+                hits.append({**record, "distance": 1.0 - similarity, "similarity": similarity, "archived": True})
+                if len(hits) >= limit:
+                    break
+        return hits
+
+    def stats(self) -> Dict[str, Any]:
+        """Segment and trace counts and size on disk (without loading segments)."""
+        paths = sorted(self.directory.glob("segment-*.npz")) if self.directory.is_dir() else []
+        traces = 0
+        for path in paths:
+            with np.load(path) as data:
+                traces += len(data["ids"])
+        return {
+            "segments": len(paths),
+            "traces": traces,
+            "disk_bytes": sum(path.stat().st_size for path in paths),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._segments = None
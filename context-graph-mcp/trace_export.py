@@ -0,0 +1,103 @@
+"""
+NDJSON export format for trace stores.
+
+An export starts with one header line, followed by one line per trace:
+
+    {"format": "context-graph-traces", "version": 1, "embedding_provider": "voyage",
+     "embedding_model": "voyage-3", "embedding_dim": 1024, "embedding_encoding": "base64-float16"}
+    {"id": "trace_...", "document": "...", "metadata": {...}, "embedding": "<base64>"}
+
+Embeddings are optional. When present they are little-endian float16,
+base64 encoded (about 2.7 KB per 1024-dim vector), which is well within
+the precision cosine ranking needs. The header records which provider
+produced them so an import can tell whether they are reusable.
+"""
+
+import base64
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+FORMAT_NAME = "context-graph-traces"
+FORMAT_VERSION = 1
+EMBEDDING_ENCODING = "base64-float16"
+
+
+def encode_embedding(vector: Iterable[float]) -> str:
+    """Compact text form of a vector (base64 float16)."""
+    return base64.b64encode(np.asarray(vector, dtype="<f2").tobytes()).decode("ascii")
+
+
+def decode_embedding(text: str, dim: int) -> List[float]:
+    """Inverse of encode_embedding; checks the dimension."""
+    vector = np.frombuffer(base64.b64decode(text), dtype="<f2")
+    if len(vector) != dim:
+        raise ValueError(f"Embedding has {len(vector)} dimensions, header says {dim}")
+    return vector.astype(np.float32).tolist()
+
+
+def export_header(provider: Dict[str, Any], include_embeddings: bool) -> Dict[str, Any]:
+    """Header line for an export made with the given provider description."""
+    return {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        **provider,
+        "embedding_encoding": EMBEDDING_ENCODING if include_embeddings else None,
+    }
+
+
+def trace_line(
+    trace_id: str,
+    document: str,
+    metadata: Dict[str, Any],
+    embedding: Optional[Iterable[float]] = None
+) -> str:
+    """One NDJSON line for a trace (newline included)."""
+    record: Dict[str, Any] = {"id": trace_id, "document": document, "metadata": metadata}
+    if embedding is not None:
+        record["embedding"] = encode_embedding(embedding)
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def read_header(line: str) -> Dict[str, Any]:
+    """Parse and check the header line of an export."""
+    try:
+        header = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Line 1: not a JSON header ({e.msg})")
+    if not isinstance(header, dict) or header.get("format") != FORMAT_NAME:
+        raise ValueError(f"Line 1: not a {FORMAT_NAME} export")
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported export version {header.get('version')} (expected {FORMAT_VERSION})")
+    encoding = header.get("embedding_encoding")
+    if encoding not in (None, EMBEDDING_ENCODING):
+        raise ValueError(f"Unsupported embedding encoding '{encoding}'")
+    return header
+
+
+def iter_record_batches(lines: Iterable[str], batch_size: int, first_line: int = 2) -> Iterator[List[Dict[str, Any]]]:
+    """Parse trace lines into lists of at most batch_size records.
+
+    Blank lines are skipped; a malformed line raises ValueError naming its
+    line number (counted from first_line).
+    """
+    batch: List[Dict[str, Any]] = []
+    for number, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number}: invalid JSON ({e.msg})")
+        if not isinstance(record, dict) or not record.get("id") or not isinstance(record.get("document"), str):
+            raise ValueError(f"Line {number}: a trace needs an 'id' and a 'document'")
+        if not isinstance(record.get("metadata", {}), dict):
+            raise ValueError(f"Line {number}: 'metadata' must be an object")
+        record["line"] = number
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
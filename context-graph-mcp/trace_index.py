@@ -0,0 +1,396 @@
+"""
+Sidecar secondary index for trace listing.
+
+A SQLite file next to the ChromaDB directory (.claude/trace-index.sqlite3)
+mirrors each trace's listing fields (timestamp, category, outcome,
+feature_id, state, decision). Listing runs against indexes on those
+columns with keyset (cursor) pagination, so fetching any page costs
+O(page size) instead of loading the whole collection.
+
+ChromaDB stays the source of truth: the server writes both under the same
+per-collection write lock, and rebuilds the index from Chroma whenever the
+two disagree on the trace count (e.g. after CLI scripts wrote directly to
+Chroma).
+
+Per-(category, outcome) trace counts are kept in a materialized aggregate
+table maintained by triggers, so they change in the same transaction as
+the rows they count and context_list_categories answers in constant time.
+verify() / repair() detect and fix drift.
+
+Trace documents are also indexed in an FTS5 table (porter-stemmed, BM25
+ranked), kept in step with the traces table by the same kind of triggers,
+for keyword search without an embedding call.
+
+Every write transaction also increments a write_seq counter in the meta
+table. The file is shared by every server and CLI process on the project,
+so the counter tells any of them that the store changed, including by a
+write that left the trace count alone (an outcome update, a merge).
+"""
+
+import base64
+import json
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+INDEX_FILENAME = "trace-index.sqlite3"
+
+LIST_COLUMNS = ("id", "timestamp", "category", "outcome", "feature_id", "state", "decision")
+
+
+def index_path(project_dir: Optional[str] = None) -> Path:
+    """Index file location, alongside .claude/chroma."""
+    base = Path(project_dir) / ".claude" if project_dir else Path(".claude")
+    return base / INDEX_FILENAME
+
+
+def encode_cursor(timestamp: str, trace_id: str) -> str:
+    """Opaque continuation cursor for the position after a listed trace."""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, trace_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor; raises ValueError on malformed input."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, trace_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(timestamp), str(trace_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+
+
+def match_expression(query: str) -> Optional[str]:
+    """FTS5 MATCH expression ranking traces that contain any query term."""
+    terms = re.findall(r"\w+", query.lower())
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+
+def _row(trace_id: str, document: str, metadata: Dict[str, Any]) -> tuple:
+    return (
+        trace_id,
+        metadata.get("timestamp") or "",
+        metadata.get("category") or "general",
+        metadata.get("outcome") or "pending",
+        metadata.get("feature_id") or "",
+        metadata.get("state") or "",
+        document or "",
+    )
+
+
+class TraceIndex:
+    """SQLite index of trace metadata supporting filtered keyset listing."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # INSERT OR REPLACE must fire the delete trigger for the replaced row
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+        tables = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS traces (
+                id TEXT PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                category TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                feature_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                decision TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_traces_time ON traces(timestamp, id);
+            CREATE INDEX IF NOT EXISTS idx_traces_category ON traces(category, timestamp, id);
+            CREATE INDEX IF NOT EXISTS idx_traces_outcome ON traces(outcome, timestamp, id);
+            CREATE INDEX IF NOT EXISTS idx_traces_category_outcome ON traces(category, outcome, timestamp, id);
+            CREATE INDEX IF NOT EXISTS idx_traces_feature ON traces(feature_id, timestamp, id);
+
+            CREATE TABLE IF NOT EXISTS category_counts (
+                category TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (category, outcome)
+            ) WITHOUT ROWID;
+
+            CREATE TRIGGER IF NOT EXISTS trg_traces_insert AFTER INSERT ON traces BEGIN
+                INSERT INTO category_counts (category, outcome, count) VALUES (NEW.category, NEW.outcome, 1)
+                ON CONFLICT(category, outcome) DO UPDATE SET count = count + 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_traces_delete AFTER DELETE ON traces BEGIN
+                UPDATE category_counts SET count = count - 1
+                WHERE category = OLD.category AND outcome = OLD.outcome;
+                DELETE FROM category_counts
+                WHERE category = OLD.category AND outcome = OLD.outcome AND count <= 0;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_traces_update AFTER UPDATE OF category, outcome ON traces
+            WHEN OLD.category IS NOT NEW.category OR OLD.outcome IS NOT NEW.outcome BEGIN
+                UPDATE category_counts SET count = count - 1
+                WHERE category = OLD.category AND outcome = OLD.outcome;
+                DELETE FROM category_counts
+                WHERE category = OLD.category AND outcome = OLD.outcome AND count <= 0;
+                INSERT INTO category_counts (category, outcome, count) VALUES (NEW.category, NEW.outcome, 1)
+                ON CONFLICT(category, outcome) DO UPDATE SET count = count + 1;
+            END;
+
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('write_seq', 0);
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS traces_fts USING fts5(
+                decision, content='traces', content_rowid='rowid', tokenize='porter unicode61'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS trg_traces_fts_insert AFTER INSERT ON traces BEGIN
+                INSERT INTO traces_fts (rowid, decision) VALUES (NEW.rowid, NEW.decision);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_traces_fts_delete AFTER DELETE ON traces BEGIN
+                INSERT INTO traces_fts (traces_fts, rowid, decision) VALUES ('delete', OLD.rowid, OLD.decision);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_traces_fts_update AFTER UPDATE OF decision ON traces BEGIN
+                INSERT INTO traces_fts (traces_fts, rowid, decision) VALUES ('delete', OLD.rowid, OLD.decision);
+                INSERT INTO traces_fts (rowid, decision) VALUES (NEW.rowid, NEW.decision);
+            END;
+            """
+        )
+        # Index files created before the aggregate / full-text table existed
+        if "category_counts" not in tables:
+            self._recount()
+        if "traces_fts" not in tables:
+            self._conn.execute("INSERT INTO traces_fts (traces_fts) VALUES ('rebuild')")
+
+        # write_seq is read on every cached query; a second connection reads
+        # the last committed value (WAL) without waiting for a long rebuild
+        self._seq_lock = threading.Lock()
+        self._seq_conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+
+    # ── writes ─────────────────────────────────────────────────
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN ... COMMIT with write_seq bumped, rolled back if the body raises."""
+        self._conn.execute("BEGIN")
+        try:
+            yield
+            self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'write_seq'")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def touch(self) -> None:
+        """Bump write_seq for a store write that changes nothing indexed here."""
+        with self._lock:
+            with self._transaction():
+                pass
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Insert (or replace) traces."""
+        rows = [_row(i, d, m) for i, d, m in zip(ids, documents, metadatas)]
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO traces ({', '.join(LIST_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+
+    def update_outcomes(self, outcomes: Dict[str, str]) -> None:
+        """Set the outcome of indexed traces."""
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany(
+                    "UPDATE traces SET outcome = ? WHERE id = ?",
+                    [(outcome, trace_id) for trace_id, outcome in outcomes.items()]
+                )
+
+    def delete(self, ids: List[str]) -> None:
+        """Remove traces from the index."""
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany("DELETE FROM traces WHERE id = ?", [(i,) for i in ids])
+
+    def rebuild(self, batches: Iterable[Tuple[List[str], List[str], List[Dict[str, Any]]]]) -> int:
+        """Replace the index contents with (ids, documents, metadatas) batches."""
+        count = 0
+        with self._lock:
+            with self._transaction():
+                self._conn.execute("DELETE FROM traces")
+                self._conn.execute("DELETE FROM category_counts")
+                for ids, documents, metadatas in batches:
+                    self._conn.executemany(
+                        f"INSERT OR REPLACE INTO traces ({', '.join(LIST_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [_row(i, d, m) for i, d, m in zip(ids, documents, metadatas)]
+                    )
+                    count += len(ids)
+        return count
+
+    def _recount(self) -> None:
+        with self._transaction():
+            self._conn.execute("DELETE FROM category_counts")
+            self._conn.execute(
+                "INSERT INTO category_counts (category, outcome, count) "
+                "SELECT category, outcome, COUNT(*) FROM traces GROUP BY category, outcome"
+            )
+
+    def write_seq(self) -> int:
+        """Number of write transactions committed to the index by any process."""
+        with self._seq_lock:
+            return self._seq_conn.execute("SELECT value FROM meta WHERE key = 'write_seq'").fetchone()[0]
+
+    # ── aggregates ─────────────────────────────────────────────
+
+    def category_counts(self) -> Dict[str, Dict[str, int]]:
+        """{category: {outcome: count}} from the materialized aggregate."""
+        with self._lock:
+            rows = self._conn.execute("SELECT category, outcome, count FROM category_counts").fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for category, outcome, count in rows:
+            counts.setdefault(category, {})[outcome] = count
+        return counts
+
+    def scan_category_counts(self) -> Dict[str, Dict[str, int]]:
+        """{category: {outcome: count}} recomputed from the indexed rows."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT category, outcome, COUNT(*) FROM traces GROUP BY category, outcome"
+            ).fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for category, outcome, count in rows:
+            counts.setdefault(category, {})[outcome] = count
+        return counts
+
+    def verify(self) -> Dict[str, Any]:
+        """Compare the aggregate with a full recount of the indexed rows."""
+        stored = self.category_counts()
+        actual = self.scan_category_counts()
+        drift = []
+        for category in sorted(set(stored) | set(actual)):
+            outcomes = set(stored.get(category, {})) | set(actual.get(category, {}))
+            for outcome in sorted(outcomes):
+                have = stored.get(category, {}).get(outcome, 0)
+                want = actual.get(category, {}).get(outcome, 0)
+                if have != want:
+                    drift.append({"category": category, "outcome": outcome, "stored": have, "actual": want})
+        return {"ok": not drift, "drift": drift}
+
+    def repair(self) -> None:
+        """Recompute the aggregate from the indexed rows."""
+        with self._lock:
+            self._recount()
+
+    # ── reads ──────────────────────────────────────────────────
+
+    @staticmethod
+    def _filters(category: Optional[str], outcome: Optional[str]) -> Tuple[List[str], List[Any]]:
+        clauses, params = [], []
+        if category:
+            clauses.append("category = ?")
+            params.append(category)
+        if outcome:
+            clauses.append("outcome = ?")
+            params.append(outcome)
+        return clauses, params
+
+    def count(self, category: Optional[str] = None, outcome: Optional[str] = None) -> int:
+        """Number of traces matching the filters (read from the aggregate)."""
+        clauses, params = self._filters(category, outcome)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return self._conn.execute(f"SELECT COALESCE(SUM(count), 0) FROM category_counts {where}", params).fetchone()[0]
+
+    def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        outcome: Optional[str] = None,
+        limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """BM25-ranked keyword search over trace documents.
+
+        Each result carries a "score" (negated FTS5 bm25, higher is better).
+        """
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        clauses, params = self._filters(category, outcome)
+        where = "".join(f" AND t.{clause}" for clause in clauses)
+        sql = (
+            f"SELECT {', '.join('t.' + column for column in LIST_COLUMNS)}, bm25(traces_fts) "
+            f"FROM traces_fts JOIN traces t ON t.rowid = traces_fts.rowid "
+            f"WHERE traces_fts MATCH ?{where} ORDER BY bm25(traces_fts) LIMIT ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, [expression] + params + [limit]).fetchall()
+        return [{**dict(zip(LIST_COLUMNS, row[:-1])), "score": -row[-1]} for row in rows]
+
+    def ids_before(self, timestamp: str, outcome: Optional[str] = None, limit: int = 10000) -> List[str]:
+        """Oldest trace IDs with a timestamp before the given one."""
+        clauses, params = self._filters(None, outcome)
+        clauses.append("timestamp < ?")
+        params.append(timestamp)
+        sql = f"SELECT id FROM traces WHERE {' AND '.join(clauses)} ORDER BY timestamp, id LIMIT ?"
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, params + [limit])]
+
+    def get_many(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Indexed rows for whichever IDs are present, keyed by ID."""
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(LIST_COLUMNS)} FROM traces WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = dict(zip(LIST_COLUMNS, row))
+        return found
+
+    def list_traces(
+        self,
+        category: Optional[str] = None,
+        outcome: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+        cursor: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Newest-first page of traces.
+
+        With a cursor, the page starts strictly after the cursor's position
+        (keyset pagination; offset is ignored). Without one, offset is
+        applied to the index scan.
+        """
+        clauses, params = self._filters(category, outcome)
+        if cursor:
+            timestamp, trace_id = decode_cursor(cursor)
+            clauses.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+            params.extend([timestamp, timestamp, trace_id])
+            offset = 0
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = (
+            f"SELECT {', '.join(LIST_COLUMNS)} FROM traces {where} "
+            f"ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, params + [limit, offset]).fetchall()
+        return [dict(zip(LIST_COLUMNS, row)) for row in rows]
+
+    def close(self) -> None:
+        with self._seq_lock:
+            self._seq_conn.close()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,206 @@
+"""
+Write-ahead log for traces stored with write-behind.
+
+A write-behind store appends the trace (ID, document and metadata) to
+.claude/trace-wal.ndjson and returns once the line is on disk. The server
+embeds queued traces in the background and writes each group to ChromaDB
+with one add; until then the log is the trace's only durable copy. Lines:
+
+    {"op": "add", "id": ..., "document": ..., "metadata": {...}}
+    {"op": "commit", "ids": [...]}
+
+Appends that arrive while an earlier one is being synced are written
+together under a single fsync (group commit). A commit line records traces
+that reached the store, and once none are outstanding the file is
+truncated. recover() returns the adds with no commit after a restart;
+trace IDs are fixed when a trace is accepted, so one that reached the
+store just before a crash, without its commit line, is recognised there
+and not stored twice.
+
+A trace the store rejects for good (a provider or dimension mismatch, a
+missing API key, a document the API refuses) would block the queue if
+retried forever. dead_letter() appends it with the error to
+trace-wal.ndjson.failed and syncs that before the trace's commit line, so
+it leaves the queue without being lost.
+
+Queued traces have no embedding yet, so searches match them by keyword
+(match_queued) until they are committed.
+
+One process at a time owns a project's log: TraceWAL takes an exclusive
+flock on trace-wal.ndjson.lock (a separate file, since recover() replaces
+the log itself) and holds it until close(). A second server for the same
+project gets WALLocked and stores synchronously; it neither replays nor
+truncates a live peer's log. The kernel drops the lock when the owner
+exits, however it exits, so the next process to open the log replays it.
+"""
+
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so run one server per project
+    fcntl = None
+
+WAL_FILENAME = "trace-wal.ndjson"
+DEAD_LETTER_SUFFIX = ".failed"
+
+
+class WALLocked(Exception):
+    """Another process owns the log."""
+
+
+def wal_path(project_dir: Optional[str] = None) -> Path:
+    """Log file location, alongside .claude/chroma."""
+    base = Path(project_dir) / ".claude" if project_dir else Path(".claude")
+    return base / WAL_FILENAME
+
+
+def _line(entry: Dict[str, Any]) -> bytes:
+    return (json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n").encode()
+
+
+def match_queued(
+    records: List[Dict[str, Any]],
+    query: str,
+    category: Optional[str] = None,
+    outcome: Optional[str] = None,
+    limit: int = 20
+) -> List[Tuple[float, Dict[str, Any]]]:
+    """Queued traces containing any query term, best first, with their scores.
+
+    A trace scores the share of distinct query terms it contains; ties keep
+    queue order. That is enough to rank the few traces waiting for their
+    embeddings.
+    """
+    terms = set(re.findall(r"\w+", query.lower()))
+    if not terms:
+        return []
+    scored = []
+    for record in records:
+        metadata = record["metadata"]
+        if category and metadata.get("category") != category:
+            continue
+        if outcome and metadata.get("outcome") != outcome:
+            continue
+        found = terms & set(re.findall(r"\w+", record["document"].lower()))
+        if found:
+            scored.append((len(found) / len(terms), record))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return scored[:limit]
+
+
+class TraceWAL:
+    """Append-only NDJSON log of traces accepted but not yet in the store.
+
+    Opening raises WALLocked while another process has the log open.
+    Methods block on disk I/O; call them off the event loop.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.outstanding = 0
+        self.appended = 0
+        self.syncs = 0
+        self.dead_lettered = 0
+        self.dead_letter_path = self.path.with_name(self.path.name + DEAD_LETTER_SUFFIX)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(self.path.with_name(self.path.name + ".lock"), "ab")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._lock_file.close()
+                raise WALLocked(f"{self.path} is in use by another process")
+        self._file = open(self.path, "ab")
+
+    def recover(self) -> List[Dict[str, Any]]:
+        """Uncommitted records in append order; the log is rewritten to hold only those.
+
+        A torn final line (a crash mid-append, never acknowledged) is dropped.
+        """
+        with self._lock:
+            records: Dict[str, Dict[str, Any]] = {}
+            with open(self.path, "rb") as f:
+                for raw in f:
+                    try:
+                        entry = json.loads(raw)
+                    except ValueError:
+                        continue
+                    if entry.get("op") == "add":
+                        records[entry["id"]] = {k: entry[k] for k in ("id", "document", "metadata")}
+                    elif entry.get("op") == "commit":
+                        for trace_id in entry["ids"]:
+                            records.pop(trace_id, None)
+
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                f.writelines(_line({"op": "add", **record}) for record in records.values())
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp, self.path)
+            self._file = open(self.path, "ab")
+            self.outstanding = len(records)
+            return list(records.values())
+
+    def append(self, records: List[Dict[str, Any]]) -> None:
+        """Write records ({"id", "document", "metadata"}) and sync them to disk."""
+        data = b"".join(_line({"op": "add", **record}) for record in records)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.outstanding += len(records)
+            self.appended += len(records)
+            self.syncs += 1
+
+    def commit(self, ids: List[str]) -> None:
+        """Mark traces as stored; truncates the log once none are outstanding.
+
+        Commit lines are not synced: losing one only means its traces are
+        found already stored on replay.
+        """
+        with self._lock:
+            self.outstanding -= len(ids)
+            if self.outstanding > 0:
+                self._file.write(_line({"op": "commit", "ids": ids}))
+                self._file.flush()
+            else:
+                self.outstanding = 0
+                self._file.truncate(0)
+                os.fsync(self._file.fileno())
+
+    def dead_letter(self, record: Dict[str, Any], error: str) -> None:
+        """Set a trace aside in the dead-letter file and mark it committed."""
+        entry = {**record, "error": error, "failed_at": datetime.now().isoformat()}
+        with self._lock:
+            with open(self.dead_letter_path, "ab") as f:
+                f.write(_line(entry))
+                f.flush()
+                os.fsync(f.fileno())
+            self.dead_lettered += 1
+        self.commit([record["id"]])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "path": str(self.path),
+                "outstanding": self.outstanding,
+                "appended": self.appended,
+                "dead_lettered": self.dead_lettered,
+                "fsyncs": self.syncs,
+                "bytes": os.fstat(self._file.fileno()).st_size
+            }
+
+    def close(self) -> None:
+        """Close the log and release it to other processes."""
+        with self._lock:
+            self._file.close()
+            self._lock_file.close()
@@ -31,6 +31,9 @@ for skill_dir in "$SOURCE_DIR"/*/; do
     rm -f "$TARGET_DIR/$skill_name/README.md"
 done
 
+# The context-graph scripts share the MCP server's embedding cache module
+cp "$(dirname "$SOURCE_DIR")/context-graph-mcp/embedding_cache.py" "$TARGET_DIR/context-graph/scripts/"
+
 # Don't copy root README.md
 rm -f "$TARGET_DIR/README.md"
 